@@ -0,0 +1,104 @@
+import numpy
+
+from . import timetagger
+
+class DeadTimeFilter:
+    def __init__(
+            self,
+            dead_time: int | dict[int, int]
+    ) -> None:
+        # dead time is in the same units as the backend's timetags
+        self.dead_time = numpy.zeros(256, dtype=numpy.int64)
+        if isinstance(dead_time, dict):
+            for channel, value in dead_time.items():
+                self.dead_time[channel] = value
+        else:
+            self.dead_time[:] = dead_time
+
+        self.reset()
+
+    def reset(self) -> None:
+        self._last_tag = numpy.full(256, numpy.iinfo(numpy.int64).min // 2, dtype=numpy.int64)
+        self.removed = numpy.zeros(256, dtype=numpy.int64)
+        self.last_removed = 0
+
+    @property
+    def total_removed(self) -> int:
+        return int(self.removed.sum())
+
+    def __call__(self, raw_data: timetagger.RawData) -> timetagger.RawData:
+        timetags = numpy.asarray(raw_data.timetags, dtype=numpy.int64)
+        channels = numpy.asarray(raw_data.channels, dtype=numpy.uint8)
+        if len(timetags) == 0:
+            self.last_removed = 0
+            return raw_data
+
+        # group by channel keeping time order, so per-channel diffs are one
+        # subtraction over the whole chunk
+        order = numpy.argsort(channels, kind='stable')
+        sorted_channels = channels[order]
+        sorted_timetags = timetags[order]
+
+        previous = numpy.empty_like(sorted_timetags)
+        previous[1:] = sorted_timetags[:-1]
+        group_start = numpy.ones(len(sorted_channels), dtype=bool)
+        group_start[1:] = sorted_channels[1:] != sorted_channels[:-1]
+        # first tag of each channel is compared with the previous chunk
+        previous[group_start] = self._last_tag[sorted_channels[group_start]]
+
+        keep_sorted = (sorted_timetags - previous) >= self.dead_time[sorted_channels]
+
+        group_end = numpy.ones(len(sorted_channels), dtype=bool)
+        group_end[:-1] = group_start[1:]
+        self._last_tag[sorted_channels[group_end]] = sorted_timetags[group_end]
+
+        removed = numpy.bincount(
+            sorted_channels[~keep_sorted],
+            minlength=256
+        )
+        self.removed += removed
+        self.last_removed = int(removed.sum())
+
+        keep = numpy.empty_like(keep_sorted)
+        keep[order] = keep_sorted
+        return timetagger.RawData(
+            timetags=timetags[keep],
+            channels=channels[keep],
+            channel_map=raw_data.channel_map
+        )
+
+class FilteredTimeTagger(timetagger.TimeTagger):
+    def __init__(
+            self,
+            tt: timetagger.TimeTagger,
+            dead_time: int | dict[int, int]
+    ) -> None:
+        self.timetagger = tt
+        self.device_info = tt.device_info
+        self.channel_map = tt.channel_map
+        self.filter = DeadTimeFilter(dead_time=dead_time)
+
+    def measure(self, seconds: int = 1) -> timetagger.RawData:
+        return self.filter(raw_data=self.timetagger.measure(seconds=seconds))
+
+    def disconnect(self) -> None:
+        self.timetagger.disconnect()
+
+if __name__ == '__main__':
+    import time
+
+    rng = numpy.random.default_rng(seed=0)
+    n = 2_000_000
+    timetags = numpy.cumsum(rng.integers(1, 200, size=n)).astype(numpy.int64)
+    channels = rng.integers(0, 8, size=n).astype(numpy.uint8)
+    dead_time_filter = DeadTimeFilter(dead_time=500)
+
+    start = time.perf_counter()
+    kept = 0
+    for chunk in numpy.array_split(numpy.arange(n), 20):
+        kept += len(dead_time_filter(raw_data=timetagger.RawData(
+            timetags=timetags[chunk],
+            channels=channels[chunk]
+        )).timetags)
+    elapsed = time.perf_counter() - start
+    print(f'kept {kept}, removed {dead_time_filter.total_removed} in {elapsed:.3f} s')
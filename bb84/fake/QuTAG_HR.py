@@ -0,0 +1,75 @@
+import time
+
+import numpy
+
+from . import source
+
+class QuTAG:
+    def __init__(
+            self,
+            rates: dict[int, float] | None = None,
+            buffer_size: int = 1_000_000,
+            seed: int | None = None
+    ) -> None:
+        self._source = source.PoissonSource(rates=rates, seed=seed)
+        self._buffer_size = buffer_size
+        self._timestamps = numpy.empty(0, dtype=numpy.int64)
+        self._channels = numpy.empty(0, dtype=numpy.int8)
+        self._start_time = time.monotonic()
+        self._last_time = 0.0
+        self._delays = numpy.zeros(8, dtype=numpy.int64)
+        self._exposure_time = 100
+
+    def setSignalConditioning(
+            self,
+            channel: int,
+            conditioning: int,
+            edge: bool,
+            threshold: float
+    ) -> None:
+        pass
+
+    def setChannelDelay(self, channel: int, delays: int) -> None:
+        self._delays[channel] = delays
+
+    def setExposureTime(self, expTime: int) -> None:
+        self._exposure_time = expTime
+
+    def enableExternalClock(self, enable: int) -> None:
+        pass
+
+    def setBufferSize(self, size: int) -> None:
+        self._buffer_size = size
+
+    def getLastTimestamps(
+            self,
+            reset: bool = True
+    ) -> tuple[numpy.ndarray, numpy.ndarray, int]:
+        self._advance()
+        timestamps = self._timestamps
+        channels = self._channels
+        valid = len(timestamps)
+        if reset:
+            self._timestamps = numpy.empty(0, dtype=numpy.int64)
+            self._channels = numpy.empty(0, dtype=numpy.int8)
+        return timestamps, channels, valid
+
+    def deInitialize(self) -> None:
+        pass
+
+    def _advance(self) -> None:
+        now = time.monotonic() - self._start_time
+        times, channels = self._source.generate(
+            start=self._last_time,
+            duration=now - self._last_time
+        )
+        self._last_time = now
+
+        # timestamps are in picoseconds, as returned by the real device
+        timestamps = (times * 1e12).astype(numpy.int64) + self._delays[channels]
+        self._timestamps = numpy.concatenate(
+            (self._timestamps, timestamps)
+        )[-self._buffer_size:]
+        self._channels = numpy.concatenate(
+            (self._channels, channels.astype(numpy.int8))
+        )[-self._buffer_size:]
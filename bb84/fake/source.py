@@ -0,0 +1,30 @@
+import numpy
+
+# counts per second on each of the 8 inputs, roughly a bright overpass
+DEFAULT_RATES = {channel: 50_000.0 for channel in range(8)}
+
+class PoissonSource:
+    def __init__(
+            self,
+            rates: dict[int, float] | None = None,
+            seed: int | None = None
+    ) -> None:
+        rates = rates or DEFAULT_RATES
+        self.channels = numpy.array(list(rates), dtype=numpy.uint8)
+        rate_array = numpy.array(list(rates.values()), dtype=numpy.float64)
+        self.total_rate = float(rate_array.sum())
+        self.probabilities = rate_array / self.total_rate
+        self.rng = numpy.random.default_rng(seed=seed)
+
+    def generate(
+            self,
+            start: float,
+            duration: float
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        # merged poisson process: uniform times, channels drawn by rate
+        n = self.rng.poisson(self.total_rate * duration)
+        times = numpy.sort(self.rng.uniform(start, start + duration, size=n))
+        channels = self.channels[
+            self.rng.choice(len(self.channels), size=n, p=self.probabilities)
+        ]
+        return times, channels
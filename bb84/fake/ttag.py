@@ -0,0 +1,88 @@
+import time
+
+import numpy
+
+from . import source
+
+def getfreebuffer() -> int:
+    return 1
+
+class TTBuffer:
+    def __init__(
+            self,
+            buffernumber: int,
+            rates: dict[int, float] | None = None,
+            size: int = 2**22,
+            resolution: float = 156.25e-12,
+            seed: int | None = None
+    ) -> None:
+        self.buffernumber = buffernumber
+        self.size = size
+        self.resolution = resolution
+        self._source = source.PoissonSource(rates=rates, seed=seed)
+        self._timetags = numpy.zeros(size, dtype=numpy.int64)
+        self._channels = numpy.zeros(size, dtype=numpy.uint8)
+        self._datapoints = 0
+        self._runners = 0
+        self._start_time = time.monotonic()
+        self._last_time = 0.0
+
+    @property
+    def datapoints(self) -> int:
+        self._advance()
+        return self._datapoints
+
+    def getrunners(self) -> int:
+        return self._runners
+
+    def start(self) -> None:
+        self._runners += 1
+
+    def stop(self) -> None:
+        self._runners = max(self._runners - 1, 0)
+
+    def __call__(self, timeToGet: float = 1.0) -> tuple[numpy.ndarray, numpy.ndarray]:
+        end = self.datapoints
+        start = max(end - self.size, 0)
+        channels, timetags = self[start:end]
+        if len(timetags) == 0:
+            return channels, timetags
+        first = numpy.searchsorted(
+            timetags,
+            timetags[-1] - int(timeToGet / self.resolution),
+            side='left'
+        )
+        return channels[first:], timetags[first:]
+
+    def __getitem__(self, key: slice) -> tuple[numpy.ndarray, numpy.ndarray]:
+        start, stop, _ = key.indices(self._datapoints)
+        start = max(start, self._datapoints - self.size)
+        if start >= stop:
+            return (
+                numpy.empty(0, dtype=numpy.uint8),
+                numpy.empty(0, dtype=numpy.int64)
+            )
+        # ring buffer indices, unwrapped with a modulo gather
+        index = numpy.arange(start, stop) % self.size
+        return self._channels[index], self._timetags[index]
+
+    def _advance(self) -> None:
+        now = time.monotonic() - self._start_time
+        times, channels = self._source.generate(
+            start=self._last_time,
+            duration=now - self._last_time
+        )
+        self._last_time = now
+        n = len(times)
+        if n == 0:
+            return
+        if n > self.size:
+            times = times[-self.size:]
+            channels = channels[-self.size:]
+            self._datapoints += n - self.size
+            n = self.size
+
+        index = numpy.arange(self._datapoints, self._datapoints + n) % self.size
+        self._timetags[index] = (times / self.resolution).astype(numpy.int64)
+        self._channels[index] = channels
+        self._datapoints += n
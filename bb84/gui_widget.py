@@ -1,4 +1,6 @@
 import typing
+import threading
+import time
 
 import gi
 gi.require_version('Gtk', '4.0')
@@ -11,6 +13,96 @@ import matplotlib.pyplot
 import numpy
 
 from . import timetagger
+from . import history
+from . import profiler
+from . import measurement_bus
+from . import latency
+
+class RenderScheduler:
+    def __init__(
+            self,
+            widget: Gtk.Widget,
+            max_fps: float = 30
+    ) -> None:
+        # widgets mark themselves dirty from any thread; one frame-clock tick
+        # redraws each dirty widget at most once, capped at max_fps. the tick
+        # callback is only installed while something is dirty, so an idle
+        # window does not keep the frame clock running
+        self.max_fps = max_fps
+        self._widget = widget
+        self._dirty: dict[typing.Callable, None] = {}
+        self._lock = threading.Lock()
+        self._last_frame_time = 0
+        self._tick_id = None
+        self._install_pending = False
+
+    def mark_dirty(self, redraw: typing.Callable) -> None:
+        with self._lock:
+            self._dirty[redraw] = None
+            if self._tick_id is not None or self._install_pending:
+                return
+            self._install_pending = True
+        # tick callbacks may only be added from the main loop
+        GLib.idle_add(self._install)
+
+    def _install(self) -> bool:
+        with self._lock:
+            self._install_pending = False
+            if self._tick_id is None and self._dirty:
+                self._tick_id = self._widget.add_tick_callback(self._on_tick)
+        return GLib.SOURCE_REMOVE
+
+    def _on_tick(self, widget: Gtk.Widget, frame_clock) -> bool:
+        frame_time = frame_clock.get_frame_time()
+        if frame_time - self._last_frame_time < 1e6 / self.max_fps:
+            return GLib.SOURCE_CONTINUE
+        self._last_frame_time = frame_time
+
+        # redraws may mark further widgets dirty, which run in the same frame
+        with profiler.PROFILER.section(name='render'):
+            while True:
+                with self._lock:
+                    if not self._dirty:
+                        # removed under the lock, so a concurrent mark_dirty
+                        # either lands in this drain or installs a new callback
+                        self._tick_id = None
+                        return GLib.SOURCE_REMOVE
+                    redraw = next(iter(self._dirty))
+                    del self._dirty[redraw]
+                redraw()
+
+class BlitManager:
+    def __init__(
+            self,
+            canvas: matplotlib.backends.backend_gtk4agg.FigureCanvasGTK4Agg,
+            animated_artists: list
+    ) -> None:
+        # static parts of the figure are rendered once into a cached background,
+        # then each update only restores it and redraws the animated artists
+        self.canvas = canvas
+        self._background = None
+        self._artists = animated_artists
+        for artist in self._artists:
+            artist.set_animated(True)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event) -> None:
+        self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self) -> None:
+        for artist in self._artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self) -> None:
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        # gtk4 has no partial blit, but repainting the agg buffer skips the
+        # full figure render
+        self.canvas.queue_draw()
 
 class PolEllipseGroup(Adw.PreferencesGroup):
     def __init__(
@@ -49,11 +141,10 @@ class PolEllipseGroup(Adw.PreferencesGroup):
         self.canvas.set_size_request(width=200, height=200)
         self.add(child=Gtk.Frame(child=self.canvas))
 
-    def update_plot(self) -> None:
-        data: timetagger.Data = self.get_data_callback()
-
-        theta = numpy.radians(data.azimuth)
-        eta = numpy.radians(data.ellipticity)
+        self.blit_manager = BlitManager(
+            canvas=self.canvas,
+            animated_artists=[self.ellipse, self.major_axis, self.minor_axis]
+        )
 
         ## parametric angle
         t = numpy.linspace(
@@ -61,14 +152,22 @@ class PolEllipseGroup(Adw.PreferencesGroup):
             stop=2 * numpy.pi,
             num=500
         )
-        
+        self._cos_t = numpy.cos(t)
+        self._sin_t = numpy.sin(t)
+
+    def update_plot(self) -> None:
+        data: timetagger.Data = self.get_data_callback()
+
+        theta = numpy.radians(data.azimuth)
+        eta = numpy.radians(data.ellipticity)
+
         ## semi-axes
         a = 1
         b = a * numpy.tan(eta)
 
         ## ellipse
-        x = a * numpy.cos(t)
-        y = b * numpy.sin(t)
+        x = a * self._cos_t
+        y = b * self._sin_t
 
         # rotate ellipse by azimuth angle
         x_rotated = x * numpy.cos(theta) - y * numpy.sin(theta)
@@ -94,7 +193,7 @@ class PolEllipseGroup(Adw.PreferencesGroup):
         self.major_axis.set_data(x_major_rotated, y_major_rotated)
         self.minor_axis.set_data(x_minor_rotated, y_minor_rotated)
 
-        self.canvas.draw_idle()
+        self.blit_manager.update()
 
 class BlochSphere3D(Adw.PreferencesGroup):
     def __init__(
@@ -151,6 +250,12 @@ class BlochSphere3D(Adw.PreferencesGroup):
         self.canvas.set_size_request(width=200, height=200)
         self.add(child=Gtk.Frame(child=self.canvas))
 
+        # wireframe, axes and labels stay in the cached background
+        self.blit_manager = BlitManager(
+            canvas=self.canvas,
+            animated_artists=[self.point]
+        )
+
     def is_behind_camera(self, x, y, z) -> bool:
         # Get current 3D projection matrix
         proj = self.ax.get_proj()
@@ -181,8 +286,51 @@ class BlochSphere3D(Adw.PreferencesGroup):
         # add transparency if dot behind sphere
         self.point.set_alpha(0.3 if is_behind else 1.0)
 
+        self.blit_manager.update()
+
+class StripChartGroup(Adw.PreferencesGroup):
+    def __init__(
+            self,
+            get_history_callback: typing.Callable
+    ) -> None:
+        super().__init__(title='History')
+        self.get_history_callback = get_history_callback
+
+        self.fig = matplotlib.figure.Figure(figsize=(4, 2))
+        self.ax = self.fig.add_subplot(111)
+        self.ax.grid(True)
+        self.ax.set_ylim(-90, 90)
+        self.ax.set_xlabel(xlabel='Time (s)')
+        self.ax.set_ylabel(ylabel='Angle (°)')
+        self.fig.tight_layout()
+
+        # each line draws a min/max envelope, one vertical stroke per bucket
+        self.azimuth_line = self.ax.plot([], [], color='blue', linewidth=1, label='Azimuth')[0]
+        self.ellipticity_line = self.ax.plot([], [], color='red', linewidth=1, label='Ellipticity')[0]
+        self.ax.legend(loc='upper left')
+
+        self.canvas = matplotlib.backends.backend_gtk4agg.FigureCanvasGTK4Agg(
+            figure=self.fig
+        )
+        self.canvas.set_size_request(width=200, height=150)
+        self.add(child=Gtk.Frame(child=self.canvas))
+
+    def update_plot(self) -> None:
+        data_history: history.MinMaxHistory = self.get_history_callback()
+
+        # about one bucket per horizontal pixel, whatever the session length
+        max_points = max(self.canvas.get_width(), 100)
+        times, mins, maxs = data_history.query(max_points=max_points)
+        if len(times) == 0:
+            return
+        times = times - times[-1]
+        x, y = history.envelope(times=times, mins=mins, maxs=maxs)
+
+        self.azimuth_line.set_data(x, y[:, 0])
+        self.ellipticity_line.set_data(x, y[:, 1])
+        self.ax.set_xlim(min(times[0], -1), 0)
         self.canvas.draw_idle()
-azimuth
+
 class Counts(Adw.PreferencesGroup):
     def __init__(
             self,
@@ -291,15 +439,21 @@ class Counts(Adw.PreferencesGroup):
 
     def update_timetagger_info(self):
         raw_data: timetagger.RawData = self.get_raw_data_callback()
-        singles = numpy.bincount(raw_data.channels, minlength=8)
+        singles = raw_data.singles
+        channel_map = raw_data.channel_map or timetagger.DEFAULT_CHANNEL_MAP
         # singles = [int(val) for channel, val in raw_data.__dict__.items()]
 
-        self.h_value_label.set_text(f'{singles[timetagger.C_780_H]}' if timetagger.C_780_H is not None else '0')
-        self.v_value_label.set_text(f'{singles[timetagger.C_780_V]}' if timetagger.C_780_V is not None else '0')
-        self.d_value_label.set_text(f'{singles[timetagger.C_780_D]}' if timetagger.C_780_D is not None else '0')
-        self.a_value_label.set_text(f'{singles[timetagger.C_780_A]}' if timetagger.C_780_A is not None else '0')
-        self.r_value_label.set_text(f'{singles[timetagger.C_780_R]}' if timetagger.C_780_R is not None else '0')
-        self.l_value_label.set_text(f'{singles[timetagger.C_780_L]}' if timetagger.C_780_L is not None else '0')
+        counts = channel_map.wavelength_counts(
+            singles=singles,
+            wavelength=channel_map.primary
+        )
+
+        self.h_value_label.set_text(f'{counts[0]}')
+        self.v_value_label.set_text(f'{counts[1]}')
+        self.d_value_label.set_text(f'{counts[2]}')
+        self.a_value_label.set_text(f'{counts[3]}')
+        self.r_value_label.set_text(f'{counts[4]}')
+        self.l_value_label.set_text(f'{counts[5]}')
 
 class MeasurementGroup(Adw.PreferencesGroup):
     def __init__(
@@ -431,6 +585,38 @@ class MeasurementGroup(Adw.PreferencesGroup):
         # self.phase_difference_value_label.set_text(f'{data.phase_difference:3.2f}')
         # self.circularity_value_label.set_text(f'{data.circularity:.2f} %')
 
+class ProfilerGroup(Adw.PreferencesGroup):
+    def __init__(
+            self,
+            sections: tuple[str, ...] = ('acquire', 'compute', 'render', 'control')
+    ) -> None:
+        super().__init__(title='Performance')
+
+        expander_row = Adw.ExpanderRow(
+            title='Timings',
+            subtitle='p50 / p99'
+        )
+        self.add(child=expander_row)
+
+        self.value_labels: dict[str, Gtk.Label] = {}
+        for section in sections:
+            row = Adw.ActionRow(title=section.capitalize())
+            expander_row.add_row(child=row)
+            value_label = Gtk.Label(label='N/A')
+            row.add_suffix(widget=value_label)
+            self.value_labels[section] = value_label
+
+        GLib.timeout_add(
+            interval=1000,
+            function=self.update_timings
+        )
+
+    def update_timings(self) -> bool:
+        for section, value_label in self.value_labels.items():
+            p50, p99 = profiler.PROFILER.percentiles(name=section)
+            value_label.set_text(f'{p50:.1f} / {p99:.1f} ms')
+        return True
+
 class DeviceInfoGroup(Adw.PreferencesGroup):
     def __init__(
             self,
@@ -460,7 +646,8 @@ class DeviceInfoGroup(Adw.PreferencesGroup):
 class ColumnOne(Adw.PreferencesPage):
     def __init__(
             self,
-            get_data_callback: typing.Callable
+            get_data_callback: typing.Callable,
+            get_history_callback: typing.Callable
     ) -> None:
         super().__init__()
 
@@ -474,6 +661,11 @@ class ColumnOne(Adw.PreferencesPage):
         )
         self.add(group=self.plot_bloch_group)
 
+        self.strip_chart_group = StripChartGroup(
+            get_history_callback=get_history_callback
+        )
+        self.add(group=self.strip_chart_group)
+
 class ColumnTwo(Adw.PreferencesPage):
     def __init__(
             self,
@@ -497,18 +689,31 @@ class ColumnTwo(Adw.PreferencesPage):
         )
         self.add(group=self.timetagger_group)
 
+        self.profiler_group = ProfilerGroup()
+        self.add(group=self.profiler_group)
+
 class TimeTaggerBox(Gtk.Box):
     def __init__(
             self,
-            tt: timetagger.TimeTagger
+            tt: timetagger.TimeTagger,
+            render_scheduler: RenderScheduler | None = None
     ) -> None:
         super().__init__(orientation=Gtk.Orientation.HORIZONTAL)
         self.timetagger = tt
-        self.raw_data = self.timetagger.measure()
+        self.render_scheduler = render_scheduler or RenderScheduler(widget=self)
+        self.raw_data = timetagger.RawData(
+            timetags=numpy.empty(0, dtype=numpy.int64),
+            channels=numpy.empty(0, dtype=numpy.uint8)
+        )
         self.data = timetagger.Data()
+        # azimuth, ellipticity, s1, s2, s3
+        self.history = history.MinMaxHistory(n_values=5)
+        # every finished frame is published for the compensation loop
+        self.measurement_bus = measurement_bus.MeasurementBus()
 
         self.columnone = ColumnOne(
-            get_data_callback=self.get_data
+            get_data_callback=self.get_data,
+            get_history_callback=self.get_history
         )
         self.append(child=self.columnone)
 
@@ -521,10 +726,16 @@ class TimeTaggerBox(Gtk.Box):
         )
         self.append(child=self.columntwo)
 
-        GLib.timeout_add(
-            interval=self.poling_interval,
-            function=self.update_from_timetagger
+        # acquisition and reduction run off the GTK main loop; only the latest
+        # finished frame is kept and picked up on the next rendered frame
+        self._frame_lock = threading.Lock()
+        self._latest_frame = None
+        self._stop_event = threading.Event()
+        self._acquisition_thread = threading.Thread(
+            target=self._acquisition_loop,
+            daemon=True
         )
+        self._acquisition_thread.start()
 
     def get_raw_data(self) -> timetagger.RawData:
         return self.raw_data
@@ -534,20 +745,73 @@ class TimeTaggerBox(Gtk.Box):
 
     def get_device_info(self) -> timetagger.DeviceInfo:
         return self.timetagger.device_info
-        
-    def update_from_timetagger(self) -> bool:
-        self.raw_data = self.timetagger.measure()
-        try:
-            self.data = timetagger.Data().from_raw_data(
-                raw_data=self.raw_data
+
+    def get_history(self) -> history.MinMaxHistory:
+        return self.history
+
+    def stop(self, timeout: float | None = 2.0) -> bool:
+        # True once the worker has left measure(), after which the device can
+        # be released; a measure can take a whole second
+        self._stop_event.set()
+        self.measurement_bus.close()
+        self._acquisition_thread.join(timeout=timeout)
+        return not self._acquisition_thread.is_alive()
+
+    def _acquisition_loop(self) -> None:
+        while not self._stop_event.is_set():
+            start_time = time.monotonic()
+            acquire_start = time.perf_counter_ns()
+            try:
+                with profiler.PROFILER.section(name='acquire'):
+                    raw_data = self.timetagger.measure()
+                acquire_end = time.perf_counter_ns()
+            except Exception as e:
+                print(f'Error: measurement failed {e}')
+                self._stop_event.wait(timeout=self.poling_interval / 1000)
+                continue
+            with profiler.PROFILER.section(name='compute'):
+                try:
+                    data = raw_data.data
+                except:
+                    data = timetagger.Data()
+            capture_time = time.time()
+            snapshot = self.measurement_bus.publish(data=data, timestamp=capture_time)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='acquire_start', time_ns=acquire_start)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='acquire_end', time_ns=acquire_end)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='published')
+            # every frame goes into the history, even ones the UI skips
+            self.history.append(
+                time=capture_time,
+                values=(
+                    data.azimuth,
+                    data.ellipticity,
+                    data.normalised_s1,
+                    data.normalised_s2,
+                    data.normalised_s3
+                )
+            )
+
+            with self._frame_lock:
+                self._latest_frame = (snapshot.sequence, raw_data, data)
+            self.render_scheduler.mark_dirty(self.update_from_timetagger)
+
+            elapsed = time.monotonic() - start_time
+            self._stop_event.wait(
+                timeout=max(self.poling_interval / 1000 - elapsed, 0)
             )
-        except:
-            self.data = timetagger.Data()
+
+    def update_from_timetagger(self) -> None:
+        with self._frame_lock:
+            sequence, self.raw_data, self.data = self._latest_frame
+        latency.TRACER.mark(sequence=sequence, point='rendered')
         self.set_qutag_data()
-        return True
     
     def set_qutag_data(self) -> None:
-        self.columnone.plot_ellipse_group.update_plot()
-        self.columnone.plot_bloch_group.update_point()
-        self.columntwo.counts_group.update_timetagger_info()
-        self.columntwo.measurement_group.update_qutag_info()
\ No newline at end of file
+        for redraw in (
+            self.columnone.plot_ellipse_group.update_plot,
+            self.columnone.plot_bloch_group.update_point,
+            self.columnone.strip_chart_group.update_plot,
+            self.columntwo.counts_group.update_timetagger_info,
+            self.columntwo.measurement_group.update_qutag_info
+        ):
+            self.render_scheduler.mark_dirty(redraw)
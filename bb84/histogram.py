@@ -0,0 +1,91 @@
+import numpy
+
+from . import timetagger
+from . import merge
+
+class TimeDifferenceHistogram:
+    def __init__(
+            self,
+            channel_a: int,
+            channel_b: int,
+            max_delay: int,
+            bin_width: int,
+            decay: float | None = None
+    ) -> None:
+        self.channel_a = channel_a
+        self.channel_b = channel_b
+        self.max_delay = max_delay
+        self.bin_width = bin_width
+        self.decay = decay
+
+        n_bins = 2 * (max_delay // bin_width) + 1
+        self.edges = (numpy.arange(n_bins) - n_bins // 2) * bin_width
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = numpy.zeros(len(self.edges), dtype=numpy.float64)
+        self._tail_a = numpy.empty(0, dtype=numpy.int64)
+        self._tail_b = numpy.empty(0, dtype=numpy.int64)
+
+    def update(self, raw_data: timetagger.RawData) -> numpy.ndarray:
+        new_a = raw_data.timetags[raw_data.channels == self.channel_a]
+        new_b = raw_data.timetags[raw_data.channels == self.channel_b]
+
+        # tags near the previous chunk's end still pair with this chunk; the
+        # tail x tail pairs were already counted, so they are subtracted again
+        tags_a = numpy.concatenate((self._tail_a, new_a))
+        tags_b = numpy.concatenate((self._tail_b, new_b))
+        _, counts = merge.cross_correlation(
+            reference=tags_a,
+            other=tags_b,
+            max_delay=self.max_delay,
+            bin_width=self.bin_width
+        )
+        _, counted = merge.cross_correlation(
+            reference=self._tail_a,
+            other=self._tail_b,
+            max_delay=self.max_delay,
+            bin_width=self.bin_width
+        )
+
+        if self.decay is not None:
+            self.counts *= self.decay
+        self.counts += counts - counted
+
+        if len(raw_data.timetags) > 0:
+            boundary = raw_data.timetags[-1] - self.max_delay
+            self._tail_a = tags_a[tags_a >= boundary]
+            self._tail_b = tags_b[tags_b >= boundary]
+        return self.counts
+
+    def peak(self) -> int:
+        return int(self.edges[numpy.argmax(self.counts)] + self.bin_width // 2)
+
+if __name__ == '__main__':
+    import time
+
+    rng = numpy.random.default_rng(seed=0)
+    n = 1_000_000
+    pairs = numpy.sort(rng.integers(0, 10**12, size=n))
+    timetags = numpy.concatenate((pairs, pairs + 1500 + rng.integers(-50, 50, size=n)))
+    channels = numpy.concatenate((
+        numpy.zeros(n, dtype=numpy.uint8),
+        numpy.ones(n, dtype=numpy.uint8)
+    ))
+    order = numpy.argsort(timetags, kind='stable')
+    timetags, channels = timetags[order], channels[order]
+
+    histogram = TimeDifferenceHistogram(
+        channel_a=0,
+        channel_b=1,
+        max_delay=5000,
+        bin_width=100
+    )
+    start = time.perf_counter()
+    for chunk in numpy.array_split(numpy.arange(2 * n), 50):
+        histogram.update(raw_data=timetagger.RawData(
+            timetags=timetags[chunk],
+            channels=channels[chunk]
+        ))
+    elapsed = time.perf_counter() - start
+    print(f'peak {histogram.peak()}, {int(histogram.counts.sum())} pairs in {elapsed:.3f} s')
@@ -0,0 +1,151 @@
+import threading
+
+import numpy
+
+class MinMaxHistory:
+    def __init__(
+            self,
+            n_values: int,
+            capacity: int = 2048,
+            factor: int = 4,
+            levels: int = 6
+    ) -> None:
+        # level l keeps `capacity` min/max buckets of factor**l samples each, so
+        # memory is fixed while the coarsest level spans capacity * factor**(levels-1)
+        self.n_values = n_values
+        self.capacity = capacity
+        self.factor = factor
+        self.levels = levels
+        self._lock = threading.Lock()
+
+        self._times = numpy.zeros((levels, capacity), dtype=numpy.float64)
+        self._mins = numpy.zeros((levels, capacity, n_values), dtype=numpy.float64)
+        self._maxs = numpy.zeros((levels, capacity, n_values), dtype=numpy.float64)
+        self._counts = numpy.zeros(levels, dtype=numpy.int64)
+
+        # partially filled bucket feeding each level above 0
+        self._partial_time = numpy.zeros(levels, dtype=numpy.float64)
+        self._partial_min = numpy.full((levels, n_values), numpy.inf)
+        self._partial_max = numpy.full((levels, n_values), -numpy.inf)
+        self._partial_count = numpy.zeros(levels, dtype=numpy.int64)
+
+    def __len__(self) -> int:
+        return int(min(self._counts[0], self.capacity))
+
+    def append(self, time: float, values: numpy.ndarray) -> None:
+        values = numpy.asarray(values, dtype=numpy.float64)
+        with self._lock:
+            self._push(level=0, time=time, low=values, high=values)
+
+    def _push(
+            self,
+            level: int,
+            time: float,
+            low: numpy.ndarray,
+            high: numpy.ndarray
+    ) -> None:
+        index = self._counts[level] % self.capacity
+        self._times[level, index] = time
+        self._mins[level, index] = low
+        self._maxs[level, index] = high
+        self._counts[level] += 1
+
+        parent = level + 1
+        if parent >= self.levels:
+            return
+        if self._partial_count[parent] == 0:
+            self._partial_time[parent] = time
+        numpy.minimum(self._partial_min[parent], low, out=self._partial_min[parent])
+        numpy.maximum(self._partial_max[parent], high, out=self._partial_max[parent])
+        self._partial_count[parent] += 1
+        if self._partial_count[parent] == self.factor:
+            low = self._partial_min[parent].copy()
+            high = self._partial_max[parent].copy()
+            self._partial_min[parent] = numpy.inf
+            self._partial_max[parent] = -numpy.inf
+            self._partial_count[parent] = 0
+            self._push(
+                level=parent,
+                time=self._partial_time[parent],
+                low=low,
+                high=high
+            )
+
+    def _level_view(self, level: int) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        count = int(self._counts[level])
+        if count <= self.capacity:
+            order = numpy.arange(count)
+        else:
+            start = count % self.capacity
+            order = (numpy.arange(self.capacity) + start) % self.capacity
+        return (
+            self._times[level, order],
+            self._mins[level, order],
+            self._maxs[level, order]
+        )
+
+    def _tail(self, level: int) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        # samples not yet merged into `level` are the last partial_count[j]
+        # buckets of each finer level j - 1, at most (factor - 1) per level
+        parts = []
+        for j in range(level, 0, -1):
+            n = int(self._partial_count[j])
+            if n == 0:
+                continue
+            times, mins, maxs = self._level_view(level=j - 1)
+            parts.append((times[-n:], mins[-n:], maxs[-n:]))
+        if not parts:
+            return (
+                numpy.empty(0),
+                numpy.empty((0, self.n_values)),
+                numpy.empty((0, self.n_values))
+            )
+        return tuple(numpy.concatenate(p) for p in zip(*parts))
+
+    def query(
+            self,
+            max_points: int,
+            start_time: float | None = None
+    ) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        # finest level that still covers the requested span within max_points
+        with self._lock:
+            for level in range(self.levels):
+                times, mins, maxs = self._level_view(level=level)
+                if start_time is None:
+                    covers = self._counts[level] <= self.capacity
+                else:
+                    covers = len(times) > 0 and times[0] <= start_time
+                    # keep the bucket that start_time falls inside
+                    first = max(int(numpy.searchsorted(times, start_time, side='right')) - 1, 0)
+                    times, mins, maxs = times[first:], mins[first:], maxs[first:]
+                if (covers or level == self.levels - 1) and len(times) <= max_points:
+                    break
+
+            tail_times, tail_mins, tail_maxs = self._tail(level=level)
+            return (
+                numpy.concatenate((times, tail_times)),
+                numpy.concatenate((mins, tail_mins)),
+                numpy.concatenate((maxs, tail_maxs))
+            )
+
+def envelope(
+        times: numpy.ndarray,
+        mins: numpy.ndarray,
+        maxs: numpy.ndarray
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # interleave min and max per bucket so one line draws the full envelope
+    x = numpy.repeat(times, 2)
+    y = numpy.stack((mins, maxs), axis=1).reshape(len(times) * 2, *mins.shape[1:])
+    return x, y
+
+if __name__ == '__main__':
+    import time
+
+    history = MinMaxHistory(n_values=2)
+    n_samples = 10 * 60 * 60 * 10
+    start = time.perf_counter()
+    for i in range(n_samples):
+        history.append(time=i / 10, values=(numpy.sin(i / 1000), numpy.cos(i / 3000)))
+    elapsed = time.perf_counter() - start
+    times, mins, maxs = history.query(max_points=800)
+    print(f'{n_samples} samples in {elapsed:.2f} s, {len(times)} buckets span {times[-1] - times[0]:.0f} s')
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import numpy
+
+# trace points in the order a measurement passes through them
+POINTS = (
+    'acquire_start',
+    'acquire_end',
+    'published',
+    'rendered',
+    'decided',
+    'commanded'
+)
+
+class LatencyTracer:
+    def __init__(self, capacity: int = 4096) -> None:
+        # one row per measurement sequence number, one column per trace point,
+        # holding perf_counter_ns timestamps; zero means not reached
+        self.capacity = capacity
+        self._index = {name: i for i, name in enumerate(POINTS)}
+        self._sequences = numpy.full(capacity, -1, dtype=numpy.int64)
+        self._times = numpy.zeros((capacity, len(POINTS)), dtype=numpy.int64)
+        self._lock = threading.Lock()
+
+    def mark(
+            self,
+            sequence: int,
+            point: str,
+            time_ns: int | None = None
+    ) -> None:
+        if time_ns is None:
+            time_ns = time.perf_counter_ns()
+        row = sequence % self.capacity
+        with self._lock:
+            if self._sequences[row] != sequence:
+                self._sequences[row] = sequence
+                self._times[row] = 0
+            # the first arrival wins, so a point reached twice keeps its earliest time
+            if self._times[row, self._index[point]] == 0:
+                self._times[row, self._index[point]] = time_ns
+
+    def ticks(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        # sequence numbers and timestamps in sequence order
+        with self._lock:
+            valid = self._sequences >= 0
+            sequences = self._sequences[valid]
+            times = self._times[valid]
+        order = numpy.argsort(sequences)
+        return sequences[order], times[order]
+
+    def breakdown(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        # milliseconds from the earliest point reached in each tick to every
+        # point, nan where a point was not reached; rendering runs alongside
+        # control, so points are not a strict chain
+        sequences, times = self.ticks()
+        reached = times > 0
+        reference = numpy.where(reached, times, numpy.iinfo(numpy.int64).max).min(axis=1)
+        offsets = (times - reference[:, numpy.newaxis]).astype(numpy.float64) / 1e6
+        offsets[~reached] = numpy.nan
+        return sequences, offsets
+
+    def end_to_end(
+            self,
+            start: str = 'acquire_start',
+            end: str = 'commanded'
+    ) -> numpy.ndarray:
+        _, times = self.ticks()
+        start_times = times[:, self._index[start]]
+        end_times = times[:, self._index[end]]
+        reached = (start_times > 0) & (end_times > 0)
+        return (end_times[reached] - start_times[reached]) / 1e6
+
+    def histograms(
+            self,
+            bins: int | numpy.ndarray = 50
+    ) -> dict[str, tuple[numpy.ndarray, numpy.ndarray]]:
+        # counts and edges in milliseconds for every point reached, plus end
+        # to end
+        _, offsets = self.breakdown()
+        histograms = {}
+        for i, point in enumerate(POINTS):
+            values = offsets[:, i][~numpy.isnan(offsets[:, i])]
+            if len(values) > 0 and values.any():
+                histograms[point] = numpy.histogram(values, bins=bins)
+        values = self.end_to_end()
+        if len(values) > 0:
+            histograms['end_to_end'] = numpy.histogram(values, bins=bins)
+        return histograms
+
+    def export(self, path: str) -> None:
+        sequences, offsets = self.breakdown()
+        numpy.savetxt(
+            path,
+            numpy.column_stack((sequences, offsets)),
+            delimiter=',',
+            header=','.join(['sequence'] + [f'{point} (ms)' for point in POINTS]),
+            comments='',
+            fmt=['%d'] + ['%.3f'] * len(POINTS)
+        )
+
+# shared by the acquisition, render and control threads; set BB84_LATENCY to a
+# csv path to export the per tick breakdown on exit
+TRACER = LatencyTracer()
+EXPORT_PATH = os.environ.get('BB84_LATENCY')
+
+if __name__ == '__main__':
+    rng = numpy.random.default_rng(seed=0)
+    tracer = LatencyTracer(capacity=1024)
+    start = time.perf_counter()
+    for sequence in range(10_000):
+        t = sequence * 100_000_000
+        for point, offset in zip(POINTS, numpy.cumsum(rng.exponential(2e6, size=len(POINTS)))):
+            tracer.mark(sequence=sequence, point=point, time_ns=t + int(offset))
+    elapsed = time.perf_counter() - start
+    end_to_end = tracer.end_to_end()
+    print(
+        f'{10_000 * len(POINTS) / elapsed:.0f} marks/s, '
+        f'end to end p50 {numpy.median(end_to_end):.2f} ms over {len(end_to_end)} ticks'
+    )
+    for name, (counts, edges) in tracer.histograms(bins=5).items():
+        print(name, counts)
@@ -0,0 +1,331 @@
+import dataclasses
+import collections
+import fractions
+
+import numpy
+
+from . import timetagger
+
+# picoseconds per tick, kept as exact fractions so scaling stays integer
+UQD_TIMEBASE = fractions.Fraction(625, 4)       # 156.25 ps
+QUTAG_TIMEBASE = fractions.Fraction(625, 8)     # 78.125 ps (after Qutag.resolution)
+PICOSECOND_TIMEBASE = fractions.Fraction(1)
+
+@dataclasses.dataclass
+class StreamConfig:
+    timebase: fractions.Fraction = PICOSECOND_TIMEBASE
+    channel_map: dict[int, int] = dataclasses.field(default_factory=dict)
+    offset: int = 0
+
+    def __post_init__(self) -> None:
+        self.timebase = fractions.Fraction(self.timebase)
+        self._lut = numpy.arange(256, dtype=numpy.uint8)
+        for local, merged in self.channel_map.items():
+            self._lut[local] = merged
+
+    def to_picoseconds(self, raw_data: timetagger.RawData) -> timetagger.RawData:
+        timetags = numpy.asarray(raw_data.timetags, dtype=numpy.int64)
+        if self.timebase.denominator == 1:
+            timetags = timetags * self.timebase.numerator
+        else:
+            timetags = (
+                timetags * self.timebase.numerator
+            ) // self.timebase.denominator
+        return timetagger.RawData(
+            timetags=timetags - self.offset,
+            channels=self._lut[numpy.asarray(raw_data.channels, dtype=numpy.uint8)]
+        )
+
+def cross_correlation(
+        reference: numpy.ndarray,
+        other: numpy.ndarray,
+        max_delay: int,
+        bin_width: int
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    n_bins = 2 * (max_delay // bin_width) + 1
+    edges = (numpy.arange(n_bins) - n_bins // 2) * bin_width
+    if len(reference) == 0 or len(other) == 0:
+        return edges, numpy.zeros(n_bins, dtype=numpy.int64)
+
+    # every (reference, other) pair within +-max_delay, without a python loop
+    lo = numpy.searchsorted(other, reference - max_delay, side='left')
+    hi = numpy.searchsorted(other, reference + max_delay, side='right')
+    n_pairs = hi - lo
+    total = int(n_pairs.sum())
+    if total == 0:
+        return edges, numpy.zeros(n_bins, dtype=numpy.int64)
+
+    starts = numpy.repeat(numpy.cumsum(n_pairs) - n_pairs, n_pairs)
+    idx = numpy.repeat(lo, n_pairs) + (numpy.arange(total) - starts)
+    diffs = other[idx] - numpy.repeat(reference, n_pairs)
+
+    bins = (diffs + max_delay) // bin_width
+    bins = bins[(bins >= 0) & (bins < n_bins)]
+    return edges, numpy.bincount(bins, minlength=n_bins)[:n_bins]
+
+def estimate_delay(
+        reference: numpy.ndarray,
+        other: numpy.ndarray,
+        max_delay: int,
+        bin_width: int,
+        min_counts: int = 10
+) -> float | None:
+    edges, counts = cross_correlation(
+        reference=reference,
+        other=other,
+        max_delay=max_delay,
+        bin_width=bin_width
+    )
+    peak = int(numpy.argmax(counts))
+    if counts[peak] < min_counts:
+        return None
+
+    # centroid over the peak and its neighbours for sub-bin resolution
+    lo = max(peak - 1, 0)
+    hi = min(peak + 2, len(counts))
+    weights = counts[lo:hi].astype(numpy.float64)
+    centres = edges[lo:hi] + bin_width / 2
+    return float(numpy.sum(weights * centres) / numpy.sum(weights))
+
+class DriftEstimator:
+    def __init__(
+            self,
+            history: int = 32
+    ) -> None:
+        self._times = collections.deque(maxlen=history)
+        self._delays = collections.deque(maxlen=history)
+        self.offset = 0.0
+        self.rate = 0.0
+
+    def predict(self, timetags: numpy.ndarray) -> numpy.ndarray:
+        return self.offset + self.rate * timetags
+
+    def update(self, time: float, delay: float) -> None:
+        self._times.append(time)
+        self._delays.append(delay)
+        if len(self._times) < 2:
+            self.offset = delay
+            self.rate = 0.0
+            return
+        self.rate, self.offset = numpy.polyfit(
+            x=numpy.array(self._times),
+            y=numpy.array(self._delays),
+            deg=1
+        )
+
+    def correct(self, timetags: numpy.ndarray) -> numpy.ndarray:
+        if len(timetags) == 0:
+            return timetags
+        return timetags - numpy.rint(self.predict(timetags)).astype(numpy.int64)
+
+class StreamMerger:
+    def __init__(
+            self,
+            streams: list[StreamConfig],
+            reference_channel: int | None = None,
+            drift_channels: dict[int, int] | None = None,
+            max_delay: int = 10_000,
+            bin_width: int = 100,
+            history: int = 32
+    ) -> None:
+        self.streams = streams
+        self.reference_channel = reference_channel
+        self.drift_channels = drift_channels or {}
+        self.max_delay = max_delay
+        self.bin_width = bin_width
+
+        self.drift = [DriftEstimator(history=history) for _ in streams]
+        # pushed chunks per stream, joined once per pop rather than per push
+        self._pending = [[] for _ in streams]
+        # time in picoseconds each stream is known to be complete up to, from
+        # its last tag or a heartbeat, so an idle stream does not hold the
+        # others back
+        self._watermarks = [None for _ in streams]
+        # everything up to here has been emitted; later drift updates can not
+        # move tags before it
+        self._emitted = None
+
+    def push(
+            self,
+            stream: int,
+            raw_data: timetagger.RawData,
+            until: int | None = None
+    ) -> None:
+        # until, in the stream's own ticks, is the end of the acquisition
+        # window when it is known to run past the last tag
+        converted = self.streams[stream].to_picoseconds(raw_data=raw_data)
+        if len(converted.timetags) > 0:
+            self._pending[stream].append(converted)
+            self._advance(stream=stream, watermark=int(converted.timetags[-1]))
+        if until is not None:
+            self.heartbeat(stream=stream, until=until)
+
+    def heartbeat(self, stream: int, until: int) -> None:
+        # the stream had no tags up to `until` ticks beyond what was pushed
+        config = self.streams[stream]
+        watermark = (until * config.timebase.numerator) // config.timebase.denominator
+        self._advance(stream=stream, watermark=watermark - config.offset)
+
+    def _advance(self, stream: int, watermark: int) -> None:
+        if self._watermarks[stream] is None or watermark > self._watermarks[stream]:
+            self._watermarks[stream] = watermark
+
+    def _take(self, stream: int) -> timetagger.RawData:
+        chunks = self._pending[stream]
+        if len(chunks) == 0:
+            return timetagger.RawData(
+                timetags=numpy.empty(0, dtype=numpy.int64),
+                channels=numpy.empty(0, dtype=numpy.uint8)
+            )
+        if len(chunks) > 1:
+            chunks[:] = [timetagger.RawData(
+                timetags=numpy.concatenate([c.timetags for c in chunks]),
+                channels=numpy.concatenate([c.channels for c in chunks])
+            )]
+        return chunks[0]
+
+    def _correct(self, stream: int, timetags: numpy.ndarray) -> numpy.ndarray:
+        if stream > 0:
+            timetags = self.drift[stream].correct(timetags=timetags)
+        if self._emitted is not None and len(timetags) > 0:
+            timetags = numpy.maximum(timetags, self._emitted)
+        return timetags
+
+    def pop(self) -> timetagger.RawData:
+        # nothing can be emitted until every stream has reported up to some time
+        if any(w is None for w in self._watermarks):
+            return merge(raw_data=[])
+
+        watermark = min(
+            int(self._correct(stream=i, timetags=numpy.array([w], dtype=numpy.int64))[0])
+            for i, w in enumerate(self._watermarks)
+        )
+
+        segments = []
+        for i in range(len(self.streams)):
+            pending = self._take(stream=i)
+            timetags = self._correct(stream=i, timetags=pending.timetags)
+            n = int(numpy.searchsorted(timetags, watermark, side='right'))
+            segments.append(timetagger.RawData(
+                timetags=timetags[:n],
+                channels=pending.channels[:n]
+            ))
+            self._pending[i] = [timetagger.RawData(
+                timetags=pending.timetags[n:],
+                channels=pending.channels[n:]
+            )] if n < len(pending.timetags) else []
+
+        self._emitted = watermark
+        self._update_drift(segments=segments)
+        return merge(raw_data=segments)
+
+    def flush(self) -> timetagger.RawData:
+        segments = []
+        for i in range(len(self.streams)):
+            pending = self._take(stream=i)
+            segments.append(timetagger.RawData(
+                timetags=self._correct(stream=i, timetags=pending.timetags),
+                channels=pending.channels
+            ))
+        self._pending = [[] for _ in self.streams]
+        merged = merge(raw_data=segments)
+        if len(merged.timetags) > 0:
+            self._emitted = int(merged.timetags[-1])
+        return merged
+
+    def _update_drift(self, segments: list[timetagger.RawData]) -> None:
+        if self.reference_channel is None:
+            return
+        reference = segments[0].timetags[
+            segments[0].channels == self.reference_channel
+        ]
+        if len(reference) == 0:
+            return
+        window_time = float(reference[len(reference) // 2])
+
+        for stream, channel in self.drift_channels.items():
+            other = segments[stream].timetags[segments[stream].channels == channel]
+            residual = estimate_delay(
+                reference=reference,
+                other=other,
+                max_delay=self.max_delay,
+                bin_width=self.bin_width
+            )
+            if residual is None:
+                continue
+            # segments are already corrected, so the peak is the model's error
+            drift = self.drift[stream]
+            drift.update(
+                time=window_time,
+                delay=float(drift.predict(window_time)) + residual
+            )
+
+def merge(raw_data: list[timetagger.RawData]) -> timetagger.RawData:
+    raw_data = [r for r in raw_data if len(r.timetags) > 0]
+    if len(raw_data) == 0:
+        return timetagger.RawData(
+            timetags=numpy.empty(0, dtype=numpy.int64),
+            channels=numpy.empty(0, dtype=numpy.uint8)
+        )
+    if len(raw_data) == 1:
+        return raw_data[0]
+
+    timetags = numpy.concatenate([r.timetags for r in raw_data])
+    channels = numpy.concatenate([r.channels for r in raw_data])
+    # a stable argsort of the concatenated runs rather than a true k-way
+    # merge; numpy's stable sort is a timsort, which finds the k pre-sorted
+    # runs and merges them, and ties keep their stream order
+    order = numpy.argsort(timetags, kind='stable')
+    return timetagger.RawData(
+        timetags=timetags[order],
+        channels=channels[order]
+    )
+
+if __name__ == '__main__':
+    rng = numpy.random.default_rng(seed=0)
+    pairs = numpy.sort(rng.integers(0, 10**10, size=20000))
+
+    uqd_ticks = (pairs * 4) // 625
+    qutag_ticks = ((pairs + 3000 + pairs // 10**5) * 8) // 625
+
+    merger = StreamMerger(
+        streams=[
+            StreamConfig(timebase=UQD_TIMEBASE, channel_map={0: 4}),
+            StreamConfig(timebase=QUTAG_TIMEBASE, channel_map={0: 0}),
+        ],
+        reference_channel=4,
+        drift_channels={1: 0},
+        max_delay=200_000,
+        bin_width=200
+    )
+    chunks = numpy.array_split(numpy.arange(len(pairs)), 20)
+    total = 0
+    previous = None
+    for chunk in chunks:
+        merger.push(stream=0, raw_data=timetagger.RawData(
+            timetags=uqd_ticks[chunk],
+            channels=numpy.zeros(len(chunk), dtype=numpy.uint8)
+        ))
+        merger.push(stream=1, raw_data=timetagger.RawData(
+            timetags=qutag_ticks[chunk],
+            channels=numpy.zeros(len(chunk), dtype=numpy.uint8)
+        ))
+        merged = merger.pop()
+        if len(merged.timetags) > 0:
+            # output stays monotonic across pops while the drift model moves
+            assert previous is None or merged.timetags[0] >= previous
+            previous = merged.timetags[-1]
+        total += len(merged.timetags)
+    total += len(merger.flush().timetags)
+
+    # an idle stream advances by heartbeat instead of holding the other back
+    idle = StreamMerger(streams=[StreamConfig(), StreamConfig()])
+    idle.heartbeat(stream=1, until=0)
+    for i in range(5):
+        idle.push(stream=0, raw_data=timetagger.RawData(
+            timetags=numpy.arange(i * 100, (i + 1) * 100, dtype=numpy.int64),
+            channels=numpy.zeros(100, dtype=numpy.uint8)
+        ))
+        idle.heartbeat(stream=1, until=(i + 1) * 100)
+        assert len(idle.pop().timetags) == 100
+    print(f'merged {total} tags, offset {merger.drift[1].offset:.1f} ps, rate {merger.drift[1].rate:.3e}')
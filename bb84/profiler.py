@@ -0,0 +1,83 @@
+import os
+import json
+import threading
+import contextlib
+import time
+
+import numpy
+
+class Profiler:
+    def __init__(
+            self,
+            window: int = 256,
+            trace_path: str | None = None
+    ) -> None:
+        # rolling window of durations per section, plus an optional trace in
+        # chrome://tracing json format
+        self.window = window
+        self._lock = threading.Lock()
+        self._durations: dict[str, numpy.ndarray] = {}
+        self._counts: dict[str, int] = {}
+        self._trace_file = None
+        self._trace_separator = ''
+        if trace_path:
+            # a fresh file per session, closed off as a json array on close
+            self._trace_file = open(file=trace_path, mode='w')
+            self._trace_file.write('[\n')
+
+    @contextlib.contextmanager
+    def section(self, name: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(
+                name=name,
+                start_ns=start,
+                duration_ns=time.perf_counter_ns() - start
+            )
+
+    def record(self, name: str, start_ns: int, duration_ns: int) -> None:
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = numpy.zeros(self.window, dtype=numpy.int64)
+                self._counts[name] = 0
+            self._durations[name][self._counts[name] % self.window] = duration_ns
+            self._counts[name] += 1
+
+            if self._trace_file is not None:
+                self._trace_file.write(self._trace_separator + json.dumps({
+                    'name': name,
+                    'ph': 'X',
+                    'ts': start_ns / 1000,
+                    'dur': duration_ns / 1000,
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident()
+                }))
+                self._trace_separator = ',\n'
+
+    def percentiles(self, name: str) -> tuple[float, float]:
+        # p50 and p99 in milliseconds
+        with self._lock:
+            count = min(self._counts.get(name, 0), self.window)
+            if count == 0:
+                return 0.0, 0.0
+            durations = self._durations[name][:count]
+            p50, p99 = numpy.percentile(durations, [50, 99]) / 1e6
+        return float(p50), float(p99)
+
+    def summary(self) -> dict[str, tuple[float, float]]:
+        with self._lock:
+            names = list(self._durations)
+        return {name: self.percentiles(name=name) for name in names}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.write('\n]\n')
+                self._trace_file.close()
+                self._trace_file = None
+
+# shared by the acquisition, render and control threads; set BB84_TRACE to
+# also write a trace file
+PROFILER = Profiler(trace_path=os.environ.get('BB84_TRACE'))
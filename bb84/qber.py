@@ -0,0 +1,254 @@
+import dataclasses
+import enum
+import math
+import statistics
+
+import numpy
+
+# coincidence column order for each basis, matching the patterns in
+# tests/proportional_compensation.py
+HH, HV, VH, VV = 0, 1, 2, 3
+DD, DA, AD, AA = 0, 1, 2, 3
+
+class Interval(enum.Enum):
+    WILSON = 'wilson'
+    CLOPPER_PEARSON = 'clopper_pearson'
+
+@dataclasses.dataclass
+class Estimate:
+    value: numpy.ndarray
+    lower: numpy.ndarray
+    upper: numpy.ndarray
+    errors: numpy.ndarray
+    totals: numpy.ndarray
+
+def wilson_interval(
+        errors: numpy.ndarray,
+        totals: numpy.ndarray,
+        confidence: float = 0.95
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    n = numpy.asarray(totals, dtype=numpy.float64)
+    k = numpy.asarray(errors, dtype=numpy.float64)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        p = k / n
+        denominator = 1 + z**2 / n
+        centre = (p + z**2 / (2 * n)) / denominator
+        half_width = z * numpy.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+
+    empty = n == 0
+    lower = numpy.where(empty, 0.0, numpy.clip(centre - half_width, 0.0, 1.0))
+    upper = numpy.where(empty, 1.0, numpy.clip(centre + half_width, 0.0, 1.0))
+    return lower, upper
+
+_lgamma = numpy.vectorize(math.lgamma, otypes=[numpy.float64])
+
+def _beta_continued_fraction(
+        a: numpy.ndarray,
+        b: numpy.ndarray,
+        x: numpy.ndarray,
+        max_iterations: int = 100_000,
+        epsilon: float = 1e-14
+) -> numpy.ndarray:
+    # lentz's method for the incomplete beta continued fraction, converging
+    # quickly for x < (a + 1) / (a + b + 2)
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1, a - 1
+    c = numpy.ones_like(x)
+    d = 1 - qab * x / qap
+    d = 1 / numpy.where(numpy.abs(d) < tiny, tiny, d)
+    h = d.copy()
+    for m in range(1, max_iterations + 1):
+        m2 = 2 * m
+        for aa in (
+            m * (b - m) * x / ((qam + m2) * (a + m2)),
+            -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        ):
+            d = 1 + aa * d
+            d = 1 / numpy.where(numpy.abs(d) < tiny, tiny, d)
+            c = 1 + aa / c
+            c = numpy.where(numpy.abs(c) < tiny, tiny, c)
+            delta = d * c
+            h = h * delta
+        if numpy.all(numpy.abs(delta - 1) < epsilon):
+            break
+    return h
+
+def incomplete_beta(
+        a: numpy.ndarray,
+        b: numpy.ndarray,
+        x: numpy.ndarray,
+        log_beta: numpy.ndarray | None = None
+) -> numpy.ndarray:
+    # regularised incomplete beta function I_x(a, b) for a, b > 0
+    a, b, x = numpy.broadcast_arrays(
+        numpy.asarray(a, dtype=numpy.float64),
+        numpy.asarray(b, dtype=numpy.float64),
+        numpy.asarray(x, dtype=numpy.float64)
+    )
+    if log_beta is None:
+        log_beta = _lgamma(a) + _lgamma(b) - _lgamma(a + b)
+    # the fraction is evaluated on whichever side converges, using
+    # I_x(a, b) = 1 - I_(1-x)(b, a)
+    swap = x > (a + 1) / (a + b + 2)
+    a, b, x = numpy.where(swap, b, a), numpy.where(swap, a, b), numpy.where(swap, 1 - x, x)
+    inside = (x > 0) & (x < 1)
+    safe_x = numpy.where(inside, x, 0.5)
+    with numpy.errstate(divide='ignore'):
+        front = numpy.exp(
+            a * numpy.log(safe_x) + b * numpy.log1p(-safe_x) - log_beta
+        ) / a
+    value = numpy.where(
+        inside,
+        front * _beta_continued_fraction(a=a, b=b, x=safe_x),
+        numpy.where(x >= 1, 1.0, 0.0)
+    )
+    return numpy.where(swap, 1 - value, value)
+
+def beta_quantile(
+        a: numpy.ndarray,
+        b: numpy.ndarray,
+        q: float | numpy.ndarray,
+        iterations: int = 60
+) -> numpy.ndarray:
+    # inverse of incomplete_beta in x by bisection, which is monotonic and
+    # needs no derivative; 60 halvings reach double precision
+    a, b, q = numpy.broadcast_arrays(
+        numpy.asarray(a, dtype=numpy.float64),
+        numpy.asarray(b, dtype=numpy.float64),
+        numpy.asarray(q, dtype=numpy.float64)
+    )
+    log_beta = _lgamma(a) + _lgamma(b) - _lgamma(a + b)
+    lo = numpy.zeros_like(a)
+    hi = numpy.ones_like(a)
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        below = incomplete_beta(a=a, b=b, x=mid, log_beta=log_beta) < q
+        lo = numpy.where(below, mid, lo)
+        hi = numpy.where(below, hi, mid)
+    return (lo + hi) / 2
+
+def clopper_pearson_interval(
+        errors: numpy.ndarray,
+        totals: numpy.ndarray,
+        confidence: float = 0.95
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # exact intervals from beta quantiles, with undefined shapes (no errors
+    # or no successes) replaced before the solve and masked after
+    alpha = 1 - confidence
+    n = numpy.asarray(totals, dtype=numpy.float64)
+    k = numpy.asarray(errors, dtype=numpy.float64)
+    n, k = numpy.broadcast_arrays(n, k)
+
+    has_lower = (k > 0) & (n > 0)
+    has_upper = (k < n) & (n > 0)
+    lower = numpy.where(
+        has_lower,
+        beta_quantile(
+            a=numpy.where(has_lower, k, 1),
+            b=numpy.where(has_lower, n - k + 1, 1),
+            q=alpha / 2
+        ),
+        0.0
+    )
+    upper = numpy.where(
+        has_upper,
+        beta_quantile(
+            a=numpy.where(has_upper, k + 1, 1),
+            b=numpy.where(has_upper, n - k, 1),
+            q=1 - alpha / 2
+        ),
+        1.0
+    )
+    return lower, upper
+
+def error_rate(
+        errors: numpy.ndarray,
+        totals: numpy.ndarray,
+        interval: Interval = Interval.WILSON,
+        confidence: float = 0.95
+) -> Estimate:
+    errors = numpy.asarray(errors)
+    totals = numpy.asarray(totals)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        value = errors / totals
+
+    match interval:
+        case Interval.WILSON:
+            lower, upper = wilson_interval(
+                errors=errors,
+                totals=totals,
+                confidence=confidence
+            )
+        case Interval.CLOPPER_PEARSON:
+            lower, upper = clopper_pearson_interval(
+                errors=errors,
+                totals=totals,
+                confidence=confidence
+            )
+        case _:
+            raise ValueError(f'Error: Unsupported interval {interval}')
+
+    return Estimate(
+        value=value,
+        lower=lower,
+        upper=upper,
+        errors=errors,
+        totals=totals
+    )
+
+def qber(
+        coincidences: numpy.ndarray,
+        interval: Interval = Interval.WILSON,
+        confidence: float = 0.95
+) -> Estimate:
+    # coincidences has shape (..., 4) ordered HH, HV, VH, VV
+    coincidences = numpy.asarray(coincidences)
+    return error_rate(
+        errors=coincidences[..., HV] + coincidences[..., VH],
+        totals=coincidences.sum(axis=-1),
+        interval=interval,
+        confidence=confidence
+    )
+
+def qx(
+        coincidences: numpy.ndarray,
+        interval: Interval = Interval.WILSON,
+        confidence: float = 0.95
+) -> Estimate:
+    # coincidences has shape (..., 4) ordered DD, DA, AD, AA
+    coincidences = numpy.asarray(coincidences)
+    return error_rate(
+        errors=coincidences[..., DA] + coincidences[..., AD],
+        totals=coincidences.sum(axis=-1),
+        interval=interval,
+        confidence=confidence
+    )
+
+def rolling_sum(counts: numpy.ndarray, window: int) -> numpy.ndarray:
+    # sums each run of `window` consecutive rows, so short windows can be
+    # pooled into longer integrations without a python loop
+    counts = numpy.asarray(counts)
+    cumulative = numpy.cumsum(counts, axis=0, dtype=numpy.int64)
+    cumulative = numpy.concatenate(
+        (numpy.zeros((1,) + counts.shape[1:], dtype=numpy.int64), cumulative)
+    )
+    return cumulative[window:] - cumulative[:-window]
+
+if __name__ == '__main__':
+    rng = numpy.random.default_rng(seed=0)
+    z_counts = rng.multinomial(1000, [0.48, 0.02, 0.02, 0.48], size=10000)
+    x_counts = rng.multinomial(1000, [0.47, 0.03, 0.03, 0.47], size=10000)
+
+    z = qber(coincidences=rolling_sum(counts=z_counts, window=10))
+    x = qx(coincidences=rolling_sum(counts=x_counts, window=10))
+    print(f'QBER {z.value.mean():.4f} [{z.lower.mean():.4f}, {z.upper.mean():.4f}]')
+    print(f'Qx {x.value.mean():.4f} [{x.lower.mean():.4f}, {x.upper.mean():.4f}]')
+
+    z = qber(
+        coincidences=rolling_sum(counts=z_counts[:1000], window=10),
+        interval=Interval.CLOPPER_PEARSON
+    )
+    print(f'QBER {z.value.mean():.4f} [{z.lower.mean():.4f}, {z.upper.mean():.4f}] clopper pearson')
@@ -12,7 +12,11 @@ sys.path.append(
         os.path.pardir
     ))
 )
-from quTAG import QuTAG_HR
+# BB84_FAKE_DRIVERS=1 swaps in the pure-python stand-in for benchmarking
+if os.environ.get('BB84_FAKE_DRIVERS'):
+    from bb84.fake import QuTAG_HR
+else:
+    from quTAG import QuTAG_HR
 
 class Qutag(timetagger.TimeTagger):
     def __init__(self) -> None:
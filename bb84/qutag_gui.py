@@ -40,8 +40,12 @@ class MainWindow(Adw.ApplicationWindow):
 
     def on_close_request(self, window: Adw.ApplicationWindow) -> bool:
         try:
+            stopped = self.timetagger_box.stop()
             if type(self.timetagger_box.timetagger) == qutag.Qutag:
-                self.timetagger_box.timetagger._qutag.deInitialize()
+                if stopped:
+                    self.timetagger_box.timetagger._qutag.deInitialize()
+                else:
+                    print('Error: QuTAG still measuring, not deinitialised')
         except Exception as e:
             print('Error: QuTAG already disconnected')
         return False
@@ -0,0 +1,120 @@
+import struct
+import time
+import pathlib
+import typing
+
+from . import timetagger
+
+# each frame is (capture time, payload length) followed by RawData.serialise()
+FRAME_HEADER = '!dI'
+
+class RecordingTimeTagger(timetagger.TimeTagger):
+    def __init__(
+            self,
+            tt: timetagger.TimeTagger,
+            path: str | pathlib.Path
+    ) -> None:
+        self.timetagger = tt
+        self.device_info = tt.device_info
+        self.channel_map = tt.channel_map
+        self.path = pathlib.Path(path)
+        self._file = open(file=self.path, mode='ab')
+
+    def measure(self, seconds: int = 1) -> timetagger.RawData:
+        raw_data = self.timetagger.measure(seconds=seconds)
+        payload = raw_data.serialise()
+        self._file.write(
+            struct.pack(FRAME_HEADER, time.time(), len(payload)) + payload
+        )
+        self._file.flush()
+        return raw_data
+
+    def disconnect(self) -> None:
+        self._file.close()
+        self.timetagger.disconnect()
+
+def read_frames(
+        path: str | pathlib.Path
+) -> typing.Iterator[tuple[float, timetagger.RawData]]:
+    header_size = struct.calcsize(FRAME_HEADER)
+    with open(file=path, mode='rb') as file:
+        while True:
+            header = file.read(header_size)
+            if len(header) < header_size:
+                return
+            capture_time, payload_size = struct.unpack(FRAME_HEADER, header)
+            payload = file.read(payload_size)
+            if len(payload) < payload_size:
+                return
+            yield capture_time, timetagger.RawData.deserialise(payload=payload)
+
+class ReplayTimeTagger(timetagger.TimeTagger):
+    def __init__(
+            self,
+            path: str | pathlib.Path,
+            speed: float | None = 1.0,
+            loop: bool = True
+    ) -> None:
+        # speed=None replays as fast as possible
+        self.path = pathlib.Path(path)
+        self.speed = speed
+        self.loop = loop
+        self.device_info = timetagger.DeviceInfo(
+            manufacturer='Replay',
+            model='Recording',
+            serial_number=self.path.name,
+            firmware_version='N/A'
+        )
+
+        self._frames = read_frames(path=self.path)
+        self._previous_capture_time = None
+        self._previous_replay_time = None
+
+    def measure(self, seconds: int = 1) -> timetagger.RawData:
+        # EOFError once a recording played without loop has run out, and
+        # ValueError for a recording with no frames at all
+        try:
+            capture_time, raw_data = next(self._frames)
+        except StopIteration:
+            if not self.loop:
+                raise EOFError(f'End of recording {self.path}') from None
+            self._frames = read_frames(path=self.path)
+            self._previous_capture_time = None
+            capture_time, raw_data = next(self._frames, (None, None))
+            if raw_data is None:
+                raise ValueError(f'Recording {self.path} has no frames') from None
+
+        if self.speed is not None and self._previous_capture_time is not None:
+            due = self._previous_replay_time + (
+                capture_time - self._previous_capture_time
+            ) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self._previous_capture_time = capture_time
+        self._previous_replay_time = time.monotonic()
+        raw_data.channel_map = self.channel_map
+        return raw_data
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = pathlib.Path(directory, 'recording.bin')
+        recorder = RecordingTimeTagger(tt=timetagger.TimeTagger(), path=path)
+        for _ in range(100):
+            recorder.measure()
+        recorder.disconnect()
+
+        replay = ReplayTimeTagger(path=path, speed=None, loop=False)
+        start = time.perf_counter()
+        n_frames = 0
+        while True:
+            try:
+                replay.measure().data
+            except EOFError:
+                break
+            n_frames += 1
+        elapsed = time.perf_counter() - start
+        print(f'replayed {n_frames} frames in {elapsed:.3f} s')
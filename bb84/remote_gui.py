@@ -44,6 +44,8 @@ class MainWindow(Adw.ApplicationWindow):
             main_box.append(child=self.timetagger_box)
 
     def on_close_request(self, window: Adw.ApplicationWindow) -> bool:
+        if hasattr(self, 'timetagger_box'):
+            self.timetagger_box.stop()
         # try:
         #     if type(self.timetagger_box.timetagger) == qutag.Qutag:
         #         self.timetagger_box.timetagger._qutag.deInitialize()
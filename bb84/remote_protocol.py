@@ -6,10 +6,12 @@ class Command(enum.IntEnum):
     MEASURE_ONCE = 2
     START_MEASURING = 3
     STOP_MEASURING = 4
+    CHANNEL_MAP = 5
 
 class Response(enum.IntEnum):
     ERROR = 0
     DEVICE_INFO = 1
     RAWDATA = 2
     STATUS = 3
-    TIME = 4
\ No newline at end of file
+    TIME = 4
+    CHANNEL_MAP = 5
\ No newline at end of file
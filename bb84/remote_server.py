@@ -1,3 +1,4 @@
+import sys
 import socket
 import threading
 import struct
@@ -7,6 +8,7 @@ from . import remote_protocol
 from . import timetagger
 from . import uqd
 from . import qutag
+from . import recording
 
 def pack_status(message: str):
     b = message.encode()
@@ -29,7 +31,13 @@ def handle_client(
                     break
 
                 command = struct.unpack('I', cmd_data)[0]
-                match remote_protocol.Command(command):
+                try:
+                    command = remote_protocol.Command(command)
+                except ValueError:
+                    # commands from newer clients are answered with an error
+                    # rather than dropping the connection
+                    pass
+                match command:
                     case remote_protocol.Command.NETWORK_DELAY:
                         connection_time = str(time.time())
                         payload = struct.pack(
@@ -53,12 +61,28 @@ def handle_client(
                         )
                         connection.sendall(header + payload)
 
+                    case remote_protocol.Command.CHANNEL_MAP:
+                        payload = measurement_device.channel_map.serialise()
+                        header = struct.pack(
+                            'IB',
+                            len(payload) + 1,
+                            remote_protocol.Response.CHANNEL_MAP
+                        )
+                        connection.sendall(header + payload)
+
                     case remote_protocol.Command.MEASURE_ONCE:
-                        payload = measurement_device.measure().serialise()
+                        try:
+                            payload = measurement_device.measure().serialise()
+                            response = remote_protocol.Response.RAWDATA
+                        except Exception as e:
+                            # e.g. a replay that has run out; the client is
+                            # told rather than left waiting
+                            payload = pack_status(message=f'Measure failed: {e}')
+                            response = remote_protocol.Response.ERROR
                         header = struct.pack(
                             'IB',
                             len(payload) + 1,
-                            remote_protocol.Response.RAWDATA
+                            response
                         )
                         connection.sendall(header + payload)
 
@@ -102,8 +126,14 @@ def start_server(
             case uqd.UQD:
                 print(f'UQD server listening on {host}:{port}')
 
-            # case qutag.Qutag:
-            #     print(f'Qutag server listening on {host}:{port}')
+            case qutag.Qutag:
+                print(f'Qutag server listening on {host}:{port}')
+
+            case recording.RecordingTimeTagger:
+                print(f'Recording server to {measurement_device.path} listening on {host}:{port}')
+
+            case recording.ReplayTimeTagger:
+                print(f'Replay server for {measurement_device.path} listening on {host}:{port}')
 
             case _:
                 print('Unknown device')
@@ -122,5 +152,13 @@ def start_server(
 if __name__ == '__main__':
     # measurement_device = timetagger.TimeTagger()
     # measurement_device = uqd.UQD()
-    measurement_device = qutag.Qutag()
+    # measurement_device = qutag.Qutag()
+    # measurement_device = recording.RecordingTimeTagger(
+    #     tt=qutag.Qutag(),
+    #     path='qutag_recording.bin'
+    # )
+    if len(sys.argv) > 1:
+        measurement_device = recording.ReplayTimeTagger(path=sys.argv[1])
+    else:
+        measurement_device = qutag.Qutag()
     start_server()
\ No newline at end of file
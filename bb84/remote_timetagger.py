@@ -21,17 +21,23 @@ class Timetagger(timetagger.TimeTagger):
     def __init__(
             self,
             host: str,
-            port: int
+            port: int,
+            probe_timeout: float = 2.0
     ) -> None:
         self.host = host
         self.port = port
+        self.probe_timeout = probe_timeout
 
+        self._connect()
+        self._get_device_info()
+        self._get_channel_map()
+
+    def _connect(self) -> None:
         self._sock = socket.socket(
             socket.AF_INET,
             socket.SOCK_STREAM
         )
         self._sock.connect((self.host, self.port))
-        self._get_device_info()
 
     def __del__(self) -> None:
         self.disconnect()
@@ -42,9 +48,17 @@ class Timetagger(timetagger.TimeTagger):
         )
         resp_type, payload = self._receive_response()
         if resp_type == remote_protocol.Response.RAWDATA:
-            return timetagger.RawData.deserialise(
+            raw_data = timetagger.RawData.deserialise(
                 payload=payload
             )
+            raw_data.channel_map = self.channel_map
+            return raw_data
+        elif resp_type == remote_protocol.Response.ERROR:
+            print('Error:', parse_status(payload=payload))
+            return timetagger.RawData(
+                timetags=numpy.empty(0),
+                channels=numpy.empty(0)
+            )
         else:
             print('Unexpected response:', resp_type)
             return timetagger.RawData(
@@ -77,6 +91,28 @@ class Timetagger(timetagger.TimeTagger):
         else:
             print('Unexpected response:', resp_type)
 
+    def _get_channel_map(self) -> None:
+        # older servers do not advertise a map: they either answer with an
+        # error, or drop the connection or never answer, in which case a
+        # fresh connection is made
+        self.channel_map = timetagger.DEFAULT_CHANNEL_MAP
+        self._sock.settimeout(self.probe_timeout)
+        try:
+            self._send_command(
+                command=remote_protocol.Command.CHANNEL_MAP
+            )
+            resp_type, payload = self._receive_response()
+        except (ConnectionError, TimeoutError):
+            self._sock.close()
+            self._connect()
+            return
+        finally:
+            self._sock.settimeout(None)
+        if resp_type == remote_protocol.Response.CHANNEL_MAP:
+            self.channel_map = timetagger.ChannelMap.deserialise(
+                payload=payload
+            )
+
     def _send_command(
             self,
             command: remote_protocol.Command
@@ -1,4 +1,5 @@
 import dataclasses
+import functools
 import typing
 import math
 import struct
@@ -27,6 +28,8 @@ C_780_A = 7
 C_780_R = None
 C_780_L = None
 
+BASES = ('H', 'V', 'D', 'A', 'R', 'L')
+
 @dataclasses.dataclass
 class DeviceInfo:
     manufacturer: str = 'N/A'
@@ -62,10 +65,145 @@ class DeviceInfo:
             fields.append(value)
         return DeviceInfo(*fields)
 
+@dataclasses.dataclass
+class ChannelMap:
+    wavelengths: dict[int, dict[str, int | None]]
+    primary: int | None = None
+
+    def __post_init__(self) -> None:
+        self.wavelengths = {
+            int(wavelength): {
+                basis: mapping.get(basis) for basis in BASES
+            } for wavelength, mapping in self.wavelengths.items()
+        }
+        if self.primary is None:
+            self.primary = next(iter(self.wavelengths))
+
+        # index arrays are built once so every frame is reduced by one gather
+        self._wavelength_list = list(self.wavelengths)
+        channels = numpy.array(
+            object=[
+                [-1 if c is None else c for c in mapping.values()]
+                for mapping in self.wavelengths.values()
+            ],
+            dtype=numpy.int64
+        ).reshape(-1, len(BASES))
+        self._present = channels >= 0
+        self.minlength = int(channels.max(initial=-1)) + 2
+        self._index = numpy.where(self._present, channels, self.minlength - 1)
+        self._pairs = self._present[:, 0::2] & self._present[:, 1::2]
+
+        for wavelength, pairs in zip(self._wavelength_list, self._pairs):
+            if numpy.count_nonzero(~pairs) > 1:
+                raise ValueError(
+                    f'Error: Unsupported basis setup for {wavelength} nm {self.wavelengths[wavelength]}'
+                )
+
+    def channel(self, wavelength: int, basis: str) -> int | None:
+        return self.wavelengths[wavelength][basis]
+
+    def counts(self, singles: numpy.ndarray) -> numpy.ndarray:
+        # padded slot at minlength - 1 stays zero for missing detectors
+        padded = numpy.zeros(max(len(singles) + 1, self.minlength), dtype=numpy.int64)
+        padded[:len(singles)] = singles
+        padded[self.minlength - 1] = 0
+        return padded[self._index]
+
+    def wavelength_counts(self, singles: numpy.ndarray, wavelength: int) -> numpy.ndarray:
+        return self.counts(singles=singles)[self._wavelength_list.index(wavelength)]
+
+    def stokes(self, singles: numpy.ndarray) -> numpy.ndarray:
+        counts = self.counts(singles=singles).astype(numpy.float64)
+        plus = counts[:, 0::2]
+        minus = counts[:, 1::2]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            stokes = numpy.where(self._pairs, (plus - minus)/(plus + minus), 0.0)
+
+        # a single unmeasured basis is recovered assuming a fully polarised state
+        squares = numpy.sum(numpy.where(self._pairs, stokes**2, 0.0), axis=1)
+        recovered = numpy.sqrt(numpy.clip(1 - squares, 0.0, None))
+        return numpy.where(self._pairs, stokes, recovered[:, None])
+
+    def to_data(self, singles: numpy.ndarray) -> dict[int, 'Data']:
+        return {
+            wavelength: Data.from_stokes(*stokes)
+            for wavelength, stokes in zip(
+                self._wavelength_list,
+                self.stokes(singles=singles)
+            )
+        }
+
+    def serialise(self) -> bytes:
+        payload = struct.pack('!II', len(self.wavelengths), self.primary)
+        for wavelength, mapping in self.wavelengths.items():
+            payload += struct.pack(
+                f'!I{len(BASES)}h',
+                wavelength,
+                *[-1 if c is None else c for c in mapping.values()]
+            )
+        return payload
+
+    @classmethod
+    def deserialise(cls, payload: bytes) -> 'ChannelMap':
+        n_wavelengths, primary = struct.unpack_from('!II', payload, 0)
+        offset = struct.calcsize('!II')
+        entry_format = f'!I{len(BASES)}h'
+        wavelengths = {}
+        for _ in range(n_wavelengths):
+            wavelength, *channels = struct.unpack_from(entry_format, payload, offset)
+            offset += struct.calcsize(entry_format)
+            wavelengths[wavelength] = {
+                basis: None if c < 0 else c for basis, c in zip(BASES, channels)
+            }
+        return ChannelMap(wavelengths=wavelengths, primary=primary)
+
 @dataclasses.dataclass
 class RawData:
     timetags: numpy.ndarray
     channels: numpy.ndarray
+    channel_map: ChannelMap | None = dataclasses.field(
+        default=None,
+        repr=False,
+        compare=False
+    )
+    _coincidences: dict = dataclasses.field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+        compare=False
+    )
+
+    # derived quantities are computed on first access and cached on the frame,
+    # so every widget and controller reading the same frame shares one reduction
+    @functools.cached_property
+    def singles(self) -> numpy.ndarray:
+        return numpy.bincount(self.channels, minlength=8)
+
+    @functools.cached_property
+    def polarisation(self) -> dict[int, 'Data']:
+        channel_map = self.channel_map or DEFAULT_CHANNEL_MAP
+        return channel_map.to_data(singles=self.singles)
+
+    @functools.cached_property
+    def data(self) -> 'Data':
+        channel_map = self.channel_map or DEFAULT_CHANNEL_MAP
+        return self.polarisation[channel_map.primary]
+
+    def coincidences(
+            self,
+            channel_a: int,
+            channel_b: int,
+            window: int,
+            delay: int = 0
+    ) -> int:
+        key = (channel_a, channel_b, window, delay)
+        if key not in self._coincidences:
+            tags_a = self.timetags[self.channels == channel_a]
+            tags_b = self.timetags[self.channels == channel_b] - delay
+            lo = numpy.searchsorted(tags_b, tags_a - window, side='left')
+            hi = numpy.searchsorted(tags_b, tags_a + window, side='right')
+            self._coincidences[key] = int(numpy.sum(hi - lo))
+        return self._coincidences[key]
 
     def serialise(self) -> bytes:
         n_data_points = len(self.timetags)
@@ -110,34 +248,11 @@ class Data:
 
     @classmethod
     def from_raw_data(cls, raw_data: RawData) -> 'Data':
-        singles = numpy.bincount(raw_data.channels, minlength=8)
-
-        with numpy.errstate(invalid='ignore'):
-            try:
-                s1 = float((singles[C_780_H] - singles[C_780_V])/(singles[C_780_H] + singles[C_780_V]))
-            except:
-                s1 = None
-            try:
-                s2 = float((singles[C_780_D] - singles[C_780_A])/(singles[C_780_D] + singles[C_780_A]))
-            except:
-                s2 = None
-            try:
-                s3 = float((singles[C_780_R] - singles[C_780_L])/(singles[C_780_R] + singles[C_780_L]))
-            except:
-                s3 = None
-
-        match (s1, s2, s3):
-            case (float(), None, float()):
-                s2 = math.sqrt(1 - s1**2 - s3**2)
-
-            case (None, float(), float()):
-                s1 = math.sqrt(1 - s2**2 - s3**2)
-
-            case (float(), float(), None):
-                s3 = math.sqrt(1 - s1**2 - s2**2)
-
-            case _:
-                raise TypeError(f'Error: Unsupported basis setup {(type(s1), type(s2), type(s3))}')
+        return raw_data.data
+
+    @classmethod
+    def from_stokes(cls, s1: float, s2: float, s3: float) -> 'Data':
+        s1, s2, s3 = float(s1), float(s2), float(s3)
 
         try:
             eta = math.asin(s3)/2
@@ -156,7 +271,25 @@ class Data:
             normalised_s3=s3
         )
 
+DEFAULT_CHANNEL_MAP = ChannelMap(
+    wavelengths={
+        780: {
+            'H': C_780_H, 'V': C_780_V,
+            'D': C_780_D, 'A': C_780_A,
+            'R': C_780_R, 'L': C_780_L
+        },
+        1550: {
+            'H': C_1550_H, 'V': C_1550_V,
+            'D': C_1550_D, 'A': C_1550_A,
+            'R': C_1550_R, 'L': C_1550_L
+        }
+    },
+    primary=780
+)
+
 class TimeTagger:
+    channel_map = DEFAULT_CHANNEL_MAP
+
     def __init__(self) -> None:
         self.device_info = DeviceInfo()
 
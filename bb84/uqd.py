@@ -2,33 +2,39 @@ import sys
 import os
 import pathlib
 
-os.environ['TTAG'] = str(pathlib.Path(
-    os.environ['HOME'],
-    'Projects',
-    'polarisation_compensation',
-    'ttag',
-    'python'
-))
-os.environ['TIMETAG'] = str(pathlib.Path(
-    os.environ['HOME'],
-    'Projects',
-    'polarisation_compensation',
-    'timetag',
-    'python'
-))
-
 sys.path.append(
     os.path.abspath(os.path.join(
         os.path.dirname(__file__),
         os.path.pardir
     ))
 )
+import numpy
+
 import bb84.timetagger as timetagger
-import ttag.python.ttag as ttag
-import timetag.python.timetag as timetag
+
+# BB84_FAKE_DRIVERS=1 swaps in the pure-python stand-in for benchmarking
+if os.environ.get('BB84_FAKE_DRIVERS'):
+    from bb84.fake import ttag
+else:
+    os.environ['TTAG'] = str(pathlib.Path(
+        os.environ['HOME'],
+        'Projects',
+        'polarisation_compensation',
+        'ttag',
+        'python'
+    ))
+    os.environ['TIMETAG'] = str(pathlib.Path(
+        os.environ['HOME'],
+        'Projects',
+        'polarisation_compensation',
+        'timetag',
+        'python'
+    ))
+    import ttag.python.ttag as ttag
+    import timetag.python.timetag as timetag
 
 class UQD(timetagger.TimeTagger):
-    def __init__(self) -> None:
+    def __init__(self, capacity: int = 2**24) -> None:
         self._uqd = ttag.TTBuffer(buffernumber=ttag.getfreebuffer()-1)
         # self._uqd = timetag.CTimeTag()
 
@@ -40,23 +46,104 @@ class UQD(timetagger.TimeTagger):
             firmware_version = 'N/A'
         )
 
+        # preallocated window buffer, compacted in place when full; measure
+        # hands out copies, so frames held by callers are never overwritten
+        self._capacity = capacity
+        self._timetags = numpy.empty(capacity, dtype=numpy.int64)
+        self._channels = numpy.empty(capacity, dtype=numpy.uint8)
+        self._start = 0
+        self._end = 0
+        # measure and read_new each keep their own place in the ring buffer,
+        # so mixing the two never loses tags from either
+        self._read_position = None
+        self._new_position = None
+
         # self._uqd.Open()
 
     # def __del__(self) -> None:
         # if self._uqd.IsOpen():
         #     self._uqd.Close()
 
+    def read_new(self) -> timetagger.RawData:
+        # tags that arrived since the last read_new call, in O(new tags)
+        raw_data, self._new_position = self._read_since(position=self._new_position)
+        return raw_data
+
+    def _read_since(self, position: int | None) -> tuple[timetagger.RawData, int]:
+        datapoints = self._uqd.datapoints
+        if position is None:
+            position = datapoints
+        # anything older than the ring buffer size has already been overwritten
+        start = max(position, datapoints - self._uqd.size)
+        if start >= datapoints:
+            return timetagger.RawData(
+                timetags=numpy.empty(0, dtype=numpy.int64),
+                channels=numpy.empty(0, dtype=numpy.uint8)
+            ), datapoints
+
+        channels, timetags = self._uqd[start:datapoints]
+        return timetagger.RawData(
+            timetags=numpy.asarray(timetags, dtype=numpy.int64),
+            channels=numpy.asarray(channels, dtype=numpy.uint8)
+        ), datapoints
+
     def measure(self, seconds: int = 1) -> timetagger.RawData:
+        # only new tags are read from the device, but the returned window is a
+        # copy, so a call still costs O(window); the window buffer is compacted
+        # in place, which would change a view under a caller holding the frame.
+        # read_new is the O(new tags) path
         # self._uqd.StartTimetags()
         # channels, timetags = self._uqd.ReadTags()
-        channels, timetags = self._uqd(seconds)
-        channels, timetags = self._uqd()
+        if self._read_position is None:
+            # seed the window once from everything still in the ring buffer,
+            # read up to a fixed count so tags arriving meanwhile are left for
+            # the next call; afterwards only new tags are copied
+            datapoints = self._uqd.datapoints
+            channels, timetags = self._uqd[max(datapoints - self._uqd.size, 0):datapoints]
+            self._read_position = datapoints
+            self._append(
+                timetags=numpy.asarray(timetags, dtype=numpy.int64),
+                channels=numpy.asarray(channels, dtype=numpy.uint8)
+            )
+        else:
+            new, self._read_position = self._read_since(position=self._read_position)
+            self._append(timetags=new.timetags, channels=new.channels)
+
+        timetags = self._timetags
+        if self._end > self._start:
+            window = int(seconds / self._uqd.resolution)
+            self._start += int(numpy.searchsorted(
+                timetags[self._start:self._end],
+                timetags[self._end - 1] - window,
+                side='left'
+            ))
+
         raw_data = timetagger.RawData(
-            timetags=timetags,
-            channels=channels
+            timetags=timetags[self._start:self._end].copy(),
+            channels=self._channels[self._start:self._end].copy()
         )
         # self._uqd.StopTimetags()
         return raw_data
+
+    def _append(self, timetags: numpy.ndarray, channels: numpy.ndarray) -> None:
+        n = len(timetags)
+        if n > self._capacity:
+            timetags = timetags[-self._capacity:]
+            channels = channels[-self._capacity:]
+            n = self._capacity
+            self._start = self._end
+
+        if self._end + n > self._capacity:
+            # numpy copies through a temporary when source and target overlap
+            kept = min(self._end - self._start, self._capacity - n)
+            self._timetags[:kept] = self._timetags[self._end - kept:self._end]
+            self._channels[:kept] = self._channels[self._end - kept:self._end]
+            self._start = 0
+            self._end = kept
+
+        self._timetags[self._end:self._end + n] = timetags
+        self._channels[self._end:self._end + n] = channels
+        self._end += n
     
 if __name__ == '__main__':
     tt = UQD()
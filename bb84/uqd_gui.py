@@ -43,6 +43,7 @@ class MainWindow(Adw.ApplicationWindow):
 
     def on_close_request(self, window: Adw.ApplicationWindow) -> bool:
         try:
+            self.timetagger_box.stop()
             if type(self.timetagger_box.timetagger) == uqd.UQD:
                 # self.timetagger_box.timetagger._uqd.deInitialize()
                 pass
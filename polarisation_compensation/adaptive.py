@@ -0,0 +1,226 @@
+import dataclasses
+import math
+
+import numpy
+
+@dataclasses.dataclass(frozen=True)
+class Estimate:
+    sequence: int
+    azimuth: float
+    ellipticity: float
+    normalised_s1: float
+    normalised_s2: float
+    normalised_s3: float
+    # standard error of the estimate in degrees of azimuth/ellipticity
+    uncertainty: float
+    n_samples: int
+
+class AdaptiveIntegrator:
+    def __init__(
+            self,
+            min_samples: int = 1,
+            max_samples: int = 4,
+            confidence: float = 1.0,
+            smoothing: float = 0.05
+    ) -> None:
+        # averages consecutive snapshots into one estimate per control tick;
+        # few samples while the error is large against the noise or the
+        # polarisation is changing, more while it holds still, and errors
+        # under confidence * uncertainty are held rather than acted on
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.confidence = confidence
+        self.smoothing = smoothing
+        self.n_samples = min_samples
+
+        # per sample variance from successive differences, which ignores slow
+        # drift; only pairs taken with the plates still count, since a moving
+        # plate changes the output far more than the noise does. until the
+        # first still pair arrives any pair seeds it, which overestimates the
+        # noise, holds the plates, and so lets still pairs in
+        self.sample_variance = None
+        self._still = False
+        self._previous = None
+        self._previous_still = False
+        self._previous_estimate = None
+        self._stokes = []
+
+    def add(self, snapshot, moving: bool = False) -> Estimate | None:
+        # a sample taken while a plate moves is still averaged, but only feeds
+        # the seed variance
+        stokes = numpy.array((
+            snapshot.normalised_s1,
+            snapshot.normalised_s2,
+            snapshot.normalised_s3
+        ), dtype=numpy.float64)
+        if self._previous is not None:
+            variance = float(numpy.sum((stokes - self._previous) ** 2)) / 2
+            still = self._previous_still and not moving
+            if self.sample_variance is None or (still and not self._still):
+                self.sample_variance = variance
+                self._still = still
+            elif still or not self._still:
+                self.sample_variance += self.smoothing * (variance - self.sample_variance)
+        self._previous = stokes
+        self._previous_still = not moving
+        self._stokes.append(stokes)
+        if len(self._stokes) < self.n_samples:
+            return None
+
+        mean = numpy.mean(self._stokes, axis=0)
+        n_samples = len(self._stokes)
+        self._stokes = []
+        s1, s2, s3 = mean / numpy.linalg.norm(mean)
+        # a small step on the poincare sphere is twice the change in
+        # azimuth/ellipticity
+        uncertainty = math.degrees(math.sqrt((self.sample_variance or 0.0) / n_samples)) / 2
+        return Estimate(
+            sequence=snapshot.sequence,
+            azimuth=math.degrees(math.atan2(s2, s1) / 2),
+            ellipticity=math.degrees(math.asin(max(-1.0, min(1.0, s3))) / 2),
+            normalised_s1=float(s1),
+            normalised_s2=float(s2),
+            normalised_s3=float(s3),
+            uncertainty=uncertainty,
+            n_samples=n_samples
+        )
+
+    def significant(self, error: float, estimate: Estimate) -> bool:
+        return error > self.confidence * estimate.uncertainty
+
+    def adapt(self, error: float, estimate: Estimate) -> int:
+        # uncertainty falls as 1/sqrt(n), so aim for the sample count at which
+        # confidence * uncertainty just resolves the current error. an error
+        # lost in the noise only earns longer averaging while the estimate
+        # holds still: if it moved from the last one by more than their noise
+        # (twice the expected squared difference) the polarisation is
+        # changing, and averaging longer would only lag it, so halve instead
+        stokes = numpy.array((
+            estimate.normalised_s1,
+            estimate.normalised_s2,
+            estimate.normalised_s3
+        ))
+        previous, self._previous_estimate = self._previous_estimate, (stokes, estimate.n_samples)
+        if self.significant(error=error, estimate=estimate):
+            n_samples = math.ceil(
+                estimate.n_samples * (self.confidence * estimate.uncertainty / error) ** 2
+            )
+        elif previous is not None and float(numpy.sum((stokes - previous[0]) ** 2)) <= (
+                2 * (self.sample_variance or 0.0) * (1 / estimate.n_samples + 1 / previous[1])
+        ):
+            n_samples = 2 * estimate.n_samples
+        else:
+            n_samples = estimate.n_samples // 2
+        self.n_samples = max(self.min_samples, min(self.max_samples, n_samples))
+        return self.n_samples
+
+    def control_input(
+            self,
+            snapshot,
+            target_azimuth: float,
+            target_ellipticity: float,
+            moving: bool = False
+    ) -> tuple[float, float, tuple[float, float, float] | None] | None:
+        # azimuth, ellipticity and stokes to hand the controller, or None while
+        # samples are still being gathered; an error inside the noise is
+        # reported as on target with no stokes, so the controller holds still
+        estimate = self.add(snapshot=snapshot, moving=moving)
+        if estimate is None:
+            return None
+        error = max(
+            abs(target_azimuth - estimate.azimuth),
+            abs(target_ellipticity - estimate.ellipticity)
+        )
+        significant = self.significant(error=error, estimate=estimate)
+        self.adapt(error=error, estimate=estimate)
+        if not significant:
+            return target_azimuth, target_ellipticity, None
+        return (
+            estimate.azimuth,
+            estimate.ellipticity,
+            (estimate.normalised_s1, estimate.normalised_s2, estimate.normalised_s3)
+        )
+
+    def reset(self) -> None:
+        self.n_samples = self.min_samples
+        self._previous = None
+        self._previous_still = False
+        self._previous_estimate = None
+        self._stokes = []
+
+def control_input(
+        snapshot,
+        target_azimuth: float,
+        target_ellipticity: float,
+        integrator: AdaptiveIntegrator | None = None,
+        moving: bool = False
+) -> tuple[float, float, tuple[float, float, float] | None] | None:
+    # what a controller acts on for one bus snapshot: the snapshot itself, or
+    # the integrator's estimate when there is one; moving is whether any plate
+    # is moving as the snapshot arrives
+    if integrator is not None:
+        return integrator.control_input(
+            snapshot=snapshot,
+            target_azimuth=target_azimuth,
+            target_ellipticity=target_ellipticity,
+            moving=moving
+        )
+    return (
+        snapshot.azimuth,
+        snapshot.ellipticity,
+        (snapshot.normalised_s1, snapshot.normalised_s2, snapshot.normalised_s3)
+    )
+
+if __name__ == '__main__':
+    import sys
+    import os
+    import pathlib
+    import types
+
+    sys.path.append(
+        os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            os.path.pardir
+        ))
+    )
+    from polarisation_compensation import pol_compensation
+    from polarisation_compensation import simulator
+
+    rng = numpy.random.default_rng(seed=0)
+    integrator = AdaptiveIntegrator()
+    ticks = []
+    for sequence in range(2000):
+        # locked on the target, then a 2 degree azimuth step halfway through
+        angle = math.radians(4.0 if sequence >= 1000 else 0.0)
+        stokes = numpy.array((math.cos(angle), math.sin(angle), 0.0)) + rng.normal(scale=0.01, size=3)
+        estimate = integrator.add(snapshot=types.SimpleNamespace(
+            sequence=sequence,
+            normalised_s1=stokes[0],
+            normalised_s2=stokes[1],
+            normalised_s3=stokes[2]
+        ))
+        if estimate is None:
+            continue
+        error = max(abs(estimate.azimuth), abs(estimate.ellipticity))
+        ticks.append((sequence, estimate.n_samples))
+        integrator.adapt(error=error, estimate=estimate)
+    print(f'{len(ticks)} ticks for 2000 samples')
+    print('samples per tick around the step', [n for sequence, n in ticks if 900 <= sequence < 1100])
+
+    # a recorded pass through the simulator with measurement noise, tracking
+    # with the model based controller with and without the integrator
+    root = pathlib.Path(__file__).resolve().parent.parent
+    times, input_stokes = simulator.read_polarimeter_csv(
+        path=root / 'tests' / 'polarisation' / 'data' / 'sat_track.csv'
+    )
+    for noise in (0.01, 0.03):
+        for integrator in (None, AdaptiveIntegrator()):
+            result = simulator.simulate(
+                times=times,
+                input_stokes=input_stokes,
+                controller_class=pol_compensation.ModelController,
+                noise=noise,
+                integrator=integrator
+            )
+            label = 'adaptive' if integrator is not None else 'every sample'
+            print(f'noise {noise} {label}: {result.summary()}')
@@ -0,0 +1,56 @@
+import enum
+import dataclasses
+import struct
+
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 5004
+
+class Command(enum.IntEnum):
+    GET_STATE = 0
+    ENABLE_COMPENSATION = 1
+    DISABLE_COMPENSATION = 2
+    SET_TARGET = 3
+
+class Response(enum.IntEnum):
+    ERROR = 0
+    STATE = 1
+
+@dataclasses.dataclass
+class State:
+    enable_compensation: bool = False
+    target_azimuth: float = 0.0
+    target_ellipticity: float = 0.0
+    azimuth: float = 0.0
+    ellipticity: float = 0.0
+    normalised_s1: float = 0.0
+    normalised_s2: float = 0.0
+    normalised_s3: float = 0.0
+    timestamp: float = 0.0
+    n_ticks: int = 0
+    # set once measurements keep failing; compensation is held until one
+    # succeeds again
+    faulted: bool = False
+    n_failures: int = 0
+
+    _format = '!?8dQ?Q'
+
+    def serialise(self) -> bytes:
+        return struct.pack(
+            self._format,
+            self.enable_compensation,
+            self.target_azimuth,
+            self.target_ellipticity,
+            self.azimuth,
+            self.ellipticity,
+            self.normalised_s1,
+            self.normalised_s2,
+            self.normalised_s3,
+            self.timestamp,
+            self.n_ticks,
+            self.faulted,
+            self.n_failures
+        )
+
+    @classmethod
+    def deserialise(cls, payload: bytes) -> 'State':
+        return State(*struct.unpack(cls._format, payload))
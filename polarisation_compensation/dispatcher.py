@@ -0,0 +1,187 @@
+import threading
+import time
+
+import motor.base_motor as base_motor
+
+class DispatchedMotor:
+    def __init__(
+            self,
+            motor: base_motor.Motor,
+            status_interval: float = 0.05
+    ) -> None:
+        # jog, stop, move_by and move_to return at once and are sent from this
+        # motor's own thread, so several motors are commanded concurrently; a
+        # command still waiting when a newer one arrives is dropped, since only
+        # the latest intent matters. relative moves do not add up when dropped,
+        # so controllers should move_to an absolute position
+        self.motor = motor
+        self.device_info = motor.device_info
+        self.status_interval = status_interval
+        self.n_sent = 0
+        self.n_coalesced = 0
+
+        self._condition = threading.Condition()
+        # a remote motor is one socket, so every request to the device, from
+        # this thread or a caller reading position, takes this lock and its
+        # reply can not interleave with another's
+        self._device_lock = threading.Lock()
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        # is_moving is cached from the commands sent, and only read back from
+        # the motor while a point to point move is in flight
+        self._is_moving = motor.is_moving
+        self._awaiting_move = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def is_moving(self) -> bool:
+        with self._condition:
+            return self._is_moving or self._pending is not None or self._busy
+
+    @property
+    def direction(self) -> base_motor.MotorDirection:
+        with self._device_lock:
+            return self.motor.direction
+
+    @direction.setter
+    def direction(self, value: base_motor.MotorDirection) -> None:
+        with self._device_lock:
+            self.motor.direction = value
+
+    @property
+    def max_velocity(self) -> float:
+        with self._device_lock:
+            return self.motor.max_velocity
+
+    @property
+    def position(self) -> float:
+        with self._device_lock:
+            return self.motor.position
+
+    def jog(
+            self,
+            direction: base_motor.MotorDirection,
+            acceleration: float,
+            max_velocity: float
+    ) -> None:
+        self._submit(
+            'jog',
+            direction=direction,
+            acceleration=acceleration,
+            max_velocity=max_velocity
+        )
+
+    def move_by(self, angle: float) -> None:
+        self._submit('move_by', angle)
+
+    def move_to(self, position: float) -> None:
+        self._submit('move_to', position)
+
+    def stop(self) -> None:
+        self._submit('stop')
+
+    def _submit(self, name: str, *args, **kwargs) -> None:
+        with self._condition:
+            if self._pending is not None:
+                self.n_coalesced += 1
+            self._pending = (name, args, kwargs)
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        # True once every submitted command has been sent
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending is None and not self._busy,
+                timeout=timeout
+            )
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or self._pending is not None,
+                    timeout=self.status_interval if self._awaiting_move else None
+                )
+                if self._closed:
+                    return
+                command, self._pending = self._pending, None
+                self._busy = command is not None
+
+            if command is None:
+                with self._device_lock:
+                    is_moving = self.motor.is_moving
+                with self._condition:
+                    self._is_moving = is_moving
+                    self._awaiting_move = is_moving
+                continue
+
+            name, args, kwargs = command
+            try:
+                with self._device_lock:
+                    if name == 'move_to' and not hasattr(self.motor, 'move_to'):
+                        # relative to where the motor is as the command goes out
+                        self.motor.move_by(args[0] - self.motor.position)
+                    else:
+                        getattr(self.motor, name)(*args, **kwargs)
+            except Exception as e:
+                print(f'Error: {name} failed on {self.device_info.serial_number} {e}')
+            with self._condition:
+                self.n_sent += 1
+                self._is_moving = name != 'stop'
+                self._awaiting_move = name in ('move_by', 'move_to')
+                self._busy = False
+                self._condition.notify_all()
+
+def dispatch(
+        motor_list: list[base_motor.Motor],
+        cache: dict | None = None
+) -> list[DispatchedMotor]:
+    # reuses the wrappers in `cache` so each motor keeps a single command thread
+    if cache is None:
+        cache = {}
+    dispatched = []
+    for m in motor_list:
+        if id(m) not in cache:
+            cache[id(m)] = DispatchedMotor(motor=m)
+        dispatched.append(cache[id(m)])
+    return dispatched
+
+if __name__ == '__main__':
+    class SlowMotor:
+        def __init__(self, serial_number: str) -> None:
+            self.device_info = type('DeviceInfo', (), {'serial_number': serial_number})()
+            self.direction = base_motor.MotorDirection.IDLE
+            self.max_velocity = 0.0
+            self.is_moving = False
+
+        def jog(self, direction, acceleration, max_velocity) -> None:
+            time.sleep(0.05)
+            self.is_moving = True
+
+        def stop(self) -> None:
+            time.sleep(0.05)
+            self.is_moving = False
+
+    motors = dispatch(motor_list=[SlowMotor('qwp'), SlowMotor('hwp')])
+    start = time.perf_counter()
+    for _ in range(20):
+        for m in motors:
+            m.jog(direction=base_motor.MotorDirection.FORWARD, acceleration=20.0, max_velocity=25.0)
+            m.stop()
+    submitted = time.perf_counter() - start
+    for m in motors:
+        m.wait_idle()
+    elapsed = time.perf_counter() - start
+    print(
+        f'submitted in {submitted * 1000:.1f} ms, idle after {elapsed * 1000:.0f} ms, '
+        f'sent {[m.n_sent for m in motors]}, coalesced {[m.n_coalesced for m in motors]}'
+    )
@@ -0,0 +1,516 @@
+import sys
+import os
+import dataclasses
+import datetime
+import pathlib
+import time
+import typing
+
+import numpy
+
+import motor.base_motor as base_motor
+
+sys.path.append(
+    os.path.abspath(os.path.join(
+        os.path.dirname(__file__),
+        os.path.pardir
+    ))
+)
+from polarisation_compensation import pol_compensation
+from polarisation_compensation import mueller
+
+# columns of the mount logger's rows, as in tests/hogs/data/scope logs format.txt
+SCOPE_LOG_COLUMNS = (
+    'utc_time',
+    'local_time',
+    'julian_date',
+    'sun_alt_degs',
+    'pointxp_num_points',
+    'pointxp_rms',
+    'mount_is_connected',
+    'tele_ra_2000',
+    'tele_dec_2000',
+    'is_tracking',
+    'comm_loop_mean_msec',
+    'axis0_enabled',
+    'axis0_pos_degs',
+    'axis0_dist_target_arcsec',
+    'axis0_servo_error_arcsec',
+    'axis0_current_amps',
+    'axis0_has_error',
+    'axis0_error_description',
+    'axis1_enabled',
+    'axis1_pos_degs',
+    'axis1_dist_target_arcsec',
+    'axis1_servo_error_arcsec',
+    'axis1_current_amps',
+    'axis1_has_error',
+    'axis1_error_description',
+    'rotator_enabled',
+    'rotator_mech_pos_degs',
+    'rotator_field_angle_degs',
+    'rotator_current_pct',
+    'rotator_errors',
+    'focuser_enabled',
+    'focuser_position',
+    'focuser_power',
+    'focuser_errors',
+    'ra_offset_arcsec',
+    'dec_offset_arcsec',
+)
+_COLUMN_INDEX = {name: i for i, name in enumerate(SCOPE_LOG_COLUMNS)}
+
+# mount state is (axis0, axis1, rotator) in degrees, the columns the model
+# learns from
+STATE_COLUMNS = ('axis0_pos_degs', 'axis1_pos_degs', 'rotator_mech_pos_degs')
+
+def _parse_time(value: str) -> float:
+    # local time, the clock the polarimeter export also uses
+    return datetime.datetime.strptime(value.strip(), '%Y-%m-%d %H:%M:%S.%f').timestamp()
+
+@dataclasses.dataclass
+class ScopeLog:
+    times: numpy.ndarray
+    states: numpy.ndarray
+    connected: numpy.ndarray
+    tracking: numpy.ndarray
+
+    def state_at(self, times: float | numpy.ndarray) -> numpy.ndarray | None:
+        # mount state interpolated to `times`, None outside the log or while
+        # the mount is disconnected
+        times = numpy.asarray(times, dtype=numpy.float64)
+        if numpy.any(times < self.times[0]) or numpy.any(times > self.times[-1]):
+            return None
+        if not numpy.all(numpy.interp(times, self.times, self.connected) == 1):
+            return None
+        return numpy.stack([
+            numpy.interp(times, self.times, self.states[:, i])
+            for i in range(self.states.shape[1])
+        ], axis=-1)
+
+def _parse_row(line: str) -> tuple[float, list[float], int, int]:
+    fields = line.split(',')
+    return (
+        _parse_time(fields[_COLUMN_INDEX['local_time']]),
+        [float(fields[_COLUMN_INDEX[name]]) for name in STATE_COLUMNS],
+        int(fields[_COLUMN_INDEX['mount_is_connected']]),
+        int(fields[_COLUMN_INDEX['is_tracking']])
+    )
+
+def read_scope_log(path: str | pathlib.Path) -> ScopeLog:
+    # mount logger output: ', ' separated rows about every half second
+    with open(file=path, mode='r', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    rows = [
+        _parse_row(line=line) for line in lines
+        if line.strip() and not line.lstrip().startswith('#')
+    ]
+    times, states, connected, tracking = zip(*rows)
+    return ScopeLog(
+        times=numpy.array(times),
+        states=numpy.array(states),
+        connected=numpy.array(connected),
+        tracking=numpy.array(tracking, dtype=bool)
+    )
+
+class ScopeLogFollower:
+    def __init__(
+            self,
+            path: str | pathlib.Path,
+            max_age: float = 5.0
+    ) -> None:
+        # reads rows as the mount logger appends them and extrapolates the
+        # last two to the time asked for, so corrections can lead the mount
+        self.path = path
+        self.max_age = max_age
+        self._file = None
+        self._partial = ''
+        self._rows = []
+
+    def _read(self) -> None:
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return
+            self._file = open(file=self.path, mode='r', encoding='utf-8')
+        text = self._partial + self._file.read()
+        lines = text.split('\n')
+        # the last line may still be being written
+        self._partial = lines.pop()
+        for line in lines:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            try:
+                self._rows.append(_parse_row(line=line))
+            except (ValueError, IndexError, KeyError):
+                continue
+        del self._rows[:-2]
+
+    def state_at(self, times: float) -> numpy.ndarray | None:
+        self._read()
+        if not self._rows:
+            return None
+        t1, state1, connected, _ = self._rows[-1]
+        if not connected or times - t1 > self.max_age:
+            return None
+        if len(self._rows) < 2:
+            return numpy.array(state1)
+        t0, state0, _, _ = self._rows[0]
+        rate = (numpy.array(state1) - numpy.array(state0)) / max(t1 - t0, 1e-3)
+        return numpy.array(state1) + rate * (times - t1)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def plate_input(
+        measured_stokes: numpy.ndarray,
+        qwp_position: float | numpy.ndarray,
+        hwp_position: float | numpy.ndarray,
+        hwp_first: bool = pol_compensation.HWP_FIRST
+) -> numpy.ndarray:
+    # undo the plates on every sample to recover the polarisation arriving at
+    # them; returns normalised s1, s2, s3
+    measured_stokes = numpy.asarray(measured_stokes, dtype=numpy.float64)
+    measured_stokes = numpy.concatenate(
+        (numpy.ones(measured_stokes.shape[:-1] + (1,)), measured_stokes),
+        axis=-1
+    )
+    matrices = mueller.WaveplateModel(hwp_first=hwp_first).matrix(
+        qwp_position=qwp_position,
+        hwp_position=hwp_position
+    )
+    matrices = numpy.broadcast_to(matrices, measured_stokes.shape + (4,))
+    input_stokes = numpy.linalg.solve(matrices, measured_stokes[..., numpy.newaxis])[..., 1:4, 0]
+    return input_stokes / numpy.linalg.norm(input_stokes, axis=-1, keepdims=True)
+
+# columns of the daemon's --record log, one row per measurement
+PLATE_LOG_COLUMNS = ('time', 's1', 's2', 's3', 'qwp_position', 'hwp_position')
+
+def read_plate_log(
+        path: str | pathlib.Path,
+        hwp_first: bool = pol_compensation.HWP_FIRST
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # posix seconds and the polarisation arriving at the plates, recovered
+    # from the measured output and where the plates were. a tracking
+    # controller keeps the plates moving most of the time, so samples taken
+    # mid move are kept rather than leaving a sparse fit
+    rows = numpy.loadtxt(fname=path, delimiter=',', comments='#', ndmin=2)
+    return rows[:, 0], plate_input(
+        measured_stokes=rows[:, 1:4],
+        qwp_position=rows[:, 4],
+        hwp_position=rows[:, 5],
+        hwp_first=hwp_first
+    )
+
+class FeedForwardModel:
+    def __init__(
+            self,
+            harmonics: int = 2,
+            lag: float = 0.0
+    ) -> None:
+        # least squares fit of the stokes vector arriving at the waveplates
+        # against a fourier series in each mount angle; predicting the
+        # polarisation rather than plate angles sidesteps their equivalent
+        # branches. lag is added to polarimeter times to find the matching
+        # mount state, absorbing clock offsets between the two logs
+        self.harmonics = harmonics
+        self.lag = lag
+        self.coefficients = None
+
+    @property
+    def trained(self) -> bool:
+        return self.coefficients is not None
+
+    def features(self, states: numpy.ndarray) -> numpy.ndarray:
+        angles = numpy.radians(numpy.asarray(states, dtype=numpy.float64))
+        columns = [numpy.ones(angles.shape[:-1])]
+        for k in range(1, self.harmonics + 1):
+            for i in range(angles.shape[-1]):
+                columns.append(numpy.cos(k * angles[..., i]))
+                columns.append(numpy.sin(k * angles[..., i]))
+        return numpy.stack(columns, axis=-1)
+
+    def fit(
+            self,
+            states: numpy.ndarray,
+            input_stokes: numpy.ndarray
+    ) -> numpy.ndarray:
+        # returns the angle on the poincare sphere between each sample and the
+        # fit, halved to degrees of polarisation
+        input_stokes = numpy.asarray(input_stokes, dtype=numpy.float64)
+        input_stokes = input_stokes / numpy.linalg.norm(input_stokes, axis=-1, keepdims=True)
+        self.coefficients, *_ = numpy.linalg.lstsq(
+            self.features(states=states),
+            input_stokes,
+            rcond=None
+        )
+        return self.residuals(states=states, input_stokes=input_stokes)
+
+    def residuals(
+            self,
+            states: numpy.ndarray,
+            input_stokes: numpy.ndarray
+    ) -> numpy.ndarray:
+        input_stokes = numpy.asarray(input_stokes, dtype=numpy.float64)
+        input_stokes = input_stokes / numpy.linalg.norm(input_stokes, axis=-1, keepdims=True)
+        predicted = self.predict(states=states)[..., 1:4]
+        return numpy.degrees(numpy.arccos(numpy.clip(
+            numpy.sum(predicted * input_stokes, axis=-1), -1, 1
+        ))) / 2
+
+    def predict(self, states: numpy.ndarray) -> numpy.ndarray:
+        # full stokes vectors of shape (..., 4)
+        predicted = self.features(states=states) @ self.coefficients
+        predicted = predicted / numpy.linalg.norm(predicted, axis=-1, keepdims=True)
+        return numpy.concatenate((numpy.ones(predicted.shape[:-1] + (1,)), predicted), axis=-1)
+
+    def train(
+            self,
+            scope_log: ScopeLog,
+            times: numpy.ndarray,
+            input_stokes: numpy.ndarray,
+            lags: numpy.ndarray = numpy.arange(-5.0, 5.05, 0.1)
+    ) -> numpy.ndarray:
+        # fits at each candidate lag and keeps the best; times are posix
+        # seconds of the polarimeter samples, which may span several passes.
+        # input_stokes must be what arrives at the plates: measured with no
+        # compensation, or taken through plate_input, as read_plate_log does.
+        # the output of a running compensator is mostly its target and says
+        # little about the drift
+        best = None
+        for lag in lags:
+            inside = (
+                (times + lag >= scope_log.times[0])
+                & (times + lag <= scope_log.times[-1])
+            )
+            inside[inside] = numpy.interp(
+                times[inside] + lag,
+                scope_log.times,
+                scope_log.connected
+            ) == 1
+            if inside.sum() <= self.features(states=scope_log.states[:1]).shape[-1]:
+                continue
+            residuals = self.fit(
+                states=scope_log.state_at(times=times[inside] + lag),
+                input_stokes=input_stokes[inside]
+            )
+            if best is None or residuals.mean() < best[0].mean():
+                best = (residuals, lag, self.coefficients)
+        if best is None:
+            raise ValueError('No polarimeter samples overlap the scope log')
+        residuals, self.lag, self.coefficients = best
+        return residuals
+
+    def save(self, path: str | pathlib.Path) -> None:
+        numpy.savez(
+            path,
+            harmonics=self.harmonics,
+            lag=self.lag,
+            coefficients=self.coefficients
+        )
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path) -> 'FeedForwardModel':
+        with numpy.load(path) as data:
+            model = cls(harmonics=int(data['harmonics']), lag=float(data['lag']))
+            model.coefficients = data['coefficients']
+        return model
+
+class FeedForwardController:
+    def __init__(
+            self,
+            motor_list: list[base_motor.Motor],
+            motor_qwp_serial_no: str,
+            motor_hwp_serial_no: str,
+            azimuth_velocities: list[tuple[float, float]],
+            ellipticity_velocities: list[tuple[float, float]],
+            feed_forward: FeedForwardModel | None = None,
+            mount_state: typing.Callable[[float], numpy.ndarray | None] | None = None,
+            clock: typing.Callable[[], float] = time.time,
+            lead: float = 0.5,
+            hwp_first: bool = pol_compensation.HWP_FIRST,
+            tracer=None
+    ) -> None:
+        # the model based controller runs on every tick as usual, but on the
+        # polarisation expected `lead` seconds ahead, about the time a short
+        # plate move takes to land: the last measured input to the plates
+        # plus the change the feed forward model predicts from the mount
+        # state since it was measured. ticks without a fresh measurement run
+        # on the prediction alone, so fewer measurements are needed. Without
+        # a trained model or a mount state the model based controller runs on
+        # the measurements as they are
+        self.feed_forward = feed_forward
+        self.mount_state = mount_state
+        self.clock = clock
+        self.lead = lead
+
+        self.fallback = pol_compensation.ModelController(
+            motor_list=motor_list,
+            motor_qwp_serial_no=motor_qwp_serial_no,
+            motor_hwp_serial_no=motor_hwp_serial_no,
+            azimuth_velocities=azimuth_velocities,
+            ellipticity_velocities=ellipticity_velocities,
+            hwp_first=hwp_first,
+            tracer=tracer
+        )
+        self.qwp_motor = self.fallback.qwp_motor
+        self.hwp_motor = self.fallback.hwp_motor
+        self.plates = mueller.WaveplateModel(hwp_first=hwp_first)
+
+        # input stokes at the plates from the last measurement, and the mount
+        # state it was measured at
+        self._measured = None
+
+    def _state(self, at: float) -> numpy.ndarray | None:
+        if self.mount_state is None or self.feed_forward is None or not self.feed_forward.trained:
+            return None
+        return self.mount_state(at + self.feed_forward.lag)
+
+    def update(
+            self,
+            target_azimuth: float,
+            target_ellipticity: float,
+            current_azimuth: float,
+            current_ellipticity: float,
+            current_stokes: tuple[float, float, float] | None = None,
+            sequence: int | None = None
+    ) -> bool:
+        now = self.clock()
+        if self.qwp_motor is None or self.hwp_motor is None:
+            return self.fallback.update(
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                current_azimuth=current_azimuth,
+                current_ellipticity=current_ellipticity,
+                current_stokes=current_stokes,
+                sequence=sequence
+            )
+        qwp_position = self.qwp_motor.position
+        hwp_position = self.hwp_motor.position
+        if current_stokes is not None:
+            measured_state = self._state(at=now)
+            self._measured = None if measured_state is None else (
+                plate_input(
+                    measured_stokes=current_stokes,
+                    qwp_position=qwp_position,
+                    hwp_position=hwp_position,
+                    hwp_first=self.plates.hwp_first
+                ),
+                measured_state
+            )
+        state = self._state(at=now + self.lead)
+        if state is None or self._measured is None:
+            return self.fallback.update(
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                current_azimuth=current_azimuth,
+                current_ellipticity=current_ellipticity,
+                current_stokes=current_stokes,
+                sequence=sequence
+            )
+
+        measured_input, measured_state = self._measured
+        input_stokes = (
+            measured_input
+            + self.feed_forward.predict(states=state)[1:4]
+            - self.feed_forward.predict(states=measured_state)[1:4]
+        )
+        self.plates.input_stokes = numpy.concatenate(
+            ([1.0], input_stokes / numpy.linalg.norm(input_stokes))
+        )
+        # what the polarimeter should see at the current plate positions
+        expected = self.plates.output(qwp_position=qwp_position, hwp_position=hwp_position)
+        expected_azimuth, expected_ellipticity = mueller.azimuth_ellipticity(expected)
+        return self.fallback.update(
+            target_azimuth=target_azimuth,
+            target_ellipticity=target_ellipticity,
+            current_azimuth=float(expected_azimuth),
+            current_ellipticity=float(expected_ellipticity),
+            current_stokes=tuple(float(v) for v in expected[1:4]),
+            sequence=sequence
+        )
+
+    def stop(self) -> None:
+        self.fallback.stop()
+
+    def reset(self) -> None:
+        self.fallback.reset()
+        self._measured = None
+
+if __name__ == '__main__':
+    from polarisation_compensation import simulator
+
+    # the recorded pass stands in for the drift arriving at the plates. the
+    # first half is compensated in the simulator with its plate positions
+    # logged, as the daemon's --record does, and the model is trained on the
+    # plate corrected input; the second half is replayed with and without
+    # feed forward. a log from --record in place of the polarimeter export
+    # is plate corrected as read and trained on directly
+    root = pathlib.Path(__file__).resolve().parent.parent
+    scope_log_path = root / 'tests' / 'hogs' / 'data' / 'scope logs 14-4-24.txt'
+    polarimeter_path = root / 'tests' / 'hogs' / 'data' / 'multiple_overpass-pol_control_after-h_north.csv'
+    if len(sys.argv) > 2:
+        scope_log_path, polarimeter_path = sys.argv[1:3]
+
+    scope_log = read_scope_log(path=scope_log_path)
+    with open(file=polarimeter_path, mode='r', encoding='utf-8-sig') as file:
+        plate_log = file.readline().startswith('# time')
+    if plate_log:
+        times, input_stokes = read_plate_log(path=polarimeter_path)
+    else:
+        times, input_stokes = simulator.read_polarimeter_csv(path=polarimeter_path, absolute=True)
+    split = times[0] + (times[-1] - times[0]) / 2
+    train = times < split
+
+    train_times, train_stokes = times[train], input_stokes[train]
+    if not plate_log:
+        logged = simulator.simulate(
+            times=train_times,
+            input_stokes=train_stokes,
+            controller_class=pol_compensation.ModelController,
+            noise=0.01
+        )
+        train_times = logged.times
+        train_stokes = plate_input(
+            measured_stokes=logged.measured_stokes,
+            qwp_position=logged.plate_positions[:, 0],
+            hwp_position=logged.plate_positions[:, 1]
+        )
+    model = FeedForwardModel()
+    residuals = model.train(
+        scope_log=scope_log,
+        times=train_times,
+        input_stokes=train_stokes
+    )
+    held_out = model.residuals(
+        states=scope_log.state_at(times=times[~train] + model.lag),
+        input_stokes=input_stokes[~train]
+    )
+    print(
+        f'lag {model.lag:.1f} s, fit residual {residuals.mean():.2f}°, '
+        f'held out {held_out.mean():.2f}° p95 {numpy.percentile(held_out, 95):.2f}°'
+    )
+    if len(sys.argv) > 3:
+        model.save(path=sys.argv[3])
+
+    for measure_every in (1, 5, 20):
+        for name, controller_class, controller_kwargs, clock in (
+            ('model', pol_compensation.ModelController, None, None),
+            ('feed forward', FeedForwardController, {}, simulator.SimulatedClock())
+        ):
+            if controller_kwargs is not None:
+                controller_kwargs = dict(
+                    feed_forward=model,
+                    mount_state=scope_log.state_at,
+                    clock=clock
+                )
+            result = simulator.simulate(
+                times=times[~train],
+                input_stokes=input_stokes[~train],
+                controller_class=controller_class,
+                measure_every=measure_every,
+                clock=clock,
+                controller_kwargs=controller_kwargs
+            )
+            print(f'measuring every {measure_every} samples, {name}: {result.summary()}')
@@ -0,0 +1,317 @@
+import functools
+
+import numpy
+
+# angles are in degrees, matching the polarimeter and motor positions; every
+# function broadcasts over arrays of angles, returning matrices of shape
+# (..., 4, 4) and stokes vectors of shape (..., 4)
+
+# a plate at angle + period acts the same as at angle: the qwp matrix goes as
+# 2 * angle and the hwp matrix as 4 * angle
+QWP_PERIOD = 180.0
+HWP_PERIOD = 90.0
+
+def rotation(angle: float | numpy.ndarray) -> numpy.ndarray:
+    angle = numpy.radians(numpy.asarray(angle, dtype=numpy.float64))
+    c, s = numpy.cos(2 * angle), numpy.sin(2 * angle)
+    matrix = numpy.zeros(angle.shape + (4, 4), dtype=numpy.float64)
+    matrix[..., 0, 0] = 1
+    matrix[..., 1, 1] = c
+    matrix[..., 1, 2] = -s
+    matrix[..., 2, 1] = s
+    matrix[..., 2, 2] = c
+    matrix[..., 3, 3] = 1
+    return matrix
+
+def retarder(
+        retardance: float | numpy.ndarray,
+        angle: float | numpy.ndarray
+) -> numpy.ndarray:
+    # linear retarder with its fast axis at `angle`, retardance in radians;
+    # closed form of rotation(angle) @ plate @ rotation(-angle)
+    retardance, angle = numpy.broadcast_arrays(
+        numpy.asarray(retardance, dtype=numpy.float64),
+        numpy.radians(numpy.asarray(angle, dtype=numpy.float64))
+    )
+    c, s = numpy.cos(2 * angle), numpy.sin(2 * angle)
+    cd, sd = numpy.cos(retardance), numpy.sin(retardance)
+    matrix = numpy.zeros(angle.shape + (4, 4), dtype=numpy.float64)
+    matrix[..., 0, 0] = 1
+    matrix[..., 1, 1] = c * c + s * s * cd
+    matrix[..., 1, 2] = c * s * (1 - cd)
+    matrix[..., 1, 3] = -s * sd
+    matrix[..., 2, 1] = c * s * (1 - cd)
+    matrix[..., 2, 2] = s * s + c * c * cd
+    matrix[..., 2, 3] = c * sd
+    matrix[..., 3, 1] = s * sd
+    matrix[..., 3, 2] = -c * sd
+    matrix[..., 3, 3] = cd
+    return matrix
+
+def quarter_wave_plate(angle: float | numpy.ndarray) -> numpy.ndarray:
+    return retarder(retardance=numpy.pi / 2, angle=angle)
+
+def half_wave_plate(angle: float | numpy.ndarray) -> numpy.ndarray:
+    return retarder(retardance=numpy.pi, angle=angle)
+
+def apply(matrix: numpy.ndarray, stokes: numpy.ndarray) -> numpy.ndarray:
+    return numpy.matmul(matrix, numpy.asarray(stokes)[..., numpy.newaxis])[..., 0]
+
+def stokes(
+        azimuth: float | numpy.ndarray,
+        ellipticity: float | numpy.ndarray
+) -> numpy.ndarray:
+    azimuth, ellipticity = numpy.broadcast_arrays(
+        numpy.radians(numpy.asarray(azimuth, dtype=numpy.float64)),
+        numpy.radians(numpy.asarray(ellipticity, dtype=numpy.float64))
+    )
+    return numpy.stack((
+        numpy.ones_like(azimuth),
+        numpy.cos(2 * ellipticity) * numpy.cos(2 * azimuth),
+        numpy.cos(2 * ellipticity) * numpy.sin(2 * azimuth),
+        numpy.sin(2 * ellipticity)
+    ), axis=-1)
+
+def azimuth_ellipticity(stokes: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+    stokes = numpy.asarray(stokes, dtype=numpy.float64)
+    s1, s2, s3 = numpy.moveaxis(
+        stokes[..., 1:4] / numpy.linalg.norm(stokes[..., 1:4], axis=-1, keepdims=True),
+        -1,
+        0
+    )
+    return (
+        numpy.degrees(numpy.arctan2(s2, s1) / 2),
+        numpy.degrees(numpy.arcsin(numpy.clip(s3, -1, 1)) / 2)
+    )
+
+def separation(
+        stokes_a: numpy.ndarray,
+        stokes_b: numpy.ndarray
+) -> numpy.ndarray:
+    # angle between two polarisations in degrees of azimuth/ellipticity, half
+    # the angle between them on the poincare sphere; takes s1..s3 or s0..s3
+    a = numpy.asarray(stokes_a, dtype=numpy.float64)[..., -3:]
+    b = numpy.asarray(stokes_b, dtype=numpy.float64)[..., -3:]
+    cosine = numpy.sum(a * b, axis=-1) / (
+        numpy.linalg.norm(a, axis=-1) * numpy.linalg.norm(b, axis=-1)
+    )
+    return numpy.degrees(numpy.arccos(numpy.clip(cosine, -1, 1))) / 2
+
+class WaveplateLUT:
+    def __init__(
+            self,
+            step: float = 1.0,
+            qwp_offset: float = 0.0,
+            hwp_offset: float = 0.0,
+            hwp_first: bool = True,
+            qwp_retardance: float = 90.0,
+            hwp_retardance: float = 180.0
+    ) -> None:
+        # the plate matrices over one period of each plate, indexed
+        # [qwp, hwp]; only the s1..s3 rows are kept since the plates leave s0
+        # alone
+        self.step = step
+        self.qwp_angles = numpy.arange(0, QWP_PERIOD, step)
+        self.hwp_angles = numpy.arange(0, HWP_PERIOD, step)
+        qwp = retarder(
+            retardance=numpy.radians(qwp_retardance),
+            angle=self.qwp_angles + qwp_offset
+        )[:, numpy.newaxis]
+        hwp = retarder(
+            retardance=numpy.radians(hwp_retardance),
+            angle=self.hwp_angles + hwp_offset
+        )[numpy.newaxis, :]
+        if hwp_first:
+            self.matrices = numpy.matmul(qwp[..., 1:4, :], hwp)
+        else:
+            self.matrices = numpy.matmul(hwp[..., 1:4, :], qwp)
+        # stacked into one (n_qwp * n_hwp * 3, 4) matrix a query is a single
+        # matrix-vector product instead of one small product per grid point
+        self._stacked = numpy.ascontiguousarray(self.matrices.reshape(-1, 4))
+
+    def outputs(self, input_stokes: numpy.ndarray) -> numpy.ndarray:
+        # (n_qwp, n_hwp, 3) output stokes for one input
+        return (
+            self._stacked @ numpy.asarray(input_stokes, dtype=numpy.float64)
+        ).reshape(self.matrices.shape[:3])
+
+    def query(
+            self,
+            input_stokes: numpy.ndarray,
+            target_stokes: numpy.ndarray,
+            near: tuple[float, float] | None = None,
+            tolerance: float = 0.02
+    ) -> tuple[float, float, float]:
+        # with `near` given, the grid point needing least travel from those
+        # positions among all within `tolerance` of the best match. a pair of
+        # plates usually reaches the target at a few separate angle pairs;
+        # taking the closest keeps a tracking controller on the branch it is
+        # on instead of swinging both plates across to the global best, which
+        # for measurement noise alone can be most of a period away
+        difference = self.outputs(input_stokes=input_stokes) - numpy.asarray(target_stokes)[1:4]
+        distances = numpy.sqrt(numpy.einsum('ijk,ijk->ij', difference, difference))
+        if near is None:
+            index = numpy.argmin(distances)
+        else:
+            travel = (
+                numpy.abs(nearest_equivalent(
+                    angle=self.qwp_angles,
+                    current=near[0],
+                    period=QWP_PERIOD
+                ) - near[0])[:, numpy.newaxis]
+                + numpy.abs(nearest_equivalent(
+                    angle=self.hwp_angles,
+                    current=near[1],
+                    period=HWP_PERIOD
+                ) - near[1])[numpy.newaxis, :]
+            )
+            travel[distances > distances.min() + tolerance] = numpy.inf
+            index = numpy.argmin(travel)
+        q, h = numpy.unravel_index(index, distances.shape)
+        return float(self.qwp_angles[q]), float(self.hwp_angles[h]), float(distances[q, h])
+
+@functools.lru_cache(maxsize=8)
+def waveplate_lut(
+        step: float = 1.0,
+        qwp_offset: float = 0.0,
+        hwp_offset: float = 0.0,
+        hwp_first: bool = True,
+        qwp_retardance: float = 90.0,
+        hwp_retardance: float = 180.0
+) -> WaveplateLUT:
+    return WaveplateLUT(
+        step=step,
+        qwp_offset=qwp_offset,
+        hwp_offset=hwp_offset,
+        hwp_first=hwp_first,
+        qwp_retardance=qwp_retardance,
+        hwp_retardance=hwp_retardance
+    )
+
+class WaveplateModel:
+    def __init__(
+            self,
+            qwp_offset: float = 0.0,
+            hwp_offset: float = 0.0,
+            hwp_first: bool = True,
+            qwp_retardance: float = 90.0,
+            hwp_retardance: float = 180.0
+    ) -> None:
+        # hwp_first is the order light passes the plates, a property of the
+        # bench (see pol_compensation.HWP_FIRST); offsets map motor positions
+        # onto fast axis angles, and retardances are in degrees, off their
+        # nominal values for a real plate away from its design wavelength
+        self.qwp_offset = qwp_offset
+        self.hwp_offset = hwp_offset
+        self.hwp_first = hwp_first
+        self.qwp_retardance = qwp_retardance
+        self.hwp_retardance = hwp_retardance
+        self.input_stokes = stokes(azimuth=0, ellipticity=0)
+
+    def matrix(
+            self,
+            qwp_position: float | numpy.ndarray,
+            hwp_position: float | numpy.ndarray
+    ) -> numpy.ndarray:
+        qwp = retarder(
+            retardance=numpy.radians(self.qwp_retardance),
+            angle=numpy.asarray(qwp_position) + self.qwp_offset
+        )
+        hwp = retarder(
+            retardance=numpy.radians(self.hwp_retardance),
+            angle=numpy.asarray(hwp_position) + self.hwp_offset
+        )
+        return qwp @ hwp if self.hwp_first else hwp @ qwp
+
+    def output(
+            self,
+            qwp_position: float | numpy.ndarray,
+            hwp_position: float | numpy.ndarray
+    ) -> numpy.ndarray:
+        return apply(
+            matrix=self.matrix(qwp_position=qwp_position, hwp_position=hwp_position),
+            stokes=self.input_stokes
+        )
+
+    def fit(
+            self,
+            measured_stokes: numpy.ndarray,
+            qwp_position: float,
+            hwp_position: float
+    ) -> numpy.ndarray:
+        # undo the plates to recover the polarisation arriving at them
+        measured_stokes = numpy.asarray(measured_stokes, dtype=numpy.float64)
+        if len(measured_stokes) == 3:
+            measured_stokes = numpy.concatenate(([1.0], measured_stokes))
+        self.input_stokes = numpy.linalg.solve(
+            self.matrix(qwp_position=qwp_position, hwp_position=hwp_position),
+            measured_stokes
+        )
+        return self.input_stokes
+
+    def solve(
+            self,
+            target_stokes: numpy.ndarray,
+            step: float = 1.0,
+            refinements: int = 2,
+            near: tuple[float, float] | None = None
+    ) -> tuple[float, float, float]:
+        # nearest point of the lookup table, then finer grids around it;
+        # returns the positions and the residual distance on the poincare sphere
+        target = numpy.asarray(target_stokes, dtype=numpy.float64)
+        qwp_centre, hwp_centre, residual = waveplate_lut(
+            step=step,
+            qwp_offset=self.qwp_offset,
+            hwp_offset=self.hwp_offset,
+            hwp_first=self.hwp_first,
+            qwp_retardance=self.qwp_retardance,
+            hwp_retardance=self.hwp_retardance
+        ).query(input_stokes=self.input_stokes, target_stokes=target, near=near)
+        span = step
+        for _ in range(refinements):
+            step = step / 10
+            offsets = numpy.arange(-span, span + step / 2, step)
+            outputs = self.output(
+                qwp_position=(qwp_centre + offsets)[:, numpy.newaxis],
+                hwp_position=(hwp_centre + offsets)[numpy.newaxis, :]
+            )[..., 1:4]
+            distances = numpy.linalg.norm(outputs - target[1:4], axis=-1)
+            q, h = numpy.unravel_index(numpy.argmin(distances), distances.shape)
+            qwp_centre, hwp_centre = qwp_centre + offsets[q], hwp_centre + offsets[h]
+            residual = float(distances[q, h])
+            span = step
+        return float(qwp_centre % QWP_PERIOD), float(hwp_centre % HWP_PERIOD), residual
+
+def nearest_equivalent(
+        angle: float | numpy.ndarray,
+        current: float,
+        period: float = QWP_PERIOD
+) -> float | numpy.ndarray:
+    # the copy of angle, a whole number of periods away, needing least travel
+    # from current; with the hwp period at 90 rather than 180 a hwp never
+    # travels more than 45 degrees to a solution
+    return current + (angle - current + period / 2) % period - period / 2
+
+if __name__ == '__main__':
+    import time
+
+    input_stokes = stokes(azimuth=23.0, ellipticity=-11.0)
+    start = time.perf_counter()
+    lut = WaveplateLUT(step=1.0)
+    built = time.perf_counter()
+    lut.outputs(input_stokes=input_stokes)
+    swept = time.perf_counter()
+    print(
+        f'{len(lut.qwp_angles)}x{len(lut.hwp_angles)} grid built in {(built - start) * 1000:.1f} ms, '
+        f'swept in {(swept - built) * 1000:.1f} ms'
+    )
+
+    model = WaveplateModel()
+    model.input_stokes = input_stokes
+    waveplate_lut()
+    start = time.perf_counter()
+    qwp, hwp, residual = model.solve(target_stokes=stokes(azimuth=0, ellipticity=0))
+    elapsed = time.perf_counter() - start
+    print(
+        f'qwp {qwp:.2f}, hwp {hwp:.2f}, residual {residual:.2e} in {elapsed * 1000:.1f} ms'
+    )
@@ -0,0 +1,397 @@
+import sys
+import os
+import socket
+import struct
+import threading
+import time
+import typing
+
+import polarimeter.remote_polarimeter as remote_polarimeter
+import motor.remote_motor as remote_motor
+import motor.base_motor as base_motor
+
+sys.path.append(
+    os.path.abspath(os.path.join(
+        os.path.dirname(__file__),
+        os.path.pardir
+    ))
+)
+from bb84 import remote_timetagger
+from bb84 import measurement_bus
+from bb84 import latency
+from polarisation_compensation import pol_compensation
+from polarisation_compensation import daemon_protocol
+from polarisation_compensation import dispatcher
+from polarisation_compensation import adaptive
+from polarisation_compensation import feed_forward
+
+class CompensationDaemon:
+    def __init__(
+            self,
+            measure_callback: typing.Callable,
+            motor_list: list[base_motor.Motor],
+            motor_qwp_serial_no: str = pol_compensation.QWP_SERIAL_NO,
+            motor_hwp_serial_no: str = pol_compensation.HWP_SERIAL_NO,
+            azimuth_velocities: list[tuple[float, float]] = pol_compensation.AZIMUTH_VELOCITIES,
+            ellipticity_velocities: list[tuple[float, float]] = pol_compensation.ELLIPTICITY_VELOCITIES,
+            model_based: bool = False,
+            integrator: adaptive.AdaptiveIntegrator | None = None,
+            feed_forward_model: feed_forward.FeedForwardModel | None = None,
+            mount_state: typing.Callable | None = None,
+            feed_forward_interval: float = 0.1,
+            record_path: str | None = None,
+            max_failures: int = 5,
+            retry_interval: float = 1.0
+    ) -> None:
+        self.measure = measure_callback
+        # consecutive failed measurements before the daemon reports a fault
+        self.max_failures = max_failures
+        self.retry_interval = retry_interval
+        # commands to each motor go out on its own thread
+        self.motor_list = dispatcher.dispatch(motor_list=motor_list)
+        self.motor_qwp_serial_no = motor_qwp_serial_no
+        self.motor_hwp_serial_no = motor_hwp_serial_no
+        self.azimuth_velocities = azimuth_velocities
+        self.ellipticity_velocities = ellipticity_velocities
+
+        # feed forward predicts corrections from the mount state, and acts
+        # every feed_forward_interval seconds between measurements too
+        self.feed_forward = feed_forward_model is not None and mount_state is not None
+        self.feed_forward_interval = feed_forward_interval
+        controller_kwargs = {}
+        if self.feed_forward:
+            controller_class = feed_forward.FeedForwardController
+            controller_kwargs = dict(
+                feed_forward=feed_forward_model,
+                mount_state=mount_state
+            )
+        elif model_based:
+            controller_class = pol_compensation.ModelController
+        else:
+            controller_class = pol_compensation.PolCompController
+        self.controller = controller_class(
+            motor_list=self.motor_list,
+            motor_qwp_serial_no=motor_qwp_serial_no,
+            motor_hwp_serial_no=motor_hwp_serial_no,
+            azimuth_velocities=azimuth_velocities,
+            ellipticity_velocities=ellipticity_velocities,
+            tracer=latency.TRACER,
+            **controller_kwargs
+        )
+        self.measurement_bus = measurement_bus.MeasurementBus()
+        # None acts on every sample
+        self.integrator = integrator
+        self.state = daemon_protocol.State()
+        self._state_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._control_thread = None
+
+        # every measurement with the plate positions, in the format
+        # feed_forward.read_plate_log trains from
+        self._record_file = None
+        if record_path is not None:
+            self._record_file = open(file=record_path, mode='a', encoding='utf-8')
+            self._record_file.write(f'# {", ".join(feed_forward.PLATE_LOG_COLUMNS)}\n')
+
+    def get_state(self) -> daemon_protocol.State:
+        with self._state_lock:
+            return daemon_protocol.State(**vars(self.state))
+
+    def set_enable_compensation(self, value: bool) -> None:
+        with self._state_lock:
+            self.state.enable_compensation = value
+        if not value:
+            for m in self.motor_list:
+                m.stop()
+            self.controller.reset()
+
+    def set_target(self, azimuth: float, ellipticity: float) -> None:
+        with self._state_lock:
+            self.state.target_azimuth = azimuth
+            self.state.target_ellipticity = ellipticity
+
+    def run(self) -> None:
+        # acquisition publishes onto the bus and a control thread consumes it,
+        # so a slow control step never delays the next measurement
+        self._control_thread = threading.Thread(
+            target=self._control_loop,
+            daemon=True
+        )
+        self._control_thread.start()
+        while not self._stop_event.is_set():
+            # measure blocks for one acquisition, so each pass acts on a fresh
+            # sample with no extra sleep
+            acquire_start = time.perf_counter_ns()
+            try:
+                data = self.measure()
+            except Exception as e:
+                self._on_measure_failed(error=e)
+                continue
+            acquire_end = time.perf_counter_ns()
+            snapshot = self.measurement_bus.publish(data=data)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='acquire_start', time_ns=acquire_start)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='acquire_end', time_ns=acquire_end)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='published')
+            with self._state_lock:
+                self.state.azimuth = data.azimuth
+                self.state.ellipticity = data.ellipticity
+                self.state.normalised_s1 = data.normalised_s1
+                self.state.normalised_s2 = data.normalised_s2
+                self.state.normalised_s3 = data.normalised_s3
+                self.state.timestamp = time.time()
+                self.state.n_ticks += 1
+                recovered = self.state.faulted
+                self.state.faulted = False
+                self.state.n_failures = 0
+            if recovered:
+                print('Measurements recovered, compensation resumed')
+
+    def _control_loop(self) -> None:
+        # one control step per new snapshot, so a sample is never acted on
+        # twice; with feed forward a step on the prediction alone also runs
+        # whenever no snapshot has come for feed_forward_interval, so the
+        # plates keep up with the mount while measurements are slow
+        sequence = 0
+        while not self._stop_event.is_set():
+            snapshot = self.measurement_bus.wait_next(
+                after=sequence,
+                timeout=self.feed_forward_interval if self.feed_forward else 1
+            )
+            if snapshot is None and not self.feed_forward:
+                continue
+            if snapshot is not None:
+                sequence = snapshot.sequence
+                if self._record_file is not None:
+                    self._record(snapshot=snapshot)
+            state = self.get_state()
+            if not state.enable_compensation or state.faulted:
+                continue
+            control_input = None
+            if snapshot is not None:
+                control_input = adaptive.control_input(
+                    snapshot=snapshot,
+                    target_azimuth=state.target_azimuth,
+                    target_ellipticity=state.target_ellipticity,
+                    integrator=self.integrator,
+                    moving=any(m.is_moving for m in self.motor_list)
+                )
+            if control_input is None and not self.feed_forward:
+                continue
+            if control_input is None:
+                # no sample to act on, so only the prediction is applied
+                control_input = (state.target_azimuth, state.target_ellipticity, None)
+            current_azimuth, current_ellipticity, current_stokes = control_input
+            try:
+                self.controller.update(
+                    target_azimuth=state.target_azimuth,
+                    target_ellipticity=state.target_ellipticity,
+                    current_azimuth=current_azimuth,
+                    current_ellipticity=current_ellipticity,
+                    current_stokes=current_stokes,
+                    sequence=snapshot.sequence if snapshot is not None else None
+                )
+            except Exception as e:
+                print(f'Error: control step failed {e}')
+
+    def _record(self, snapshot) -> None:
+        # motor_list holds the dispatched motors, whose position reads take
+        # the device lock rather than racing their command threads
+        positions = {m.device_info.serial_number: m.position for m in self.motor_list}
+        self._record_file.write(','.join(str(v) for v in (
+            snapshot.timestamp,
+            snapshot.normalised_s1,
+            snapshot.normalised_s2,
+            snapshot.normalised_s3,
+            positions.get(self.motor_qwp_serial_no, 0.0),
+            positions.get(self.motor_hwp_serial_no, 0.0)
+        )) + '\n')
+        self._record_file.flush()
+
+    def _on_measure_failed(self, error: Exception) -> None:
+        # the loop keeps retrying; after max_failures in a row the motors are
+        # stopped and the fault is reported in the state until a measurement
+        # succeeds again
+        with self._state_lock:
+            self.state.n_failures += 1
+            n_failures = self.state.n_failures
+            fault = n_failures >= self.max_failures and not self.state.faulted
+            if fault:
+                self.state.faulted = True
+        print(f'Error: measurement failed ({n_failures} in a row) {error}')
+        if fault:
+            print('Measurements keep failing, compensation held')
+            for m in self.motor_list:
+                m.stop()
+            self.controller.reset()
+            if self.integrator is not None:
+                self.integrator.reset()
+        self._stop_event.wait(timeout=self.retry_interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.measurement_bus.close()
+        if latency.EXPORT_PATH:
+            latency.TRACER.export(path=latency.EXPORT_PATH)
+        for m in self.motor_list:
+            m.stop()
+        for m in self.motor_list:
+            m.wait_idle(timeout=1)
+        if self._control_thread is not None:
+            self._control_thread.join(timeout=2)
+        if self._record_file is not None:
+            self._record_file.close()
+
+    def handle_client(
+            self,
+            connection: socket.socket,
+            address
+    ) -> None:
+        with connection:
+            try:
+                while True:
+                    cmd_data = connection.recv(4)
+                    if not cmd_data:
+                        break
+
+                    command = struct.unpack('I', cmd_data)[0]
+                    match command:
+                        case daemon_protocol.Command.GET_STATE:
+                            pass
+
+                        case daemon_protocol.Command.ENABLE_COMPENSATION:
+                            self.set_enable_compensation(value=True)
+
+                        case daemon_protocol.Command.DISABLE_COMPENSATION:
+                            self.set_enable_compensation(value=False)
+
+                        case daemon_protocol.Command.SET_TARGET:
+                            azimuth, ellipticity = struct.unpack(
+                                '!dd',
+                                _recvall(connection=connection, size=16)
+                            )
+                            self.set_target(
+                                azimuth=azimuth,
+                                ellipticity=ellipticity
+                            )
+
+                        case _:
+                            message = f'Unknown command: {command}'.encode()
+                            payload = struct.pack(f'I{len(message)}s', len(message), message)
+                            header = struct.pack(
+                                'IB',
+                                len(payload) + 1,
+                                daemon_protocol.Response.ERROR
+                            )
+                            connection.sendall(header + payload)
+                            continue
+
+                    # every command is answered with the current state
+                    payload = self.get_state().serialise()
+                    header = struct.pack(
+                        'IB',
+                        len(payload) + 1,
+                        daemon_protocol.Response.STATE
+                    )
+                    connection.sendall(header + payload)
+
+            except ConnectionError:
+                print(f'Connection lost with {address}')
+
+    def serve(
+            self,
+            host: str = daemon_protocol.DAEMON_HOST,
+            port: int = daemon_protocol.DAEMON_PORT
+    ) -> None:
+        server = socket.socket(
+            family=socket.AF_INET,
+            type=socket.SOCK_STREAM
+        )
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen()
+        print(f'Compensation daemon listening on {host}:{port}')
+        try:
+            while not self._stop_event.is_set():
+                conn, addr = server.accept()
+                threading.Thread(
+                    target=self.handle_client,
+                    args=(conn, addr),
+                    daemon=True
+                ).start()
+        finally:
+            server.close()
+
+def _recvall(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        part = connection.recv(size - len(data))
+        if not part:
+            raise ConnectionError('Socket closed')
+        data.extend(part)
+    return bytes(data)
+
+def polarimeter_source(serial_number: str = 'M00910360') -> typing.Callable:
+    pax = remote_polarimeter.Polarimeter(
+        host=remote_polarimeter.server_host,
+        port=remote_polarimeter.server_port,
+        serial_number=serial_number
+    )
+    return lambda: remote_polarimeter.thorlabs_polarimeter.Data().from_raw_data(
+        raw_data=pax.measure()
+    )
+
+def timetagger_source() -> typing.Callable:
+    tt = remote_timetagger.Timetagger(
+        host=remote_timetagger.server_host,
+        port=remote_timetagger.server_port
+    )
+    return lambda: tt.measure().data
+
+def remote_motors() -> list[base_motor.Motor]:
+    return [
+        remote_motor.Motor(
+            serial_number=m.device_info.serial_number,
+            host=remote_motor.server_host,
+            port=remote_motor.server_port
+        ) for m in remote_motor.list_motors(
+            host=remote_motor.server_host,
+            port=remote_motor.server_port
+        )
+    ]
+
+if __name__ == '__main__':
+    if 'timetagger' in sys.argv[1:]:
+        measure_callback = timetagger_source()
+    else:
+        measure_callback = polarimeter_source()
+
+    # --feed-forward model.npz scope_log.txt, with the model trained by
+    # feed_forward and the log the mount logger is writing; --record log.csv
+    # keeps each measurement with the plate positions to train a model from
+    feed_forward_model = None
+    mount_state = None
+    if '--feed-forward' in sys.argv[1:]:
+        index = sys.argv.index('--feed-forward')
+        feed_forward_model = feed_forward.FeedForwardModel.load(path=sys.argv[index + 1])
+        mount_state = feed_forward.ScopeLogFollower(path=sys.argv[index + 2]).state_at
+
+    daemon = CompensationDaemon(
+        measure_callback=measure_callback,
+        motor_list=remote_motors(),
+        model_based='--model' in sys.argv[1:],
+        integrator=adaptive.AdaptiveIntegrator() if '--adaptive' in sys.argv[1:] else None,
+        feed_forward_model=feed_forward_model,
+        mount_state=mount_state,
+        record_path=(
+            sys.argv[sys.argv.index('--record') + 1]
+            if '--record' in sys.argv[1:] else None
+        )
+    )
+    # --enable starts compensating at once, for unattended runs
+    if '--enable' in sys.argv[1:]:
+        daemon.set_enable_compensation(value=True)
+    threading.Thread(target=daemon.run, daemon=True).start()
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        daemon.stop()
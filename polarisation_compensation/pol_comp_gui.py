@@ -1,14 +1,14 @@
+from __future__ import annotations
+
 import sys
 import os
 import enum
 import typing
 import threading
 import time
+import concurrent.futures
 
 import numpy
-import matplotlib.pyplot
-import matplotlib.backends.backend_gtk4agg
-import matplotlib.backend_bases
 
 import gi
 gi.require_version('Gtk', '4.0')
@@ -16,9 +16,8 @@ gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw, GLib, GObject
 
 import pol_compensation
-
-import polarimeter.gui_widget as polarimeter_gui_widget
-import polarimeter.remote_polarimeter as remote_polarimeter
+import dispatcher
+import adaptive
 
 sys.path.append(
     os.path.abspath(os.path.join(
@@ -26,23 +25,36 @@ sys.path.append(
         os.path.pardir
     ))
 )
-from bb84 import timetagger
-from bb84 import remote_timetagger
-from bb84 import gui_widget as timetagger_gui_widget
-from motor import gui_widget as motor_gui_widget
-from motor import base_motor
-from motor import thorlabs_motor
-from motor import remote_motor
+from bb84 import profiler
+from bb84 import measurement_bus
+from bb84 import latency
+
+# measure with the timetagger box instead of the polarimeter box
+USE_TIMETAGGER = bool(os.environ.get('POL_COMP_TIMETAGGER'))
+
+# matplotlib, the device packages and their gui widgets are imported where
+# they are used, so the window can appear before they are loaded. numpy is
+# not deferred: the controller, profiler and latency modules need it anyway
+if typing.TYPE_CHECKING:
+    import matplotlib.backend_bases
+    import polarimeter.gui_widget as polarimeter_gui_widget
+    from bb84 import gui_widget as timetagger_gui_widget
+    from motor import gui_widget as motor_gui_widget
 
 class CurveBox(Gtk.Box):
     def __init__(
             self,
             set_angle_velocity_callback: typing.Callable,
-            get_angle_velocity_callback: typing.Callable
+            get_angle_velocity_callback: typing.Callable,
+            render_scheduler: timetagger_gui_widget.RenderScheduler
     ) -> None:
+        import matplotlib.pyplot
+        import matplotlib.backends.backend_gtk4agg
+
         super().__init__(orientation=Gtk.Orientation.VERTICAL)
         self.set_angle_velocity = set_angle_velocity_callback
         self.get_angle_velocity = get_angle_velocity_callback
+        self.render_scheduler = render_scheduler
 
         self.fig, self.ax = matplotlib.pyplot.subplots()
         self.ax.grid(True)
@@ -128,12 +140,13 @@ class CurveBox(Gtk.Box):
             ))
         )
 
-        self.canvas.draw()
+        # coalesce drag events into at most one redraw per frame
+        self.render_scheduler.mark_dirty(self.canvas.draw)
 
 class ControlGroup(Adw.PreferencesGroup):
     class MotorWP(enum.Enum):
-        QWP = '55353314'  # azimuth
-        HWP = '55356974'  # ellipticity
+        QWP = pol_compensation.QWP_SERIAL_NO  # azimuth
+        HWP = pol_compensation.HWP_SERIAL_NO  # ellipticity
 
     def __init__(
             self,
@@ -141,6 +154,10 @@ class ControlGroup(Adw.PreferencesGroup):
             motor_controllers: list[motor_gui_widget.MotorControlPage],
             set_enable_compensation_callback: typing.Callable,
             get_enable_compensation_callback: typing.Callable,
+            set_model_compensation_callback: typing.Callable,
+            get_model_compensation_callback: typing.Callable,
+            set_adaptive_integration_callback: typing.Callable,
+            get_adaptive_integration_callback: typing.Callable,
             set_target_azimuth_callback: typing.Callable,
             get_target_azimuth_callback: typing.Callable,
             set_target_ellipticity_callback: typing.Callable,
@@ -156,12 +173,19 @@ class ControlGroup(Adw.PreferencesGroup):
             set_ellipticity_velocity_callback: typing.Callable,
             get_ellipticity_velocity_callback: typing.Callable,
     ) -> None:
+        import polarimeter.gui_widget as polarimeter_gui_widget
+        from motor import base_motor
+
         super().__init__(title='Polarisation Compensation')
         self.polarimeter_gui_widget = polarisation_gui_widget
         self.motor_controllers = [m.motor_controls_group for m in motor_controllers]
 
         self.set_enable_compensation = set_enable_compensation_callback
         self.get_enable_compensation = get_enable_compensation_callback
+        self.set_model_compensation = set_model_compensation_callback
+        self.get_model_compensation = get_model_compensation_callback
+        self.set_adaptive_integration = set_adaptive_integration_callback
+        self.get_adaptive_integration = get_adaptive_integration_callback
         self.set_target_azimuth = set_target_azimuth_callback
         self.get_target_azimuth = get_target_azimuth_callback
         self.set_target_ellipticity = set_target_ellipticity_callback
@@ -200,9 +224,6 @@ class ControlGroup(Adw.PreferencesGroup):
             m.motor for m in self.motor_controllers if m.manual_motor_control == False
         ]
 
-        self.target_azimuth = 0
-        self.target_ellipticity = 0
-
         # motor settings
         self.azimuth_motor_step_size = 0
         self.azimuth_motor_acceleration = 0
@@ -213,7 +234,20 @@ class ControlGroup(Adw.PreferencesGroup):
         self.ellipticity_motor_max_velocity = 0
         self.ellipticity_motor_direction = base_motor.MotorDirection.IDLE
 
-        self.pol_comp_time = 0.1
+        # rebuilt whenever the motors or velocity tables are swapped out
+        self._controller = None
+        self._controller_inputs = None
+        # controller commands go out on one thread per motor
+        self._dispatched_motors = {}
+        self.integrator = adaptive.AdaptiveIntegrator()
+        self._stop_event = threading.Event()
+
+        # both boxes publish every frame from their acquisition thread; the
+        # polarimeter box through the acquisition wrapper around its device
+        if type(self.polarimeter_gui_widget) == polarimeter_gui_widget.PolarimeterBox:
+            self.measurement_bus = self.polarimeter_gui_widget.polarimeter.measurement_bus
+        else:
+            self.measurement_bus = self.polarimeter_gui_widget.measurement_bus
 
         # enable compensation
         enable_compensation_row = Adw.ActionRow(
@@ -236,6 +270,50 @@ class ControlGroup(Adw.PreferencesGroup):
             widget=enable_compensation_switch
         )
 
+        # model based compensation
+        model_compensation_row = Adw.ActionRow(
+            title='Model based compensation',
+            subtitle='Move the waveplates to angles solved from a Mueller model'
+        )
+        self.add(child=model_compensation_row)
+
+        model_compensation_switch = Gtk.Switch(
+            active=self.get_model_compensation(),
+            valign=Gtk.Align.CENTER
+        )
+        model_compensation_switch.connect(
+            'notify::active',
+            lambda sw, _: self.set_model_compensation(sw.get_active())
+        )
+        model_compensation_row.add_suffix(
+            widget=model_compensation_switch
+        )
+        model_compensation_row.set_activatable_widget(
+            widget=model_compensation_switch
+        )
+
+        # adaptive integration
+        adaptive_integration_row = Adw.ActionRow(
+            title='Adaptive integration',
+            subtitle='Average more samples per step near lock'
+        )
+        self.add(child=adaptive_integration_row)
+
+        adaptive_integration_switch = Gtk.Switch(
+            active=self.get_adaptive_integration(),
+            valign=Gtk.Align.CENTER
+        )
+        adaptive_integration_switch.connect(
+            'notify::active',
+            lambda sw, _: self.set_adaptive_integration(sw.get_active())
+        )
+        adaptive_integration_row.add_suffix(
+            widget=adaptive_integration_switch
+        )
+        adaptive_integration_row.set_activatable_widget(
+            widget=adaptive_integration_switch
+        )
+
         # azimuth
         target_azimuth_row = Adw.ActionRow(title='Target azimuth')
         self.add(child=target_azimuth_row)
@@ -271,21 +349,76 @@ class ControlGroup(Adw.PreferencesGroup):
         self._pol_comp_thread.start()
 
     def _pol_comp_loop(self) -> None:
-        while True:
-            if self.get_enable_compensation():
-                pol_compensation.pol_comp(
-                    motor_list=self.available_motors,
-                    motor_qwp_serial_no=self.MotorWP.QWP.value,
-                    motor_hwp_serial_no=self.MotorWP.HWP.value,
-                    target_azimuth=self.get_target_azimuth(),
-                    target_ellipticity=self.get_target_ellipticity(),
-                    azimuth_velocities=self.get_azimuth_velocity(),
-                    ellipticity_velocities=self.get_ellipticity_velocity(),
-                    current_azimuth=self.polarimeter_gui_widget.data.azimuth,
-                    current_ellipticity=self.polarimeter_gui_widget.data.ellipticity
+        # one control step per new snapshot, so a sample is never acted on twice
+        sequence = 0
+        while not self._stop_event.is_set():
+            snapshot = self.measurement_bus.wait_next(after=sequence, timeout=1)
+            if snapshot is None:
+                continue
+            sequence = snapshot.sequence
+            if not self.get_enable_compensation():
+                # motors may be driven by hand meanwhile, so start afresh
+                self._controller = None
+                self.integrator.reset()
+                continue
+
+            target_azimuth = self.get_target_azimuth()
+            target_ellipticity = self.get_target_ellipticity()
+            controller = self.get_controller()
+            control_input = adaptive.control_input(
+                snapshot=snapshot,
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                integrator=self.integrator if self.get_adaptive_integration() else None,
+                moving=any(m.is_moving for m in self._dispatched_motors.values())
+            )
+            if control_input is None:
+                continue
+            current_azimuth, current_ellipticity, current_stokes = control_input
+
+            with profiler.PROFILER.section(name='control'):
+                controller.update(
+                    target_azimuth=target_azimuth,
+                    target_ellipticity=target_ellipticity,
+                    current_azimuth=current_azimuth,
+                    current_ellipticity=current_ellipticity,
+                    current_stokes=current_stokes,
+                    sequence=snapshot.sequence
                 )
-            time.sleep(self.pol_comp_time)
 
+    def get_controller(self) -> pol_compensation.PolCompController | pol_compensation.ModelController:
+        inputs = (
+            self.available_motors,
+            self.get_azimuth_velocity(),
+            self.get_ellipticity_velocity(),
+            self.get_model_compensation()
+        )
+        if self._controller is None or any(
+            a is not b for a, b in zip(inputs, self._controller_inputs)
+        ):
+            if self.get_model_compensation():
+                controller_class = pol_compensation.ModelController
+            else:
+                controller_class = pol_compensation.PolCompController
+            self._controller = controller_class(
+                motor_list=dispatcher.dispatch(
+                    motor_list=self.available_motors,
+                    cache=self._dispatched_motors
+                ),
+                motor_qwp_serial_no=self.MotorWP.QWP.value,
+                motor_hwp_serial_no=self.MotorWP.HWP.value,
+                azimuth_velocities=self.get_azimuth_velocity(),
+                ellipticity_velocities=self.get_ellipticity_velocity(),
+                tracer=latency.TRACER
+            )
+            self._controller_inputs = inputs
+        return self._controller
+
+    def close(self) -> None:
+        # no queued controller command may reach a motor after this
+        self._stop_event.set()
+        for m in self._dispatched_motors.values():
+            m.close()
 
     def on_set_target_azimuth(self, entry: Gtk.Entry):
         try:
@@ -321,22 +454,6 @@ class ControlGroup(Adw.PreferencesGroup):
         ]
         print(self.available_motors)
 
-    def pol_comp(self) -> bool:
-        if not self.get_enable_compensation():
-            return True
-        pol_compensation.pol_comp(
-            motor_list=self.available_motors,
-            motor_qwp_serial_no=self.MotorWP.QWP.value,
-            motor_hwp_serial_no=self.MotorWP.HWP.value,
-            target_azimuth=self.target_azimuth,
-            target_ellipticity=self.target_ellipticity,
-            azimuth_velocities=self.get_azimuth_velocity(),
-            ellipticity_velocities=self.get_ellipticity_velocity(),
-            current_azimuth=self.polarimeter_gui_widget.data.azimuth,
-            current_ellipticity=self.polarimeter_gui_widget.data.ellipticity
-        )
-        return True
-
 class DevicesGroup(Adw.PreferencesGroup):
     def __init__(
             self,
@@ -350,8 +467,10 @@ class DevicesGroup(Adw.PreferencesGroup):
             get_azimuth_velocity_callback: typing.Callable,
             set_ellipticity_velocity_callback: typing.Callable,
             get_ellipticity_velocity_callback: typing.Callable,
+            render_scheduler: timetagger_gui_widget.RenderScheduler
     ) -> None:
         super().__init__(title='Devices')
+        self.render_scheduler = render_scheduler
         self.set_qwp_motor = set_qwp_motor_callback
         self.get_qwp_motor = get_qwp_motor_callback
         self.set_hwp_motor = set_hwp_motor_callback
@@ -433,7 +552,8 @@ class DevicesGroup(Adw.PreferencesGroup):
         )
         curve_box = CurveBox(
             set_angle_velocity_callback=self.set_azimuth_velocity,
-            get_angle_velocity_callback=self.get_azimuth_velocity
+            get_angle_velocity_callback=self.get_azimuth_velocity,
+            render_scheduler=self.render_scheduler
         )
         dialog_box.append(child=curve_box)
 
@@ -450,7 +570,8 @@ class DevicesGroup(Adw.PreferencesGroup):
         )
         curve_box = CurveBox(
             set_angle_velocity_callback=self.set_ellipticity_velocity,
-            get_angle_velocity_callback=self.get_ellipticity_velocity
+            get_angle_velocity_callback=self.get_ellipticity_velocity,
+            render_scheduler=self.render_scheduler
         )
         dialog_box.append(child=curve_box)
 
@@ -460,10 +581,13 @@ class PolCompPage(Adw.PreferencesPage):
     def __init__(
             self,
             polarimeter_gui_widget: polarimeter_gui_widget.PolarimeterBox | timetagger_gui_widget.TimeTaggerBox,
-            motor_controllers: list[motor_gui_widget.MotorControlPage]
+            motor_controllers: list[motor_gui_widget.MotorControlPage],
+            render_scheduler: timetagger_gui_widget.RenderScheduler
     ) -> None:
         super().__init__()
         self.enable_compensation = False
+        self.model_compensation = False
+        self.adaptive_integration = False
 
         self.target_azimuth = 0
         self.target_ellipticity = 0
@@ -497,20 +621,18 @@ class PolCompPage(Adw.PreferencesPage):
         #     (1.0, 1),
         #     (0.075, 0.1)
         # ]
-        self.azimuth_velocity = [
-            (5.0, 25.0),
-            (2.5, 15.0),
-        ]
-        self.ellipticity_velocity = [
-            (5.0, 25.0),
-            (2.5, 15.0),
-        ]
+        self.azimuth_velocity = list(pol_compensation.AZIMUTH_VELOCITIES)
+        self.ellipticity_velocity = list(pol_compensation.ELLIPTICITY_VELOCITIES)
 
         self.control_group = ControlGroup(
             polarisation_gui_widget=polarimeter_gui_widget,
             motor_controllers=motor_controllers,
             set_enable_compensation_callback=self.set_enable_compensation,
             get_enable_compensation_callback=self.get_enable_compensation,
+            set_model_compensation_callback=self.set_model_compensation,
+            get_model_compensation_callback=self.get_model_compensation,
+            set_adaptive_integration_callback=self.set_adaptive_integration,
+            get_adaptive_integration_callback=self.get_adaptive_integration,
             set_target_azimuth_callback=self.set_target_azimuth,
             get_target_azimuth_callback=self.get_target_azimuth,
             set_target_ellipticity_callback=self.set_target_ellipticity,
@@ -539,15 +661,32 @@ class PolCompPage(Adw.PreferencesPage):
             get_azimuth_velocity_callback=self.get_azimuth_velocity,
             set_ellipticity_velocity_callback=self.set_ellipticity_velocity,
             get_ellipticity_velocity_callback=self.get_ellipticity_velocity,
+            render_scheduler=render_scheduler
         )
         self.add(group=self.devices_group)
 
+        from bb84 import gui_widget as timetagger_gui_widget
+        self.profiler_group = timetagger_gui_widget.ProfilerGroup()
+        self.add(group=self.profiler_group)
+
     def set_enable_compensation(self, value: bool) -> None:
         self.enable_compensation = value
 
     def get_enable_compensation(self) -> bool:
         return self.enable_compensation
 
+    def set_model_compensation(self, value: bool) -> None:
+        self.model_compensation = value
+
+    def get_model_compensation(self) -> bool:
+        return self.model_compensation
+
+    def set_adaptive_integration(self, value: bool) -> None:
+        self.adaptive_integration = value
+
+    def get_adaptive_integration(self) -> bool:
+        return self.adaptive_integration
+
     def set_target_azimuth(self, value: float) -> None:
         self.target_azimuth = value
 
@@ -590,6 +729,124 @@ class PolCompPage(Adw.PreferencesPage):
     def get_ellipticity_velocity(self) -> list[tuple]:
         return self.ellipticity_velocity
 
+class PolarimeterAcquisition:
+    def __init__(self, polarimeter) -> None:
+        # stands in for the polarimeter handed to the polarimeter box: the
+        # device is measured back to back on its own thread and the box is
+        # served the latest frame, so its refresh timer never waits on the
+        # device from the main loop
+        self.polarimeter = polarimeter
+        # the remote device is one socket, so every call goes through one lock
+        self._device_lock = threading.Lock()
+        self._frame_condition = threading.Condition()
+        self._latest_raw_data = None
+        self._latest_sequence = 0
+        self.data = None
+        # every reduced frame is published for the compensation loop as soon
+        # as it is acquired
+        self.measurement_bus = measurement_bus.MeasurementBus()
+        self._stop_event = threading.Event()
+        self._acquisition_thread = threading.Thread(
+            target=self._acquisition_loop,
+            daemon=True
+        )
+        self._acquisition_thread.start()
+
+    def __getattr__(self, name: str):
+        with self._device_lock:
+            attr = getattr(self.polarimeter, name)
+        if not callable(attr):
+            return attr
+        def locked(*args, **kwargs):
+            with self._device_lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    def measure(self):
+        # only the first call waits, for the first frame
+        with self._frame_condition:
+            self._frame_condition.wait_for(
+                lambda: self._latest_raw_data is not None or self._stop_event.is_set()
+            )
+            if self._latest_sequence:
+                latency.TRACER.mark(sequence=self._latest_sequence, point='rendered')
+            return self._latest_raw_data
+
+    def stop_acquisition(self, timeout: float | None = 2.0) -> bool:
+        self._stop_event.set()
+        self.measurement_bus.close()
+        with self._frame_condition:
+            self._frame_condition.notify_all()
+        self._acquisition_thread.join(timeout=timeout)
+        return not self._acquisition_thread.is_alive()
+
+    def _acquisition_loop(self) -> None:
+        import polarimeter.remote_polarimeter as remote_polarimeter
+
+        while not self._stop_event.is_set():
+            acquire_start = time.perf_counter_ns()
+            try:
+                with profiler.PROFILER.section(name='acquire'):
+                    with self._device_lock:
+                        raw_data = self.polarimeter.measure()
+                acquire_end = time.perf_counter_ns()
+            except Exception as e:
+                print(f'Error: measurement failed {e}')
+                self._stop_event.wait(timeout=0.1)
+                continue
+            with profiler.PROFILER.section(name='compute'):
+                try:
+                    self.data = remote_polarimeter.thorlabs_polarimeter.Data().from_raw_data(
+                        raw_data=raw_data
+                    )
+                except Exception as e:
+                    print(f'Error: could not reduce measurement {e}')
+                    continue
+            snapshot = self.measurement_bus.publish(data=self.data)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='acquire_start', time_ns=acquire_start)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='acquire_end', time_ns=acquire_end)
+            latency.TRACER.mark(sequence=snapshot.sequence, point='published')
+            with self._frame_condition:
+                self._latest_raw_data = raw_data
+                self._latest_sequence = snapshot.sequence
+                self._frame_condition.notify_all()
+
+def import_gui_modules() -> None:
+    import polarimeter.gui_widget
+    import motor.gui_widget
+    import bb84.gui_widget
+
+def connect_polarimeter():
+    import polarimeter.remote_polarimeter as remote_polarimeter
+    return remote_polarimeter.Polarimeter(
+        host=remote_polarimeter.server_host,
+        port=remote_polarimeter.server_port,
+        serial_number='M00910360'
+    )
+
+def connect_timetagger():
+    from bb84 import remote_timetagger
+    return remote_timetagger.Timetagger(
+        host=remote_timetagger.server_host,
+        port=remote_timetagger.server_port
+    )
+
+def connect_motors() -> list:
+    from motor import remote_motor
+    motors = remote_motor.list_motors(
+        host=remote_motor.server_host,
+        port=remote_motor.server_port
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(motors), 1)) as executor:
+        return list(executor.map(
+            lambda m: remote_motor.Motor(
+                serial_number=m.device_info.serial_number,
+                host=remote_motor.server_host,
+                port=remote_motor.server_port
+            ),
+            motors
+        ))
+
 class MainWindow(Adw.ApplicationWindow):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -613,51 +870,94 @@ class MainWindow(Adw.ApplicationWindow):
         self.content_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
         main_box.append(child=self.content_box)
 
+        self.polarisation_box = None
+        self.motor_controllers = []
+        self.pol_comp_page = None
+
+        ### placeholder until the devices are connected
+        self.placeholder = Adw.StatusPage(
+            title='Connecting to devices',
+            child=Gtk.Spinner(spinning=True),
+            hexpand=True,
+            vexpand=True
+        )
+        self.content_box.append(child=self.placeholder)
+
+        threading.Thread(
+            target=self._connect_devices,
+            daemon=True
+        ).start()
+
+    def _connect_devices(self) -> None:
+        # imports and device connections run concurrently off the main loop
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            gui_modules = executor.submit(import_gui_modules)
+            if USE_TIMETAGGER:
+                polarimeter = executor.submit(connect_timetagger)
+            else:
+                polarimeter = executor.submit(connect_polarimeter)
+            motors = executor.submit(connect_motors)
+        try:
+            gui_modules.result()
+            GLib.idle_add(
+                self._on_devices_ready,
+                polarimeter.result(),
+                motors.result()
+            )
+        except Exception as e:
+            GLib.idle_add(self._on_devices_failed, e)
+
+    def _on_devices_failed(self, error: Exception) -> bool:
+        self.placeholder.set_title(title='No devices found')
+        self.placeholder.set_description(description=str(error))
+        self.placeholder.set_child(child=None)
+        return False
+
+    def _on_devices_ready(self, polarimeter, motors: list) -> bool:
+        import polarimeter.gui_widget as polarimeter_gui_widget
+        from motor import gui_widget as motor_gui_widget
+        from bb84 import gui_widget as timetagger_gui_widget
+
+        self.content_box.remove(child=self.placeholder)
+
+        # one frame-clock callback for every plot in the window
+        self.render_scheduler = timetagger_gui_widget.RenderScheduler(
+            widget=self,
+            max_fps=30
+        )
+
         ### polarimeter box
         # self.polarisation_box = polarimeter_gui_widget.PolarimeterBox()
-        self.polarisation_box = polarimeter_gui_widget.PolarimeterBox(
-            polarimeter=remote_polarimeter.Polarimeter(
-                host=remote_polarimeter.server_host,
-                port=remote_polarimeter.server_port,
-                serial_number='M00910360'
+        if USE_TIMETAGGER:
+            self.polarisation_box = timetagger_gui_widget.TimeTaggerBox(
+                tt=polarimeter,
+                render_scheduler=self.render_scheduler
             )
-        )
-        # self.polarisation_box = timetagger_gui_widget.TimeTaggerBox(
-        #     tt=remote_timetagger.Timetagger(
-        #         host=remote_timetagger.server_host,
-        #         port=remote_timetagger.server_port
-        #     )
-        # )
-        # self.polarisation_box = timetagger_gui_widget.TimeTaggerBox()
+        else:
+            self.polarisation_box = polarimeter_gui_widget.PolarimeterBox(
+                polarimeter=PolarimeterAcquisition(polarimeter=polarimeter)
+            )
+            # the polarimeter box redraws from its own timer, and its canvases
+            # render while the window paints, so the paint phase is the render
+            # span for this path
+            self._paint_start = 0
+            frame_clock = self.get_frame_clock()
+            frame_clock.connect('before-paint', self._on_before_paint)
+            frame_clock.connect('after-paint', self._on_after_paint)
         self.content_box.append(child=self.polarisation_box)
 
         ### init motor control boxes
         # self.motors = thorlabs_motor.list_motors()
-        self.motors = remote_motor.list_motors(
-            host=remote_motor.server_host,
-            port=remote_motor.server_port
-        )
-        self.motor_controllers: list[motor_gui_widget.MotorControlPage] = []
-        for i, m in enumerate(self.motors):
-            self.motor_controllers.append(
-                # motor_box.MotorControlPage(
-                #     motor=thorlabs_motor.Motor(
-                #         serial_number=m.device_info.serial_number
-                #     )
-                # )
-                motor_gui_widget.MotorControlPage(
-                    motor=remote_motor.Motor(
-                        serial_number=m.device_info.serial_number,
-                        host=remote_motor.server_host,
-                        port=remote_motor.server_port
-                    )
-                )
-            )
+        self.motors = motors
+        self.motor_controllers: list[motor_gui_widget.MotorControlPage] = [
+            motor_gui_widget.MotorControlPage(motor=m) for m in self.motors
+        ]
 
         ### pol comp
         self.pol_comp_page = PolCompPage(
             polarimeter_gui_widget=self.polarisation_box,
-            motor_controllers=self.motor_controllers
+            motor_controllers=self.motor_controllers,
+            render_scheduler=self.render_scheduler
         )
         self.content_box.append(child=self.pol_comp_page)
 
@@ -666,12 +966,35 @@ class MainWindow(Adw.ApplicationWindow):
             self.content_box.append(
                 child=self.motor_controllers[i]
             )
+        return False
+
+    def _on_before_paint(self, frame_clock) -> None:
+        self._paint_start = time.perf_counter_ns()
+
+    def _on_after_paint(self, frame_clock) -> None:
+        profiler.PROFILER.record(
+            name='render',
+            start_ns=self._paint_start,
+            duration_ns=time.perf_counter_ns() - self._paint_start
+        )
 
     def on_close_request(self, window: Adw.ApplicationWindow) -> bool:
-        if type(self.polarisation_box) == polarimeter_gui_widget.PolarimeterBox:
-            self.polarisation_box.polarimeter.disconnect()
+        # the control loop stops before the bus it waits on is closed
+        if self.pol_comp_page is not None:
+            self.pol_comp_page.control_group.close()
+        if self.polarisation_box is not None:
+            import polarimeter.gui_widget as polarimeter_gui_widget
+            from bb84 import gui_widget as timetagger_gui_widget
+            if type(self.polarisation_box) == polarimeter_gui_widget.PolarimeterBox:
+                self.polarisation_box.polarimeter.stop_acquisition()
+                self.polarisation_box.polarimeter.disconnect()
+            elif type(self.polarisation_box) == timetagger_gui_widget.TimeTaggerBox:
+                self.polarisation_box.stop()
         for i in self.motor_controllers:
             i.motor_controls_group.motor.stop()
+        profiler.PROFILER.close()
+        if latency.EXPORT_PATH:
+            latency.TRACER.export(path=latency.EXPORT_PATH)
         return False
 
 class App(Adw.Application):
@@ -688,6 +1011,7 @@ if __name__ == '__main__':
     try:
         app.run(sys.argv)
     except Exception as e:
+        import polarimeter.gui_widget as polarimeter_gui_widget
         if type(app.win.polarisation_box) == polarimeter_gui_widget.PolarimeterBox:
             app.win.polarisation_box.polarimeter.disconnect()
-        print('App crashed with an exception:', e)
\ No newline at end of file
+        print('App crashed with an exception:', e)
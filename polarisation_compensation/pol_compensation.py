@@ -1,5 +1,6 @@
 import sys
 import os
+import bisect
 import motor.base_motor as base_motor
 
 # sys.path.append(
@@ -10,6 +11,307 @@ import motor.base_motor as base_motor
 # )
 # import motor.base_motor as base_motor
 
+QWP_SERIAL_NO = '55353314'  # azimuth
+HWP_SERIAL_NO = '55356974'  # ellipticity
+
+# order light passes the plates on the bench, used by the mueller model. this
+# is a property of how the bench is built, not something the controllers can
+# infer; it has not been measured, so check which plate the light reaches
+# first on the bench and set it to match
+HWP_FIRST = True
+
+## thresholds (descending order)
+AZIMUTH_VELOCITIES = [
+    (5.0, 25.0),
+    (2.5, 15.0),
+]
+ELLIPTICITY_VELOCITIES = [
+    (5.0, 25.0),
+    (2.5, 15.0),
+]
+
+class AxisController:
+    def __init__(
+            self,
+            motor: base_motor.Motor,
+            thresholds_velocities: list[tuple[float, float]],
+            acceleration: float = 20.0
+    ) -> None:
+        self.motor = motor
+        self.acceleration = acceleration
+
+        # ascending thresholds, so the largest one below |error| is found with
+        # a bisect instead of a sort and scan per tick
+        thresholds_velocities = sorted(thresholds_velocities)
+        self.thresholds = [t for t, _ in thresholds_velocities]
+        self.velocities = [v for _, v in thresholds_velocities]
+
+        # last command sent, seeded from the motor once
+        if motor.is_moving:
+            self.direction = motor.direction
+            self.velocity = motor.max_velocity
+        else:
+            self.direction = base_motor.MotorDirection.IDLE
+            self.velocity = 0.0
+
+    def velocity_for(self, error: float) -> float:
+        index = bisect.bisect_left(self.thresholds, abs(error))
+        if index == 0:
+            return 0.0
+        return self.velocities[index - 1]
+
+    def decide(
+            self,
+            current_value: float,
+            target_value: float
+    ) -> tuple[base_motor.MotorDirection, float] | None:
+        # the command to send, or None when it matches the last one
+        delta = target_value - current_value
+        velocity = self.velocity_for(error=delta)
+
+        if velocity == 0.0:
+            direction = base_motor.MotorDirection.IDLE
+        elif delta > 0:
+            direction = base_motor.MotorDirection.FORWARD
+        else:
+            direction = base_motor.MotorDirection.BACKWARD
+
+        if direction == self.direction and (
+            velocity == self.velocity or direction == base_motor.MotorDirection.IDLE
+        ):
+            return None
+        return direction, velocity
+
+    def send(self, command: tuple[base_motor.MotorDirection, float]) -> None:
+        direction, velocity = command
+        if direction == base_motor.MotorDirection.IDLE:
+            self.motor.stop()
+        else:
+            self.motor.direction = direction
+            self.motor.jog(
+                direction=direction,
+                acceleration=self.acceleration,
+                max_velocity=velocity
+            )
+        self.direction = direction
+        self.velocity = velocity
+
+    def update(self, current_value: float, target_value: float) -> None:
+        command = self.decide(current_value=current_value, target_value=target_value)
+        if command is not None:
+            self.send(command=command)
+
+    def stop(self) -> None:
+        self.motor.stop()
+        self.reset()
+
+    def reset(self) -> None:
+        # the motor was stopped elsewhere
+        self.direction = base_motor.MotorDirection.IDLE
+        self.velocity = 0.0
+
+class PolCompController:
+    def __init__(
+            self,
+            motor_list: list[base_motor.Motor],
+            motor_qwp_serial_no: str,
+            motor_hwp_serial_no: str,
+            azimuth_velocities: list[tuple[float, float]],
+            ellipticity_velocities: list[tuple[float, float]],
+            tracer=None
+    ) -> None:
+        # tracer is anything with mark(sequence, point), e.g. bb84.latency.TRACER
+        self.tracer = tracer
+        motors = {m.device_info.serial_number: m for m in motor_list}
+        self.azimuth_axis = None
+        self.ellipticity_axis = None
+        if motor_qwp_serial_no in motors:
+            self.azimuth_axis = AxisController(
+                motor=motors[motor_qwp_serial_no],
+                thresholds_velocities=azimuth_velocities
+            )
+        if motor_hwp_serial_no in motors:
+            self.ellipticity_axis = AxisController(
+                motor=motors[motor_hwp_serial_no],
+                thresholds_velocities=ellipticity_velocities
+            )
+
+    def update(
+            self,
+            target_azimuth: float,
+            target_ellipticity: float,
+            current_azimuth: float,
+            current_ellipticity: float,
+            current_stokes: tuple[float, float, float] | None = None,
+            sequence: int | None = None
+    ) -> bool:
+        # current_stokes is only used by the model based controller
+        commands = []
+        for axis, current_value, target_value in (
+            (self.azimuth_axis, current_azimuth, target_azimuth),
+            (self.ellipticity_axis, current_ellipticity, target_ellipticity)
+        ):
+            if axis is None:
+                continue
+            command = axis.decide(current_value=current_value, target_value=target_value)
+            if command is not None:
+                commands.append((axis, command))
+        self.mark(sequence=sequence, point='decided')
+
+        for axis, command in commands:
+            axis.send(command=command)
+        if commands:
+            self.mark(sequence=sequence, point='commanded')
+        return True
+
+    def mark(self, sequence: int | None, point: str) -> None:
+        if self.tracer is not None and sequence is not None:
+            self.tracer.mark(sequence=sequence, point=point)
+
+    def stop(self) -> None:
+        for axis in (self.azimuth_axis, self.ellipticity_axis):
+            if axis is not None:
+                axis.stop()
+
+    def reset(self) -> None:
+        for axis in (self.azimuth_axis, self.ellipticity_axis):
+            if axis is not None:
+                axis.reset()
+
+class ModelController:
+    def __init__(
+            self,
+            motor_list: list[base_motor.Motor],
+            motor_qwp_serial_no: str,
+            motor_hwp_serial_no: str,
+            azimuth_velocities: list[tuple[float, float]],
+            ellipticity_velocities: list[tuple[float, float]],
+            solve_threshold: float = 3.0,
+            min_step: float = 1.0,
+            hwp_first: bool = HWP_FIRST,
+            qwp_offset: float = 0.0,
+            hwp_offset: float = 0.0,
+            tracer=None
+    ) -> None:
+        # a sample further than solve_threshold from the target is fitted to
+        # an hwp+qwp mueller model and both plates are sent absolute targets
+        # for the solution needing least travel, re-aimed on later samples
+        # while the error stays that large so fast drift is followed. inside
+        # solve_threshold the threshold jogging fine tunes, which also absorbs
+        # what the ideal model gets wrong about the bench; measured plate
+        # offsets can be given as qwp_offset and hwp_offset
+        from polarisation_compensation import mueller
+        self.mueller = mueller
+        self.model = mueller.WaveplateModel(
+            qwp_offset=qwp_offset,
+            hwp_offset=hwp_offset,
+            hwp_first=hwp_first
+        )
+        # polarisation space error, in degrees, above which the model moves
+        # the plates; just above the finest jog threshold, so jogging has a
+        # band to work in without taking over moves the model makes better
+        self.solve_threshold = solve_threshold
+        # smaller target changes are not worth a motor command; a few times
+        # the plate angle scatter polarimeter noise puts on the solution, so a
+        # locked loop stops commanding
+        self.min_step = min_step
+
+        self.fallback = PolCompController(
+            motor_list=motor_list,
+            motor_qwp_serial_no=motor_qwp_serial_no,
+            motor_hwp_serial_no=motor_hwp_serial_no,
+            azimuth_velocities=azimuth_velocities,
+            ellipticity_velocities=ellipticity_velocities,
+            tracer=tracer
+        )
+        motors = {m.device_info.serial_number: m for m in motor_list}
+        self.qwp_motor = motors.get(motor_qwp_serial_no)
+        self.hwp_motor = motors.get(motor_hwp_serial_no)
+
+        # last absolute target sent to each plate
+        self.targets = {}
+
+    def update(
+            self,
+            target_azimuth: float,
+            target_ellipticity: float,
+            current_azimuth: float,
+            current_ellipticity: float,
+            current_stokes: tuple[float, float, float] | None = None,
+            sequence: int | None = None
+    ) -> bool:
+        if current_stokes is None or self.qwp_motor is None or self.hwp_motor is None:
+            return self.fallback.update(
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                current_azimuth=current_azimuth,
+                current_ellipticity=current_ellipticity,
+                sequence=sequence
+            )
+
+        target_stokes = self.mueller.stokes(
+            azimuth=target_azimuth,
+            ellipticity=target_ellipticity
+        )
+        if self.mueller.separation(current_stokes, target_stokes) <= self.solve_threshold:
+            if any(m.is_moving and m in self.targets for m in (self.qwp_motor, self.hwp_motor)):
+                # a model move is still landing; jogging now would fight it
+                self.fallback.mark(sequence=sequence, point='decided')
+                return True
+            self.targets = {}
+            return self.fallback.update(
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                current_azimuth=current_azimuth,
+                current_ellipticity=current_ellipticity,
+                sequence=sequence
+            )
+
+        for axis in (self.fallback.azimuth_axis, self.fallback.ellipticity_axis):
+            if axis is not None and axis.direction != base_motor.MotorDirection.IDLE:
+                axis.stop()
+        qwp_position = self.qwp_motor.position
+        hwp_position = self.hwp_motor.position
+        self.model.fit(
+            measured_stokes=current_stokes,
+            qwp_position=qwp_position,
+            hwp_position=hwp_position
+        )
+        qwp_target, hwp_target, _ = self.model.solve(
+            target_stokes=target_stokes,
+            near=(qwp_position, hwp_position)
+        )
+        self.fallback.mark(sequence=sequence, point='decided')
+
+        commanded = False
+        for motor, position, target, period in (
+            (self.qwp_motor, qwp_position, qwp_target, self.mueller.QWP_PERIOD),
+            (self.hwp_motor, hwp_position, hwp_target, self.mueller.HWP_PERIOD)
+        ):
+            target = self.mueller.nearest_equivalent(
+                angle=target,
+                current=position,
+                period=period
+            )
+            # a plate still moving is compared with where it is headed
+            reference = self.targets.get(motor, position) if motor.is_moving else position
+            if abs(target - reference) < self.min_step:
+                continue
+            motor.move_to(target)
+            self.targets[motor] = target
+            commanded = True
+        if commanded:
+            self.fallback.mark(sequence=sequence, point='commanded')
+        return True
+
+    def stop(self) -> None:
+        self.fallback.stop()
+        self.targets = {}
+
+    def reset(self) -> None:
+        self.fallback.reset()
+        self.targets = {}
+
 def pol_comp(
         motor_list: list[base_motor.Motor],
         motor_qwp_serial_no: str,
@@ -21,71 +323,16 @@ def pol_comp(
         current_azimuth: float,
         current_ellipticity: float
 ) -> bool:
-    motor_qwp_index = next(
-        (i for i, m in enumerate(motor_list) if m.device_info.serial_number == motor_qwp_serial_no),
-        -1
-    )
-    motor_hwp_index = next(
-        (i for i, m in enumerate(motor_list) if m.device_info.serial_number == motor_hwp_serial_no),
-        -1
-    )
-
-    def adjust_motor(
-        motor_list: list[base_motor.Motor],
-        motor_index: int,
-        current_value: float,
-        target_value: float,
-        thresholds_velocities: list[tuple[float, float]]
-    ) -> None:
-        if motor_index == -1:
-            return
-
-        motor = motor_list[motor_index]
-        delta = target_value - current_value
-
-        # if abs(delta) < 1e-3:  # small error threshold to prevent jitter
-        #     motor.stop()
-        #     return
-
-        # target_direction = '-' if delta > 0 else '+'
-        target_direction = base_motor.MotorDirection.FORWARD if delta > 0 else base_motor.MotorDirection.BACKWARD
-        abs_delta = abs(delta)
-
-        for threshold, velocity in sorted(thresholds_velocities, reverse=True):
-            if abs_delta > threshold:
-                if (motor.direction != target_direction or
-                        motor.max_velocity != velocity):
-                    # motor.stop()
-                    motor.direction = target_direction
-                    motor.jog(
-                        direction=motor.direction,
-                        acceleration=20.0,
-                        max_velocity=velocity
-                    )
-                # print(f'{motor.device_info.serial_number} moving: {motor.is_moving}')
-                break
-            elif motor.is_moving == True:
-                motor.stop()
-            else:
-                pass
-                # print(f'{motor.device_info.serial_number} moving: {motor.is_moving}')
-                # motor.stop()
-
-
-    adjust_motor(
+    # one-off step; loops should keep a PolCompController instead
+    return PolCompController(
         motor_list=motor_list,
-        motor_index=motor_qwp_index,
-        current_value=current_azimuth,
-        target_value=target_azimuth,
-        thresholds_velocities=azimuth_velocities
+        motor_qwp_serial_no=motor_qwp_serial_no,
+        motor_hwp_serial_no=motor_hwp_serial_no,
+        azimuth_velocities=azimuth_velocities,
+        ellipticity_velocities=ellipticity_velocities
+    ).update(
+        target_azimuth=target_azimuth,
+        target_ellipticity=target_ellipticity,
+        current_azimuth=current_azimuth,
+        current_ellipticity=current_ellipticity
     )
-
-    adjust_motor(
-        motor_list=motor_list,
-        motor_index=motor_hwp_index,
-        current_value=current_ellipticity,
-        target_value=target_ellipticity,
-        thresholds_velocities=ellipticity_velocities
-    )
-
-    return True
\ No newline at end of file
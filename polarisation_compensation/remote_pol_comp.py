@@ -0,0 +1,85 @@
+import sys
+import socket
+import struct
+import typing
+
+from . import daemon_protocol
+
+class RemoteCompensation:
+    def __init__(
+            self,
+            host: str = daemon_protocol.DAEMON_HOST,
+            port: int = daemon_protocol.DAEMON_PORT
+    ) -> None:
+        self.host = host
+        self.port = port
+
+        self._sock = socket.socket(
+            socket.AF_INET,
+            socket.SOCK_STREAM
+        )
+        self._sock.connect((self.host, self.port))
+
+    def __del__(self) -> None:
+        self.disconnect()
+
+    def disconnect(self) -> None:
+        self._sock.close()
+
+    def get_state(self) -> daemon_protocol.State:
+        return self._request(command=daemon_protocol.Command.GET_STATE)
+
+    def set_enable_compensation(self, value: bool) -> daemon_protocol.State:
+        return self._request(
+            command=daemon_protocol.Command.ENABLE_COMPENSATION if value
+            else daemon_protocol.Command.DISABLE_COMPENSATION
+        )
+
+    def set_target(self, azimuth: float, ellipticity: float) -> daemon_protocol.State:
+        return self._request(
+            command=daemon_protocol.Command.SET_TARGET,
+            payload=struct.pack('!dd', azimuth, ellipticity)
+        )
+
+    def _request(
+            self,
+            command: daemon_protocol.Command,
+            payload: bytes = b''
+    ) -> daemon_protocol.State:
+        self._sock.sendall(struct.pack('I', command) + payload)
+        resp_type, payload = self._receive_response()
+        if resp_type != daemon_protocol.Response.STATE:
+            raise ConnectionError(f'Unexpected response: {resp_type}')
+        return daemon_protocol.State.deserialise(payload=payload)
+
+    def _recvall(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            part = self._sock.recv(size - len(data))
+            if not part:
+                raise ConnectionError('Socket closed')
+            data.extend(part)
+        return data
+
+    def _receive_response(self) -> tuple[typing.Any, bytes]:
+        header = self._recvall(size=5)
+        total_len, resp_type = struct.unpack('IB', header)
+        payload = self._recvall(total_len - 1)
+        return resp_type, payload
+
+if __name__ == '__main__':
+    # no arguments prints the state; enable, disable or target <azimuth>
+    # <ellipticity> changes it first
+    remote = RemoteCompensation()
+    match sys.argv[1:]:
+        case []:
+            state = remote.get_state()
+        case ['enable']:
+            state = remote.set_enable_compensation(value=True)
+        case ['disable']:
+            state = remote.set_enable_compensation(value=False)
+        case ['target', azimuth, ellipticity]:
+            state = remote.set_target(azimuth=float(azimuth), ellipticity=float(ellipticity))
+        case _:
+            sys.exit('usage: remote_pol_comp [enable | disable | target <azimuth> <ellipticity>]')
+    print(state)
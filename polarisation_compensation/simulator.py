@@ -0,0 +1,398 @@
+import sys
+import os
+import dataclasses
+import math
+import datetime
+import pathlib
+import time
+import types
+
+import numpy
+
+import motor.base_motor as base_motor
+
+sys.path.append(
+    os.path.abspath(os.path.join(
+        os.path.dirname(__file__),
+        os.path.pardir
+    ))
+)
+from polarisation_compensation import pol_compensation
+from polarisation_compensation import mueller
+from polarisation_compensation import adaptive
+
+def read_polarimeter_csv(
+        path: str | pathlib.Path,
+        absolute: bool = False
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # thorlabs pax export: 8 lines of device info, a header, then ';' separated
+    # rows; returns elapsed seconds, or posix seconds from the local time
+    # column when `absolute`, and normalised s1, s2, s3
+    times = []
+    stokes = []
+    with open(file=path, mode='r', encoding='utf-8-sig') as file:
+        lines = file.read().splitlines()
+    for line in lines[9:]:
+        fields = line.split(';')
+        if len(fields) < 5:
+            continue
+        if absolute:
+            times.append(datetime.datetime.strptime(
+                fields[0].strip(),
+                '%Y-%m-%d %H:%M:%S.%f'
+            ).timestamp())
+            stokes.append([float(f) for f in fields[2:5]])
+            continue
+        day_hours, minutes, seconds, milliseconds = fields[1].strip().split(':')
+        days, hours = day_hours.split('.')
+        times.append(
+            (int(days) * 24 + int(hours)) * 3600
+            + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+        )
+        stokes.append([float(f) for f in fields[2:5]])
+    return numpy.array(times), numpy.array(stokes)
+
+@dataclasses.dataclass
+class SimulatedDeviceInfo:
+    serial_number: str
+    device_name: str = 'Simulated rotation mount'
+
+class SimulatedMotor(base_motor.Motor):
+    def __init__(
+            self,
+            serial_number: str,
+            position: float = 0.0,
+            max_speed: float = 25.0,
+            max_acceleration: float = 20.0
+    ) -> None:
+        # kinematic rotation mount on a simulated clock; positions in degrees,
+        # speed and acceleration limits in degrees/s and degrees/s^2
+        self.device_info = SimulatedDeviceInfo(serial_number=serial_number)
+        self.position = position
+        self.max_speed = max_speed
+        self.max_acceleration = max_acceleration
+
+        self.direction = base_motor.MotorDirection.IDLE
+        self.max_velocity = 0.0
+        self.acceleration = max_acceleration
+        self.velocity = 0.0
+        self.travel = 0.0
+        self.n_commands = 0
+        self._target_velocity = 0.0
+        self._target_position = None
+
+    @property
+    def is_moving(self) -> bool:
+        return self.velocity != 0.0 or self._target_velocity != 0.0 or self._target_position is not None
+
+    def jog(
+            self,
+            direction: base_motor.MotorDirection,
+            acceleration: float,
+            max_velocity: float
+    ) -> None:
+        self.n_commands += 1
+        self.direction = direction
+        self.acceleration = min(acceleration, self.max_acceleration)
+        self.max_velocity = min(max_velocity, self.max_speed)
+        sign = 1 if direction == base_motor.MotorDirection.FORWARD else -1
+        self._target_velocity = sign * self.max_velocity
+        self._target_position = None
+
+    def move_by(self, angle: float) -> None:
+        self.n_commands += 1
+        self.acceleration = self.max_acceleration
+        self.max_velocity = self.max_speed
+        self._target_position = self.position + angle
+        self._target_velocity = 0.0
+
+    def move_to(self, position: float) -> None:
+        self.n_commands += 1
+        self.acceleration = self.max_acceleration
+        self.max_velocity = self.max_speed
+        self._target_position = position
+        self._target_velocity = 0.0
+
+    def stop(self) -> None:
+        self.n_commands += 1
+        self.direction = base_motor.MotorDirection.IDLE
+        self._target_velocity = 0.0
+        self._target_position = None
+
+    def advance(self, seconds: float) -> None:
+        if not self.is_moving:
+            return
+        if self._target_position is None:
+            self._ramp(target_velocity=self._target_velocity, seconds=seconds)
+            return
+
+        # point to point moves accelerate towards the target, cruise, and brake
+        # as late as the acceleration allows so they land on it; each phase is
+        # constant acceleration, so the interval is stepped phase by phase in
+        # closed form rather than in fixed time steps
+        while seconds > 0:
+            remaining = self._target_position - self.position
+            distance = abs(remaining)
+            # speed towards the target, negative while still heading away
+            speed = self.velocity if remaining >= 0 else -self.velocity
+            if speed < 0:
+                phase = -speed / self.acceleration
+                if phase > seconds:
+                    self._advance_towards(remaining=remaining, speed=speed + self.acceleration * seconds, seconds=seconds)
+                    return
+                self._advance_towards(remaining=remaining, speed=0.0, seconds=phase)
+                seconds -= phase
+                continue
+            if speed ** 2 / (2 * self.acceleration) >= distance - 1e-9:
+                # braking, at whatever rate stops exactly on the target
+                if speed == 0.0 or 2 * distance / speed <= seconds:
+                    self.travel += distance
+                    self.position = self._target_position
+                    self.velocity = 0.0
+                    self._target_position = None
+                    return
+                deceleration = speed ** 2 / (2 * distance)
+                self._advance_towards(remaining=remaining, speed=speed - deceleration * seconds, seconds=seconds)
+                return
+            peak = min(self.max_velocity, (self.acceleration * distance + speed ** 2 / 2) ** 0.5)
+            if speed < peak:
+                phase = (peak - speed) / self.acceleration
+                if phase > seconds:
+                    self._advance_towards(remaining=remaining, speed=speed + self.acceleration * seconds, seconds=seconds)
+                    return
+                self._advance_towards(remaining=remaining, speed=peak, seconds=phase)
+            else:
+                phase = (distance - speed ** 2 / (2 * self.acceleration)) / speed
+                if phase > seconds:
+                    self._advance_towards(remaining=remaining, speed=speed, seconds=seconds)
+                    return
+                self._advance_towards(remaining=remaining, speed=speed, seconds=phase)
+            seconds -= phase
+
+    def _advance_towards(self, remaining: float, speed: float, seconds: float) -> None:
+        # constant acceleration from the current velocity to `speed` towards
+        # the target over `seconds`
+        velocity = speed if remaining >= 0 else -speed
+        distance = (self.velocity + velocity) / 2 * seconds
+        self.position += distance
+        self.travel += abs(distance)
+        self.velocity = velocity
+
+    def _ramp(self, target_velocity: float, seconds: float) -> None:
+        # constant acceleration towards target_velocity, then constant speed
+        dv = target_velocity - self.velocity
+        ramp_time = min(abs(dv) / self.acceleration, seconds)
+        if ramp_time < seconds:
+            velocity = target_velocity
+        else:
+            velocity = self.velocity + math.copysign(self.acceleration * ramp_time, dv)
+        distance = (self.velocity + velocity) / 2 * ramp_time + velocity * (seconds - ramp_time)
+        self.position += distance
+        self.travel += abs(distance)
+        self.velocity = float(velocity)
+
+    def disconnect(self) -> None:
+        pass
+
+class SimulatedClock:
+    # stands in for time.time in controllers that look things up by time
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@dataclasses.dataclass
+class SimulationResult:
+    times: numpy.ndarray
+    errors: numpy.ndarray
+    settling_time: float
+    residual_rms: float
+    residual_p95: float
+    travel: dict[str, float]
+    n_commands: dict[str, int]
+    elapsed: float
+    # what the polarimeter saw and where the plates were at each sample, as
+    # the daemon's --record log keeps them
+    measured_stokes: numpy.ndarray | None = None
+    plate_positions: numpy.ndarray | None = None
+
+    def summary(self) -> str:
+        duration = self.times[-1] - self.times[0] if len(self.times) > 0 else 0.0
+        travel = ', '.join(f'{k} {v:.1f}°' for k, v in self.travel.items())
+        commands = sum(self.n_commands.values())
+        return (
+            f'settling {self.settling_time:.1f} s, residual rms {self.residual_rms:.2f}° '
+            f'p95 {self.residual_p95:.2f}°, travel {travel}, {commands} commands, '
+            f'{duration / self.elapsed:.0f}x real time'
+        )
+
+def settling_time(
+        times: numpy.ndarray,
+        errors: numpy.ndarray,
+        tolerance: float,
+        hold: float
+) -> float:
+    # first time the error stays within tolerance for `hold` seconds
+    within = errors <= tolerance
+    start = None
+    for t, ok in zip(times, within):
+        if not ok:
+            start = None
+        elif start is None:
+            start = t
+        if start is not None and t - start >= hold:
+            return float(start - times[0])
+    return float('inf')
+
+def simulate(
+        times: numpy.ndarray,
+        input_stokes: numpy.ndarray,
+        controller_class: type = pol_compensation.PolCompController,
+        target_azimuth: float = 0.0,
+        target_ellipticity: float = 0.0,
+        sample_period: float = 0.1,
+        noise: float = 0.0,
+        tolerance: float = 1.0,
+        hold: float = 2.0,
+        qwp_position: float = 0.0,
+        hwp_position: float = 0.0,
+        seed: int = 0,
+        measure_every: int = 1,
+        clock: SimulatedClock | None = None,
+        controller_kwargs: dict | None = None,
+        hwp_first: bool = pol_compensation.HWP_FIRST,
+        integrator: adaptive.AdaptiveIntegrator | None = None,
+        plate_offsets: tuple[float, float] = (0.0, 0.0),
+        retardance_errors: tuple[float, float] = (0.0, 0.0)
+) -> SimulationResult:
+    # the recorded polarisation enters the waveplates; the controller sees the
+    # plate output every measure_every samples of sample_period on a simulated
+    # clock, through the integrator if one is given, and is told it is on
+    # target with no stokes in between
+    rng = numpy.random.default_rng(seed=seed)
+    qwp = SimulatedMotor(serial_number=pol_compensation.QWP_SERIAL_NO, position=qwp_position)
+    hwp = SimulatedMotor(serial_number=pol_compensation.HWP_SERIAL_NO, position=hwp_position)
+    controller = controller_class(
+        motor_list=[qwp, hwp],
+        motor_qwp_serial_no=pol_compensation.QWP_SERIAL_NO,
+        motor_hwp_serial_no=pol_compensation.HWP_SERIAL_NO,
+        azimuth_velocities=pol_compensation.AZIMUTH_VELOCITIES,
+        ellipticity_velocities=pol_compensation.ELLIPTICITY_VELOCITIES,
+        **(controller_kwargs or {})
+    )
+    # the plant, with the qwp and hwp fast axes plate_offsets degrees off the
+    # motor zero and retardances retardance_errors degrees off a quarter and
+    # a half wave; model based controllers assume an ideal bench in the given
+    # order unless told otherwise in controller_kwargs
+    model = mueller.WaveplateModel(
+        qwp_offset=plate_offsets[0],
+        hwp_offset=plate_offsets[1],
+        hwp_first=hwp_first,
+        qwp_retardance=90.0 + retardance_errors[0],
+        hwp_retardance=180.0 + retardance_errors[1]
+    )
+
+    sample_times = numpy.arange(times[0], times[-1], sample_period)
+    drift = numpy.column_stack([
+        numpy.interp(sample_times, times, input_stokes[:, i]) for i in range(3)
+    ])
+    drift /= numpy.linalg.norm(drift, axis=1, keepdims=True)
+    drift = numpy.column_stack((numpy.ones(len(drift)), drift))
+    target = mueller.stokes(azimuth=target_azimuth, ellipticity=target_ellipticity)
+
+    errors = numpy.empty(len(sample_times))
+    measured_stokes = numpy.empty((len(sample_times), 3))
+    plate_positions = numpy.empty((len(sample_times), 2))
+    start = time.perf_counter()
+    for i in range(len(sample_times)):
+        if clock is not None:
+            clock.now = sample_times[i]
+        model.input_stokes = drift[i]
+        output = model.output(qwp_position=qwp.position, hwp_position=hwp.position)
+        output[1:4] += rng.normal(scale=noise, size=3)
+        azimuth, ellipticity = mueller.azimuth_ellipticity(output)
+        errors[i] = mueller.separation(output, target)
+        measured_stokes[i] = output[1:4] / numpy.linalg.norm(output[1:4])
+        plate_positions[i] = (qwp.position, hwp.position)
+
+        control_input = None
+        if i % measure_every == 0:
+            stokes = measured_stokes[i]
+            control_input = adaptive.control_input(
+                snapshot=types.SimpleNamespace(
+                    sequence=i + 1,
+                    azimuth=float(azimuth),
+                    ellipticity=float(ellipticity),
+                    normalised_s1=stokes[0],
+                    normalised_s2=stokes[1],
+                    normalised_s3=stokes[2]
+                ),
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                integrator=integrator,
+                moving=qwp.is_moving or hwp.is_moving
+            )
+        if control_input is not None:
+            current_azimuth, current_ellipticity, current_stokes = control_input
+            controller.update(
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                current_azimuth=current_azimuth,
+                current_ellipticity=current_ellipticity,
+                current_stokes=current_stokes
+            )
+        else:
+            controller.update(
+                target_azimuth=target_azimuth,
+                target_ellipticity=target_ellipticity,
+                current_azimuth=target_azimuth,
+                current_ellipticity=target_ellipticity
+            )
+        qwp.advance(seconds=sample_period)
+        hwp.advance(seconds=sample_period)
+    elapsed = time.perf_counter() - start
+
+    settle = settling_time(times=sample_times, errors=errors, tolerance=tolerance, hold=hold)
+    settled = errors[sample_times - sample_times[0] >= settle] if numpy.isfinite(settle) else errors
+    return SimulationResult(
+        times=sample_times,
+        errors=errors,
+        settling_time=settle,
+        residual_rms=float(numpy.sqrt(numpy.mean(settled ** 2))),
+        residual_p95=float(numpy.percentile(settled, 95)),
+        travel={'qwp': qwp.travel, 'hwp': hwp.travel},
+        n_commands={'qwp': qwp.n_commands, 'hwp': hwp.n_commands},
+        elapsed=elapsed,
+        measured_stokes=measured_stokes,
+        plate_positions=plate_positions
+    )
+
+if __name__ == '__main__':
+    # --qwp-first simulates a bench with the plates the other way round,
+    # with the model based controller told so; --mismatch gives the plant
+    # plate offsets and retardance errors the controllers are not told about
+    hwp_first = '--qwp-first' not in sys.argv[1:]
+    mismatch = '--mismatch' in sys.argv[1:]
+    root = pathlib.Path(__file__).resolve().parent.parent
+    paths = [a for a in sys.argv[1:] if not a.startswith('--')] or [
+        root / 'tests' / 'polarisation' / 'data' / 'sat_track.csv',
+        root / 'tests' / 'polarisation' / 'data' / '720.csv',
+        root / 'tests' / 'hogs' / 'data' / 'multiple_overpass-pol_control_after-h_north.csv'
+    ]
+    for path in paths:
+        times, input_stokes = read_polarimeter_csv(path=path)
+        for controller_class in (pol_compensation.PolCompController, pol_compensation.ModelController):
+            result = simulate(
+                times=times,
+                input_stokes=input_stokes,
+                controller_class=controller_class,
+                controller_kwargs=(
+                    dict(hwp_first=hwp_first)
+                    if controller_class is pol_compensation.ModelController else None
+                ),
+                hwp_first=hwp_first,
+                plate_offsets=(4.0, -3.0) if mismatch else (0.0, 0.0),
+                retardance_errors=(8.0, -10.0) if mismatch else (0.0, 0.0)
+            )
+            print(f'{pathlib.Path(path).name} {controller_class.__name__}: {result.summary()}')
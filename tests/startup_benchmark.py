@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+
+# time what the user waits on in a fresh interpreter: the pol comp gui module
+# import, the window appearing, and the real device widgets being built once
+# the devices are connected. needs the polarimeter and motor servers (or
+# POL_COMP_TIMETAGGER and a timetagger server) to be reachable
+pol_comp_path = os.path.abspath(os.path.join(
+    os.path.dirname(__file__),
+    os.path.pardir,
+    'polarisation_compensation'
+))
+
+def run_once() -> None:
+    start = time.perf_counter()
+    sys.path.insert(0, pol_comp_path)
+    import pol_comp_gui
+    from gi.repository import GLib
+    stages = {'import': time.perf_counter() - start}
+
+    def wait_for_widgets(app) -> bool:
+        win = app.win
+        if win.pol_comp_page is None and win.placeholder.get_title() != 'No devices found':
+            return GLib.SOURCE_CONTINUE
+        if win.pol_comp_page is None:
+            stages['error'] = win.placeholder.get_description()
+        else:
+            stages['widgets'] = time.perf_counter() - start
+        win.close()
+        return GLib.SOURCE_REMOVE
+
+    def on_activate(app) -> None:
+        # runs after the app's own handler has presented the window
+        stages['window'] = time.perf_counter() - start
+        GLib.timeout_add(5, wait_for_widgets, app)
+
+    app = pol_comp_gui.App(application_id='com.github.FarisRedza.PolarisationCompensation.Benchmark')
+    app.connect('activate', on_activate)
+    app.run([])
+    print(json.dumps(stages))
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--child']:
+        run_once()
+        sys.exit()
+
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    runs = []
+    for _ in range(n_runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child'],
+            cwd=pol_comp_path,
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=120
+        ).stdout
+        stages = json.loads(output.strip().splitlines()[-1])
+        if 'error' in stages:
+            sys.exit(f'Devices not connected: {stages["error"]}')
+        runs.append(stages)
+
+    for stage in ('import', 'window', 'widgets'):
+        median = statistics.median(run[stage] for run in runs)
+        print(f'{stage}: median {median:.3f} s over {n_runs} runs')
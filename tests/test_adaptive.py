@@ -0,0 +1,39 @@
+import math
+import types
+
+import numpy
+
+from polarisation_compensation import adaptive
+
+def samples_per_tick(integrator, degrees_per_sample, n=400):
+    # azimuth ramping at degrees_per_sample under 0.01 noise, the target
+    # following it so only the averaging decides
+    rng = numpy.random.default_rng(seed=0)
+    ticks = []
+    for sequence in range(n):
+        angle = math.radians(2 * degrees_per_sample * sequence)
+        stokes = numpy.array((math.cos(angle), math.sin(angle), 0.0)) + rng.normal(scale=0.01, size=3)
+        estimate = integrator.add(snapshot=types.SimpleNamespace(
+            sequence=sequence,
+            normalised_s1=stokes[0],
+            normalised_s2=stokes[1],
+            normalised_s3=stokes[2]
+        ))
+        if estimate is not None:
+            ticks.append(integrator.adapt(error=0.0, estimate=estimate))
+    return ticks
+
+def test_averaging_lengthens_only_while_the_signal_holds_still():
+    still = samples_per_tick(integrator=adaptive.AdaptiveIntegrator(), degrees_per_sample=0.0)
+    assert numpy.mean(still[-50:]) > 3.5
+    # a degree of azimuth a sample moves the stokes vector by about twice
+    # the 0.01 noise per sample
+    drifting = samples_per_tick(integrator=adaptive.AdaptiveIntegrator(), degrees_per_sample=1.0)
+    assert numpy.mean(drifting[-50:]) < 2.0
+
+def test_reset_forgets_the_previous_sample():
+    integrator = adaptive.AdaptiveIntegrator()
+    samples_per_tick(integrator=integrator, degrees_per_sample=0.0, n=10)
+    integrator.reset()
+    assert integrator._previous is None and not integrator._previous_still
+    assert integrator._previous_estimate is None and integrator.n_samples == integrator.min_samples
@@ -0,0 +1,89 @@
+import threading
+import time
+import types
+
+from polarisation_compensation import dispatcher
+
+class SlowMotor:
+    # fails if two requests are ever in flight at once, as they would be on a
+    # shared socket
+    def __init__(self, delay: float = 0.02) -> None:
+        self.device_info = types.SimpleNamespace(serial_number='slow')
+        self.delay = delay
+        self.sent = []
+        self._position = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _request(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            assert self._in_flight == 1, 'overlapping device requests'
+        time.sleep(self.delay)
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def is_moving(self) -> bool:
+        self._request()
+        return False
+
+    @property
+    def position(self) -> float:
+        self._request()
+        return self._position
+
+    def move_to(self, position: float) -> None:
+        self._request()
+        self.sent.append(('move_to', position))
+        self._position = position
+
+    def stop(self) -> None:
+        self._request()
+        self.sent.append(('stop',))
+
+def test_commands_waiting_behind_a_busy_motor_coalesce_to_the_latest():
+    motor = SlowMotor()
+    dispatched = dispatcher.DispatchedMotor(motor=motor)
+    dispatched.move_to(position=0.0)
+    while motor._in_flight == 0:
+        time.sleep(0.001)
+    for target in range(1, 10):
+        dispatched.move_to(position=float(target))
+    assert dispatched.wait_idle(timeout=2)
+    dispatched.close()
+
+    # the first goes out at once, the rest collapse into the newest
+    assert motor.sent == [('move_to', 0.0), ('move_to', 9.0)]
+    assert dispatched.n_coalesced == 8
+    assert motor._position == 9.0
+
+def test_position_reads_never_overlap_commands():
+    motor = SlowMotor(delay=0.002)
+    dispatched = dispatcher.DispatchedMotor(motor=motor, status_interval=0.001)
+    errors = []
+
+    def read_positions() -> None:
+        try:
+            for _ in range(50):
+                dispatched.position
+        except AssertionError as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=read_positions)
+    reader.start()
+    for target in range(50):
+        dispatched.move_to(position=float(target))
+        time.sleep(0.001)
+    reader.join()
+    assert dispatched.wait_idle(timeout=2)
+    dispatched.close()
+    assert errors == []
+
+def test_dispatch_reuses_one_wrapper_per_motor():
+    motor = SlowMotor()
+    cache = {}
+    first = dispatcher.dispatch(motor_list=[motor], cache=cache)
+    second = dispatcher.dispatch(motor_list=[motor], cache=cache)
+    assert first[0] is second[0]
+    first[0].close()
@@ -0,0 +1,30 @@
+import numpy
+
+from bb84 import histogram
+from bb84 import timetagger
+
+def test_pairs_across_chunk_boundaries_are_counted_once():
+    rng = numpy.random.default_rng(seed=0)
+    n = 20000
+    pairs = numpy.sort(rng.integers(0, 10**9, size=n))
+    timetags = numpy.concatenate((pairs, pairs + 1500 + rng.integers(-50, 50, size=n)))
+    channels = numpy.concatenate((
+        numpy.zeros(n, dtype=numpy.uint8),
+        numpy.ones(n, dtype=numpy.uint8)
+    ))
+    order = numpy.argsort(timetags, kind='stable')
+    timetags, channels = timetags[order], channels[order]
+
+    whole = histogram.TimeDifferenceHistogram(channel_a=0, channel_b=1, max_delay=5000, bin_width=100)
+    whole.update(raw_data=timetagger.RawData(timetags=timetags, channels=channels))
+    chunked = histogram.TimeDifferenceHistogram(channel_a=0, channel_b=1, max_delay=5000, bin_width=100)
+    # uneven chunks, some short enough that a tail spans more than one
+    for chunk in numpy.split(numpy.arange(2 * n), numpy.sort(rng.integers(1, 2 * n, size=300))):
+        chunked.update(raw_data=timetagger.RawData(
+            timetags=timetags[chunk],
+            channels=channels[chunk]
+        ))
+
+    assert numpy.array_equal(chunked.counts, whole.counts)
+    assert chunked.counts.sum() >= n
+    assert abs(chunked.peak() - 1500) <= 100
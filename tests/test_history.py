@@ -0,0 +1,28 @@
+import numpy
+
+from bb84 import history
+
+def test_query_ends_with_the_latest_samples():
+    # enough samples to wrap the finest levels and leave partial buckets
+    buffer = history.MinMaxHistory(n_values=1, capacity=16, factor=4, levels=4)
+    n_samples = 1003
+    for i in range(n_samples):
+        buffer.append(time=float(i), values=(float(i),))
+
+    times, mins, maxs = buffer.query(max_points=64)
+    assert len(times) <= 64 + 3 * (buffer.factor - 1)
+    assert numpy.all(numpy.diff(times) > 0)
+    # the tail carries the samples not yet merged into the coarse level, so
+    # the newest one is always drawn
+    assert times[-1] == n_samples - 1
+    assert maxs[-1, 0] == n_samples - 1
+    assert numpy.all(mins[:, 0] <= maxs[:, 0])
+
+def test_query_from_a_start_time():
+    buffer = history.MinMaxHistory(n_values=1, capacity=16, factor=4, levels=4)
+    for i in range(200):
+        buffer.append(time=float(i), values=(float(i),))
+    times, mins, maxs = buffer.query(max_points=64, start_time=150.0)
+    # the first bucket is the one holding the start time
+    assert times[0] <= 150.0 <= maxs[0, 0]
+    assert maxs[-1, 0] == 199.0
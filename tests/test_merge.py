@@ -0,0 +1,51 @@
+import numpy
+
+from bb84 import merge
+from bb84 import timetagger
+
+def _raw_data(timetags: numpy.ndarray) -> timetagger.RawData:
+    return timetagger.RawData(
+        timetags=numpy.asarray(timetags, dtype=numpy.int64),
+        channels=numpy.zeros(len(timetags), dtype=numpy.uint8)
+    )
+
+def test_output_stays_monotonic_while_drift_is_corrected():
+    rng = numpy.random.default_rng(seed=0)
+    pairs = numpy.sort(rng.integers(0, 10**10, size=20000))
+    uqd_ticks = (pairs * 4) // 625
+    # a fixed delay plus a slow drift on the second clock
+    qutag_ticks = ((pairs + 3000 + pairs // 10**5) * 8) // 625
+
+    merger = merge.StreamMerger(
+        streams=[
+            merge.StreamConfig(timebase=merge.UQD_TIMEBASE, channel_map={0: 4}),
+            merge.StreamConfig(timebase=merge.QUTAG_TIMEBASE, channel_map={0: 0}),
+        ],
+        reference_channel=4,
+        drift_channels={1: 0},
+        max_delay=200_000,
+        bin_width=200
+    )
+    outputs = []
+    for chunk in numpy.array_split(numpy.arange(len(pairs)), 20):
+        merger.push(stream=0, raw_data=_raw_data(timetags=uqd_ticks[chunk]))
+        merger.push(stream=1, raw_data=_raw_data(timetags=qutag_ticks[chunk]))
+        outputs.append(merger.pop().timetags)
+    outputs.append(merger.flush().timetags)
+
+    timetags = numpy.concatenate(outputs)
+    assert len(timetags) == 2 * len(pairs)
+    assert numpy.all(numpy.diff(timetags) >= 0)
+    # the drift model follows the delay to within a few histogram bins
+    for time in (1e9, 5e9, 9e9):
+        assert abs(merger.drift[1].predict(time) - (3000 + time / 10**5)) < 1000
+
+def test_idle_stream_advances_by_heartbeat():
+    merger = merge.StreamMerger(streams=[merge.StreamConfig(), merge.StreamConfig()])
+    merger.heartbeat(stream=1, until=-1)
+    for i in range(5):
+        merger.push(stream=0, raw_data=_raw_data(timetags=numpy.arange(i * 100, (i + 1) * 100)))
+        # nothing comes out while the idle stream has not reported this far
+        assert len(merger.pop().timetags) == 0
+        merger.heartbeat(stream=1, until=(i + 1) * 100 - 1)
+        assert numpy.array_equal(merger.pop().timetags, numpy.arange(i * 100, (i + 1) * 100))
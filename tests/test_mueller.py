@@ -0,0 +1,63 @@
+import numpy
+import pytest
+
+from polarisation_compensation import mueller
+
+@pytest.mark.parametrize('hwp_first', [True, False])
+def test_solve_round_trips_reachable_targets(hwp_first):
+    # two plates do not reach every output from every input, so each target
+    # is made by the plates at random positions and solve must find a way back
+    rng = numpy.random.default_rng(seed=0)
+    model = mueller.WaveplateModel(hwp_first=hwp_first)
+    for azimuth, ellipticity, qwp_position, hwp_position in rng.uniform(
+            low=(-90, -45, 0, 0),
+            high=(90, 45, mueller.QWP_PERIOD, mueller.HWP_PERIOD),
+            size=(20, 4)
+    ):
+        model.input_stokes = mueller.stokes(azimuth=azimuth, ellipticity=ellipticity)
+        target = model.output(qwp_position=qwp_position, hwp_position=hwp_position)
+        qwp, hwp, residual = model.solve(target_stokes=target)
+        assert 0 <= qwp < mueller.QWP_PERIOD and 0 <= hwp < mueller.HWP_PERIOD
+        assert residual < 1e-2
+        assert mueller.separation(model.output(qwp_position=qwp, hwp_position=hwp), target) < 0.5
+
+def test_fit_recovers_the_input_and_solve_round_trips():
+    model = mueller.WaveplateModel()
+    input_stokes = mueller.stokes(azimuth=23.0, ellipticity=-11.0)
+    model.input_stokes = input_stokes
+    measured = model.output(qwp_position=37.0, hwp_position=12.0)
+
+    fitted = mueller.WaveplateModel()
+    fitted.fit(measured_stokes=measured[1:4], qwp_position=37.0, hwp_position=12.0)
+    assert numpy.allclose(fitted.input_stokes, input_stokes)
+
+    target = mueller.stokes(azimuth=0.0, ellipticity=0.0)
+    qwp, hwp, _ = fitted.solve(target_stokes=target)
+    assert mueller.separation(model.output(qwp_position=qwp, hwp_position=hwp), target) < 0.5
+
+def test_lut_prefers_the_solution_nearest_the_plates():
+    lut = mueller.waveplate_lut()
+    input_stokes = mueller.stokes(azimuth=23.0, ellipticity=-11.0)
+    target = mueller.stokes(azimuth=0.0, ellipticity=0.0)
+    best_qwp, best_hwp, best = lut.query(input_stokes=input_stokes, target_stokes=target)
+
+    # starting from near another branch, the answer still hits the target but
+    # needs less travel than the global best
+    near = ((best_qwp + 90.0) % mueller.QWP_PERIOD, (best_hwp + 45.0) % mueller.HWP_PERIOD)
+    qwp, hwp, distance = lut.query(input_stokes=input_stokes, target_stokes=target, near=near)
+    assert distance <= best + 0.02
+
+    def travel(qwp: float, hwp: float) -> float:
+        return (
+            abs(mueller.nearest_equivalent(angle=qwp, current=near[0], period=mueller.QWP_PERIOD) - near[0])
+            + abs(mueller.nearest_equivalent(angle=hwp, current=near[1], period=mueller.HWP_PERIOD) - near[1])
+        )
+    assert travel(qwp, hwp) <= travel(best_qwp, best_hwp)
+
+def test_nearest_equivalent_stays_within_half_a_period():
+    angles = numpy.linspace(-400, 400, 81)
+    for period in (mueller.QWP_PERIOD, mueller.HWP_PERIOD):
+        moved = mueller.nearest_equivalent(angle=angles, current=10.0, period=period)
+        assert numpy.all(numpy.abs(moved - 10.0) <= period / 2)
+        # a whole number of periods from the original angle
+        assert numpy.allclose(numpy.cos(2 * numpy.pi * (moved - angles) / period), 1)
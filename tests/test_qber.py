@@ -0,0 +1,19 @@
+import numpy
+
+from bb84 import qber
+
+def test_clopper_pearson_matches_known_values():
+    # k errors out of n at 95%; the edge cases have closed forms and 5 of 10
+    # is the textbook example
+    lower, upper = qber.clopper_pearson_interval(
+        errors=numpy.array([0, 10, 1, 5]),
+        totals=numpy.array([10, 10, 10, 10])
+    )
+    expected_lower = [0.0, 0.025 ** (1 / 10), 1 - 0.975 ** (1 / 10), 0.187086]
+    expected_upper = [1 - 0.025 ** (1 / 10), 1.0, 0.445016, 0.812914]
+    assert numpy.allclose(lower, expected_lower, atol=1e-5)
+    assert numpy.allclose(upper, expected_upper, atol=1e-5)
+
+def test_clopper_pearson_with_no_counts_is_uninformative():
+    lower, upper = qber.clopper_pearson_interval(errors=numpy.array([0]), totals=numpy.array([0]))
+    assert lower[0] == 0.0 and upper[0] == 1.0
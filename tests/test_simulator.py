@@ -0,0 +1,51 @@
+import pathlib
+
+import pytest
+
+from polarisation_compensation import pol_compensation
+from polarisation_compensation import simulator
+
+SAT_TRACK = pathlib.Path(__file__).resolve().parent / 'polarisation' / 'data' / 'sat_track.csv'
+
+def test_move_to_lands_on_the_target():
+    # 25°/s at 20°/s^2: 1.25 s and 15.625° each up to speed and back down,
+    # with 1.25 s cruising in between, so 3.75 s over 62.5°
+    motor = simulator.SimulatedMotor(serial_number='qwp')
+    motor.move_to(position=62.5)
+    for _ in range(37):
+        motor.advance(seconds=0.1)
+    assert motor.is_moving
+    motor.advance(seconds=0.1)
+    assert not motor.is_moving
+    assert motor.position == 62.5 and motor.velocity == 0.0
+    assert motor.travel == pytest.approx(62.5)
+
+def test_move_to_reverses_onto_a_target_behind():
+    motor = simulator.SimulatedMotor(serial_number='qwp')
+    motor.move_to(position=10.0)
+    for _ in range(8):
+        motor.advance(seconds=0.1)
+    motor.move_to(position=5.0)
+    for _ in range(20):
+        motor.advance(seconds=0.1)
+    assert motor.position == 5.0 and not motor.is_moving
+
+@pytest.mark.parametrize('mismatch', [False, True])
+def test_model_controller_tracks_the_recorded_drift(mismatch):
+    # the plant's plates off by a few degrees in angle and retardance, which
+    # the controllers are not told about, should cost the model little
+    times, input_stokes = simulator.read_polarimeter_csv(path=SAT_TRACK)
+    kwargs = dict(
+        times=times,
+        input_stokes=input_stokes,
+        noise=0.01,
+        plate_offsets=(4.0, -3.0) if mismatch else (0.0, 0.0),
+        retardance_errors=(8.0, -10.0) if mismatch else (0.0, 0.0)
+    )
+    jog = simulator.simulate(controller_class=pol_compensation.PolCompController, **kwargs)
+    model = simulator.simulate(controller_class=pol_compensation.ModelController, **kwargs)
+    assert model.settling_time < 90.0
+    assert model.residual_rms < 3.0
+    assert model.residual_rms < jog.residual_rms
+    # one command per sample would be len(model.times)
+    assert sum(model.n_commands.values()) < 300 < len(model.times)
@@ -7,6 +7,7 @@ import bb84.uqd as uqd
 import bb84.qutag as qutag
 # import bb84.remote_timetagger as remote_timetagger
 import bb84.timetagger as timetagger
+import bb84.qber as qber
 
 import tomtag as tomt
 import numpy as np
@@ -67,16 +68,16 @@ def get_qber(channels, timetags, delay=0, tcc=15):
     VH = tomt.count_twofolds(tags_V_1550, tags_H_780, len(tags_V_1550), len(tags_H_780),tcc)
     VV = tomt.count_twofolds(tags_V_1550, tags_V_780, len(tags_V_1550), len(tags_V_780),tcc)
 
-    qber =  (VH + VH) / (HH + HV + VH + VV)
+    z_estimate = qber.qber(coincidences=np.array([HH, HV, VH, VV]))
 
     DD = tomt.count_twofolds(tags_D_1550, tags_D_780, len(tags_D_1550), len(tags_D_780),tcc)
     DA = tomt.count_twofolds(tags_D_1550, tags_A_780, len(tags_D_1550), len(tags_A_780),tcc)
     AD = tomt.count_twofolds(tags_A_1550, tags_D_780, len(tags_A_1550), len(tags_D_780),tcc)
-    AA = tomt.count_twofolds(tags_A_1550, tags_V_780, len(tags_A_1550), len(tags_A_780),tcc)
+    AA = tomt.count_twofolds(tags_A_1550, tags_A_780, len(tags_A_1550), len(tags_A_780),tcc)
 
-    qx =  (DA + AD) / (DD + AD + DA + AA)
+    x_estimate = qber.qx(coincidences=np.array([DD, DA, AD, AA]))
 
-    return qber, qx, HH+HV+VH+VV
+    return float(z_estimate.value), float(x_estimate.value), HH+HV+VH+VV
 
 if __name__ == '__main__':
     tag_device_780 = uqd.UQD()